@@ -0,0 +1,184 @@
+"""
+Synthetic site generator for benchmarking the site tools
+Builds a throwaway Jekyll site with the real layouts, includes, config and
+top-level pages plus N generated posts, whose size and mix of code blocks,
+tables, images and includes are configurable. Output is deterministic for a
+given seed, so runs against different commits render the same input
+
+Usage: python generate_site.py OUTPUT_DIR [--posts N] [--paragraphs N] [--code-blocks N]
+                               [--tables N] [--images N] [--includes N] [--seed N]
+"""
+
+import argparse
+import random
+import shutil
+import struct
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SITE_ROOT = Path(__file__).resolve().parent.parent.parent
+
+# Copied from the real site so layouts, includes and Liquid are exercised as they are in production
+SITE_FILES = ['_config.yml', 'index.md', '404.md', 'blog/index.md']
+SITE_DIRS = ['_layouts', '_includes', 'assets/css']
+
+WORDS = (
+    'model data layer token attention vector gradient loss batch cache index query render template '
+    'layout graph node edge weight bias kernel thread process queue stream buffer parser schema route '
+    'latency throughput signal feature sample metric training inference pipeline module service state'
+).split()
+
+LANGUAGES = ['python', 'lua', 'javascript', 'bash', 'sql']
+
+INCLUDES = {
+    'bench-note.html': '<aside class="note note-{{ include.kind }}">{{ include.text }}</aside>\n',
+    'bench-figure.html': (
+        '<figure>\n  <img src="{{ include.src | relative_url }}" alt="{{ include.alt }}">\n'
+        '  {% if include.caption %}<figcaption>{{ include.caption }}</figcaption>{% endif %}\n</figure>\n'
+    ),
+}
+
+IMAGE_COUNT = 16  # Distinct image files shared by all posts
+
+
+def sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def paragraph(rng):
+    text = ' '.join(sentence(rng, rng.randint(8, 18)) for _ in range(rng.randint(3, 6)))
+    # A little inline Markdown in most paragraphs
+    words = text.split(' ')
+    for _ in range(2):
+        i = rng.randrange(len(words))
+        words[i] = rng.choice(['**{}**', '*{}*', '`{}`', '[{}](https://example.com/{})']).format(words[i], words[i])
+    return ' '.join(words)
+
+
+def code_block(rng):
+    language = rng.choice(LANGUAGES)
+    lines = [f'{rng.choice(WORDS)}_{i} = {rng.choice(WORDS)}({rng.randint(0, 99)})' for i in range(rng.randint(5, 20))]
+    return f'```{language}\n' + '\n'.join(lines) + '\n```'
+
+
+def table(rng):
+    columns = rng.randint(3, 5)
+    header = [rng.choice(WORDS).title() for _ in range(columns)]
+    rows = ['| ' + ' | '.join(header) + ' |', '|' + '---|' * columns]
+    for _ in range(rng.randint(3, 8)):
+        rows.append('| ' + ' | '.join(str(rng.randint(0, 999)) for _ in range(columns)) + ' |')
+    return '\n'.join(rows)
+
+
+def image(rng):
+    n = rng.randrange(IMAGE_COUNT)
+    return f'![{rng.choice(WORDS)} figure](/assets/images/bench/figure-{n}.png)'
+
+
+def include(rng):
+    if rng.random() < 0.5:
+        return f'{{% include bench-note.html kind="tip" text="{sentence(rng, 8)}" %}}'
+    n = rng.randrange(IMAGE_COUNT)
+    return f'{{% include bench-figure.html src="/assets/images/bench/figure-{n}.png" alt="Figure {n}" caption="{sentence(rng, 6)}" %}}'
+
+
+def post_body(rng, paragraphs, code_blocks, tables, images, includes):
+    """Markdown body: an overview paragraph and excerpt marker, then sections mixing all block kinds"""
+    extras = (
+        [code_block(rng) for _ in range(code_blocks)] +
+        [table(rng) for _ in range(tables)] +
+        [image(rng) for _ in range(images)] +
+        [include(rng) for _ in range(includes)]
+    )
+    blocks = ['## Overview', paragraph(rng), '<!--more-->']
+    body = [paragraph(rng) for _ in range(max(0, paragraphs - 1))] + extras
+    rng.shuffle(body)
+
+    sections = max(1, len(body) // 4)
+    for i, block in enumerate(body):
+        if i % 4 == 0 and i // 4 < sections:
+            blocks.append(f'## {i // 4 + 1}. {sentence(rng, 4)[:-1]}')
+        blocks.append(block)
+    return '\n\n'.join(blocks) + '\n'
+
+
+def png(width, height, rgb):
+    """Smallest valid PNG of a solid colour"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    raw = b''.join(b'\x00' + bytes(rgb) * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def generate_site(output_dir, posts=100, paragraphs=8, code_blocks=2, tables=1, images=1, includes=1, seed=0):
+    """Write a synthetic site to output_dir (replacing it) and return its path"""
+    output_dir = Path(output_dir)
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True)
+    rng = random.Random(seed)
+
+    for name in SITE_FILES:
+        source = SITE_ROOT / name
+        if source.exists():
+            (output_dir / name).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source, output_dir / name)
+    for name in SITE_DIRS:
+        if (SITE_ROOT / name).exists():
+            shutil.copytree(SITE_ROOT / name, output_dir / name)
+
+    includes_dir = output_dir / '_includes'
+    includes_dir.mkdir(exist_ok=True)
+    for name, source in INCLUDES.items():
+        (includes_dir / name).write_text(source, encoding='utf-8')
+
+    images_dir = output_dir / 'assets' / 'images' / 'bench'
+    images_dir.mkdir(parents=True)
+    for n in range(IMAGE_COUNT):
+        (images_dir / f'figure-{n}.png').write_bytes(png(64, 48, (n * 15, 120, 255 - n * 15)))
+
+    posts_dir = output_dir / '_posts'
+    posts_dir.mkdir()
+    (output_dir / '_drafts').mkdir()
+    start = datetime(2020, 1, 1, 9, 0, 0)
+    for i in range(posts):
+        date = start + timedelta(days=i)
+        title = sentence(rng, rng.randint(4, 8))[:-1]
+        slug = '-'.join(title.lower().split()[:6]) + f'-{i}'
+        tags = sorted(set(rng.sample(WORDS, 3)))
+        front_matter = (
+            '---\nlayout: post\n'
+            f'title: "{title}"\n'
+            f'date: {date:%Y-%m-%d %H:%M:%S}\n'
+            f'tags: [{", ".join(tags)}]\n'
+            '---\n'
+        )
+        body = post_body(rng, paragraphs, code_blocks, tables, images, includes)
+        (posts_dir / f'{date:%Y-%m-%d}-{slug}.md').write_text(front_matter + body, encoding='utf-8')
+
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Jekyll site for benchmarks')
+    parser.add_argument('output', help='Directory to write the site to (replaced if it exists)')
+    parser.add_argument('--posts', type=int, default=100, help='Number of posts (default: 100)')
+    parser.add_argument('--paragraphs', type=int, default=8, help='Paragraphs per post (default: 8)')
+    parser.add_argument('--code-blocks', type=int, default=2, help='Fenced code blocks per post (default: 2)')
+    parser.add_argument('--tables', type=int, default=1, help='Tables per post (default: 1)')
+    parser.add_argument('--images', type=int, default=1, help='Markdown images per post (default: 1)')
+    parser.add_argument('--includes', type=int, default=1, help='Liquid includes per post (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    output = generate_site(args.output, posts=args.posts, paragraphs=args.paragraphs, code_blocks=args.code_blocks,
+                           tables=args.tables, images=args.images, includes=args.includes, seed=args.seed)
+    print(f"Generated {args.posts} posts in {output}")
+
+
+if __name__ == '__main__':
+    main()
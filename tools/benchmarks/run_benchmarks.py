@@ -0,0 +1,284 @@
+"""
+Benchmark suite for the site tools
+Generates synthetic sites of increasing size and, for each, times the
+website_tester stages (load_posts, render_markdown, process_liquid) and
+end-to-end route latency for both Flask apps through their test clients.
+Each tool runs in a fresh process pointed at the generated site via
+JEKYLL_SITE_ROOT, so module-level caches start cold. Results are JSON, so
+runs on different commits can be diffed with --compare
+
+Usage: python run_benchmarks.py [--sizes 10,100,1000] [--output FILE] [--compare OLD.json]
+                                [--iterations N] [--budget SECONDS] [post shape options]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from generate_site import generate_site
+
+TOOLS_DIR = Path(__file__).resolve().parent.parent
+TOOLS = ['website_tester', 'blog_editor']
+
+
+def measure(fn, iterations=20, budget=2.0, setup=None):
+    """Time fn() up to `iterations` times (stopping early after `budget` seconds); returns stats in ms
+
+    setup() runs before each call and is not timed.
+    """
+    timings = []
+    deadline = time.perf_counter() + budget
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+        if time.perf_counter() > deadline:
+            break
+    return summarize(timings)
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered), 3),
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'min_ms': round(ordered[0], 3),
+    }
+
+
+def once(fn):
+    started = time.perf_counter()
+    fn()
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def get(client, url, expected=(200, 404)):
+    response = client.get(url)
+    if response.status_code not in expected:
+        raise RuntimeError(f'{url} returned {response.status_code}')
+    return response
+
+
+# --- Workers (run inside a process whose JEKYLL_SITE_ROOT is the generated site) ---
+
+def bench_website_tester(iterations, budget):
+    import app as site
+    import markdown_render
+
+    results = {'stages': {}, 'routes': {}}
+    stages = results['stages']
+
+    stages['load_posts'] = {'cold_ms': once(site.load_posts), **measure(site.load_posts, iterations, budget)}
+
+    posts = site.load_posts()
+    bodies = [post['content'] for post in posts]
+    renderer = markdown_render.renderer
+
+    def render_all(render):
+        for body in bodies:
+            render(body)
+
+    stages['render_markdown_all_posts'] = measure(lambda: render_all(renderer.convert), iterations, budget)
+    render_all(site.render_markdown)
+    stages['render_markdown_all_posts_memo'] = measure(lambda: render_all(site.render_markdown), iterations, budget)
+
+    # Liquid: the blog index loops over every post; the default layout wraps one page
+    blog_index = site.env.get_template(site.SITE_ROOT / 'blog' / 'index.md')
+    default_layout = site.load_layout('default')
+    content = site.render_markdown(bodies[0]) if bodies else '<p></p>'
+    stages['process_liquid_blog_index'] = measure(
+        lambda: site.process_liquid(blog_index, dict(blog_index.front_matter)), iterations, budget)
+    stages['process_liquid_default_layout'] = measure(
+        lambda: site.process_liquid(default_layout, {'title': 'Bench'}, content=content,
+                                    layout=default_layout.front_matter), iterations, budget)
+
+    client = site.app.test_client()
+    routes = {'index': '/', 'blog': '/blog/', 'not_found': '/no-such-page/'}
+    if posts:
+        routes['post_newest'] = posts[0]['url']
+        routes['post_oldest'] = posts[-1]['url']
+    routes['asset'] = '/assets/css/custom.css'
+
+    for name, url in routes.items():
+        site.render_cache.invalidate()
+        markdown_render.renderer.clear()
+        results['routes'][name] = {
+            'url': url,
+            'cold_ms': once(lambda: get(client, url)),
+            # Full render on every request: page cache and Markdown memo cleared first
+            'uncached': measure(lambda: get(client, url), iterations, budget,
+                                setup=lambda: (site.render_cache.invalidate(), markdown_render.renderer.clear())),
+            'cached': measure(lambda: get(client, url), iterations, budget),
+        }
+
+    results['posts'] = len(posts)
+    return results
+
+
+def bench_blog_editor(iterations, budget):
+    import app as editor
+    import markdown_render
+
+    results = {'routes': {}}
+    routes = results['routes']
+    client = editor.app.test_client()
+
+    filenames = sorted(os.listdir(editor.POSTS_DIR))
+    routes['posts'] = {'cold_ms': once(lambda: get(client, '/posts')),
+                       'warm': measure(lambda: get(client, '/posts'), iterations, budget)}
+    if not filenames:
+        return results
+
+    largest = max(filenames, key=lambda name: os.path.getsize(os.path.join(editor.POSTS_DIR, name)))
+    routes['load'] = measure(lambda: get(client, f'/load/{largest}', (200,)), iterations, budget)
+
+    with open(os.path.join(editor.POSTS_DIR, largest), 'r', encoding='utf-8') as f:
+        content = f.read().split('---', 2)[2]
+
+    def preview(payload):
+        response = client.post('/preview', json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f'/preview returned {response.status_code}')
+        return response.get_json()
+
+    routes['preview_full_cold'] = measure(lambda: preview({'content': content}), iterations, budget,
+                                          setup=markdown_render.renderer.clear)
+    routes['preview_full_warm'] = measure(lambda: preview({'content': content}), iterations, budget)
+
+    # A keystroke: one changed block, the client already holds the rest
+    known = [block['id'] for block in preview({'content': content, 'known': []})['blocks']]
+    edits = iter(range(10 ** 9))
+    routes['preview_keystroke'] = measure(
+        lambda: preview({'content': content + 'x' * next(edits), 'known': known}), iterations, budget)
+    return results
+
+
+def run_worker(tool, iterations, budget):
+    sys.path.insert(0, str(TOOLS_DIR / tool))
+    os.chdir(TOOLS_DIR / tool)
+    bench = bench_website_tester if tool == 'website_tester' else bench_blog_editor
+    json.dump(bench(iterations, budget), sys.stdout)
+
+
+# --- Driver ---
+
+def run_tool(tool, site_dir, iterations, budget):
+    """Benchmark one tool against a generated site in a fresh interpreter"""
+    env = dict(os.environ, JEKYLL_SITE_ROOT=str(site_dir))
+    command = [sys.executable, str(Path(__file__).resolve()), '--worker', tool,
+               '--iterations', str(iterations), '--budget', str(budget)]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{tool} benchmark failed:\n{completed.stderr}')
+    # Apps may print banners or warnings; the JSON result is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=TOOLS_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(results, prefix=''):
+    """Flatten nested results to {'a.b.mean_ms': value} for comparison"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif key in ('mean_ms', 'cold_ms'):
+            flat[name] = value
+    return flat
+
+
+def compare(old, new):
+    """Print mean/cold timings side by side with the ratio new/old"""
+    before = flatten(old['results'])
+    after = flatten(new['results'])
+    print(f"{'metric':<72} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for name in sorted(before.keys() & after.keys()):
+        if before[name]:
+            print(f"{name:<72} {before[name]:>10.3f} {after[name]:>10.3f} {after[name] / before[name]:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the site tools against synthetic sites')
+    parser.add_argument('--sizes', default='10,100,1000', help='Comma separated post counts (default: 10,100,1000)')
+    parser.add_argument('--tools', default=','.join(TOOLS), help='Tools to benchmark (default: both)')
+    parser.add_argument('--iterations', type=int, default=20, help='Max timed runs per measurement (default: 20)')
+    parser.add_argument('--budget', type=float, default=2.0, help='Seconds per measurement before stopping early (default: 2)')
+    parser.add_argument('--paragraphs', type=int, default=8, help='Paragraphs per post (default: 8)')
+    parser.add_argument('--code-blocks', type=int, default=2, help='Fenced code blocks per post (default: 2)')
+    parser.add_argument('--tables', type=int, default=1, help='Tables per post (default: 1)')
+    parser.add_argument('--images', type=int, default=1, help='Markdown images per post (default: 1)')
+    parser.add_argument('--includes', type=int, default=1, help='Liquid includes per post (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated sites (default: 0)')
+    parser.add_argument('--output', '-o', help='Write the JSON results here (default: stdout)')
+    parser.add_argument('--compare', help='Previous results JSON to compare against')
+    parser.add_argument('--worker', choices=TOOLS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.iterations, args.budget)
+        return
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    tools = [tool for tool in args.tools.split(',') if tool]
+    shape = {'paragraphs': args.paragraphs, 'code_blocks': args.code_blocks, 'tables': args.tables,
+             'images': args.images, 'includes': args.includes, 'seed': args.seed}
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'iterations': args.iterations,
+            'budget': args.budget,
+            'shape': shape,
+        },
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='site-bench-') as temp:
+        for size in sizes:
+            site_dir = generate_site(Path(temp) / f'site-{size}', posts=size, **shape)
+            report['results'][str(size)] = {}
+            for tool in tools:
+                print(f"Benchmarking {tool} with {size} posts...", file=sys.stderr)
+                report['results'][str(size)][tool] = run_tool(tool, site_dir, args.iterations, args.budget)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
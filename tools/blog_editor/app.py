@@ -2,22 +2,37 @@
 Blog Editor - A local Flask app for writing Jekyll blog posts
 """
 
+import atexit
+import hashlib
 import os
-import re
+import sys
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory
 from slugify import slugify
 from werkzeug.utils import secure_filename
-import markdown
+
+# Shared modules (Markdown rendering) live in tools/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+
+import highlight
+from autosave import AutosaveError, AutosaveStore
+from block_preview import BlockRenderer
+from catalogue import SORT_COLUMNS, PostCatalogue, parse_post
+from image_variants import ImagePipeline, default_filename, read_dimensions
+from preview_channel import PreviewChannel, PreviewError
+from search_index import SearchIndex
+from uploads import SESSION_CHUNK_SIZE, UploadError, UploadStore
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 
-# Paths relative to the Jekyll site (tools/blog_editor -> site root)
-SITE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Paths relative to the Jekyll site (tools/blog_editor -> site root); JEKYLL_SITE_ROOT points the tool at another site
+SITE_ROOT = os.environ.get('JEKYLL_SITE_ROOT') or os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 POSTS_DIR = os.path.join(SITE_ROOT, '_posts')
 DRAFTS_DIR = os.path.join(SITE_ROOT, '_drafts')
 IMAGES_DIR = os.path.join(SITE_ROOT, 'assets', 'images', 'blog')
+IMAGES_URL = '/assets/images/blog'
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
 
 # Ensure directories exist
 os.makedirs(POSTS_DIR, exist_ok=True)
@@ -26,6 +41,31 @@ os.makedirs(IMAGES_DIR, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg'}
 
+# Preview renders block by block with the same Markdown setup as the site preview,
+# re-rendering only blocks whose text changed
+preview_renderer = BlockRenderer()
+
+# Live preview over one event stream per tab: edits arrive as numbered deltas
+# and only the newest text is rendered
+preview_channel = PreviewChannel(preview_renderer)
+
+# Title/date/tags/word count of every post and draft, refreshed by mtime on each listing
+catalogue = PostCatalogue(os.path.join(CACHE_DIR, 'catalogue.sqlite3'), {'published': POSTS_DIR, 'draft': DRAFTS_DIR})
+
+# Full-text index of the same files, updated from the catalogue's change detection
+search_index = SearchIndex(os.path.join(
+    CACHE_DIR, f"search-editor-{hashlib.sha1(os.path.abspath(SITE_ROOT).encode()).hexdigest()[:10]}.idx"))
+
+# Autosaves are journaled as deltas and compacted into the post files now and then
+autosave_store = AutosaveStore(os.path.join(
+    CACHE_DIR, f"autosave-{hashlib.sha1(os.path.abspath(SITE_ROOT).encode()).hexdigest()[:10]}"))
+atexit.register(autosave_store.compact_all)
+
+# Uploads are stored by content hash (identical files are kept once);
+# resized/WebP variants are produced in the background
+upload_store = UploadStore(IMAGES_DIR, app.config['MAX_CONTENT_LENGTH'])
+image_pipeline = ImagePipeline(IMAGES_DIR, IMAGES_URL)
+
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -39,72 +79,208 @@ def editor():
 
 @app.route('/preview', methods=['POST'])
 def preview():
-    """Convert markdown to HTML for preview"""
+    """Convert markdown to HTML for preview
+
+    Clients that send `known` (the fragment ids they already display) get back
+    the ordered fragment list, with HTML only for fragments they don't have.
+    """
     content = request.json.get('content', '')
-    html = markdown.markdown(
-        content,
-        extensions=['fenced_code', 'tables', 'toc', 'nl2br']
-    )
-    return jsonify({'html': html})
+    known = request.json.get('known')
+    fragments = preview_renderer.render_blocks(content)
+
+    if known is None:
+        return jsonify({'html': '\n'.join(html for _, html in fragments)})
+
+    known = set(known)
+    return jsonify({
+        'blocks': [
+            {'id': fragment_id} if fragment_id in known else {'id': fragment_id, 'html': html}
+            for fragment_id, html in fragments
+        ]
+    })
+
+
+@app.route('/highlight.css')
+def highlight_css():
+    """Stylesheet for highlighted code in the preview (dark, like the editor; generated once)"""
+    path = highlight.stylesheet(light=None, dark_scope='')
+    if path is None:
+        return Response('', mimetype='text/css')
+    return send_from_directory(os.path.dirname(path), os.path.basename(path), mimetype='text/css')
+
+
+@app.route('/preview/stream')
+def preview_stream():
+    """Server-Sent Events stream of preview updates for one editor tab: /preview/stream?session=..."""
+    session = request.args.get('session', '')
+    if not session:
+        return jsonify({'error': 'Session is required'}), 400
+    return Response(preview_channel.stream(session), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/preview/edit', methods=['POST'])
+def preview_edit():
+    """Apply an edit to a preview session: {session, seq, base, changes: [{from, to, text}], length} or {session, seq, content}
+
+    Answers 409 with the server's seq when the delta doesn't apply (the client
+    resends the whole content) and 404 when the session is gone (the client reconnects).
+    """
+    data = request.json
+    try:
+        seq = preview_channel.edit(data.get('session'), data.get('seq'), data.get('base'), data.get('changes'),
+                                   data.get('length'), data.get('content'))
+    except PreviewError as e:
+        return jsonify(dict(e.details, error=str(e))), e.status
+    except (KeyError, TypeError):
+        return jsonify({'error': 'Malformed changes'}), 400
+    return jsonify({'success': True, 'seq': seq})
+
+
+def post_path(filename):
+    """(path, is_draft) of an existing post or draft, or (None, None)"""
+    if not filename or os.path.basename(filename) != filename or not filename.endswith('.md'):
+        return None, None
+    for directory, is_draft in ((POSTS_DIR, False), (DRAFTS_DIR, True)):
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path):
+            return path, is_draft
+    return None, None
+
+
+def open_draft(filepath):
+    """(draft, warning) for a post; a journal that can't be replayed is set aside and the file opened as it is"""
+    try:
+        return autosave_store.open(filepath), None
+    except AutosaveError as e:
+        aside = autosave_store.set_aside(filepath)
+        kept = f'; the journal was kept as {os.path.basename(aside)}' if aside else ''
+        return autosave_store.open(filepath), f'Unsaved changes could not be restored ({e}){kept}'
+
+
+def new_filename(title):
+    """Date-and-slug file name for a new post, numbered if another post already has it"""
+    base = f"{datetime.now().strftime('%Y-%m-%d')}-{slugify(title)}"
+    filename = f'{base}.md'
+    n = 2
+    while os.path.exists(os.path.join(DRAFTS_DIR, filename)) or os.path.exists(os.path.join(POSTS_DIR, filename)):
+        filename = f'{base}-{n}.md'
+        n += 1
+    return filename
 
 
 @app.route('/save', methods=['POST'])
 def save_post():
-    """Save post as Jekyll markdown file"""
+    """Save post as Jekyll markdown file
+
+    Posts keep their file once created: saving with `filename` rewrites that
+    file (moving it between _drafts and _posts if the status changed), so a
+    retitle or a save on another day doesn't leave a second copy behind.
+    """
     data = request.json
 
     title = data.get('title', '').strip()
-    content = data.get('content', '').strip()
+    content = data.get('content', '')
     tags = data.get('tags', [])
     is_draft = data.get('is_draft', False)
 
     if not title:
         return jsonify({'error': 'Title is required'}), 400
-    if not content:
+    if not content.strip():
         return jsonify({'error': 'Content is required'}), 400
 
-    # Generate filename
-    date_str = datetime.now().strftime('%Y-%m-%d')
-    slug = slugify(title)
-    filename = f"{date_str}-{slug}.md"
-
     # Choose directory based on draft status
     target_dir = DRAFTS_DIR if is_draft else POSTS_DIR
-    filepath = os.path.join(target_dir, filename)
+    existing, _ = post_path(data.get('filename'))
+    date = None
+    if existing:
+        filename = os.path.basename(existing)
+        draft, _ = open_draft(existing)
+        date = draft.date if draft else None
+        filepath = os.path.join(target_dir, filename)
+        if existing != filepath:
+            if os.path.exists(filepath):
+                return jsonify({'error': f'{filename} already exists in the target folder'}), 409
+            autosave_store.move(existing, filepath)
+    else:
+        filename = new_filename(title)
+        filepath = os.path.join(target_dir, filename)
+
+    # Written atomically; the date of an existing post is kept
+    try:
+        draft = autosave_store.save(filepath, title, date or datetime.now().strftime('%Y-%m-%d %H:%M:%S'), tags, content)
+    except AutosaveError as e:
+        return jsonify(dict(e.details, error=str(e))), e.status
 
-    # Build frontmatter
-    frontmatter = [
-        '---',
-        f'title: "{title}"',
-        f'date: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}',
-    ]
+    status = 'draft' if is_draft else 'published'
+    return jsonify({
+        'success': True,
+        'message': f'Post saved as {status}',
+        'filename': filename,
+        'path': filepath,
+        'version': draft.version,
+    })
 
-    if tags:
-        tags_str = ', '.join(tags)
-        frontmatter.append(f'tags: [{tags_str}]')
 
-    frontmatter.append('---')
-    frontmatter.append('')
+@app.route('/autosave', methods=['POST'])
+def autosave():
+    """Apply an autosave delta to a saved post: {filename, version, changes: [{from, to, text}], length, title, tags}
 
-    # Combine frontmatter and content
-    full_content = '\n'.join(frontmatter) + content
+    Answers 409 with the current version when the delta doesn't apply, and the
+    client falls back to a full /save.
+    """
+    data = request.json
+    path, _ = post_path(data.get('filename'))
+    if path is None:
+        return jsonify({'error': 'Post not found'}), 404
+    title = (data.get('title') or '').strip() or None
+
+    try:
+        draft = autosave_store.apply(path, data.get('version'), data.get('changes') or [], data.get('length'),
+                                     title, data.get('tags'))
+    except AutosaveError as e:
+        return jsonify(dict(e.details, error=str(e))), e.status
+    except (KeyError, TypeError):
+        return jsonify({'error': 'Malformed changes'}), 400
+    return jsonify({'success': True, 'version': draft.version, 'pending': draft.records})
+
+
+def image_response(filename, original_name, created):
+    """JSON for a stored image: Markdown snippet, dimensions and variant status"""
+    name = os.path.splitext(original_name)[0] or 'image'
+    filepath = os.path.join(IMAGES_DIR, filename)
 
-    # Write file
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(full_content)
+    # Variants are made in the background, so a new upload's snippet points at
+    # the original; the editor switches it to the default-width variant once
+    # the status reports it ready. Content seen before keeps its variants
+    dimensions = read_dimensions(filepath)
+    variants = None if created else image_pipeline.status(filename)
+    if variants is None:
+        variants = image_pipeline.submit(filename)
+    markdown_path = f"{IMAGES_URL}/{default_filename(filename, variants)}"
 
-    status = 'draft' if is_draft else 'published'
     return jsonify({
         'success': True,
-        'message': f'Post saved as {status}',
+        'complete': True,
+        'deduplicated': not created,
         'filename': filename,
-        'path': filepath
+        'markdown': f"![{name}]({markdown_path})",
+        'path': markdown_path,
+        'original': f"{IMAGES_URL}/{filename}",
+        'width': dimensions[0] if dimensions else None,
+        'height': dimensions[1] if dimensions else None,
+        'variants': variants['status'],
+        'status_url': f"/upload/status/{filename}"
     })
 
 
+def upload_error(error):
+    return jsonify(dict(error.details, error=str(error))), error.status
+
+
 @app.route('/upload', methods=['POST'])
 def upload_image():
-    """Handle image upload"""
+    """Handle image upload (one request; streamed to disk and stored by content hash)"""
     if 'image' not in request.files:
         return jsonify({'error': 'No image provided'}), 400
 
@@ -116,89 +292,161 @@ def upload_image():
     if not allowed_file(file.filename):
         return jsonify({'error': 'File type not allowed'}), 400
 
-    # Secure the filename and add timestamp to avoid conflicts
     original_name = secure_filename(file.filename)
-    name, ext = os.path.splitext(original_name)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"{name}_{timestamp}{ext}"
+    try:
+        filename, created = upload_store.store_stream(file.stream, original_name)
+    except UploadError as e:
+        return upload_error(e)
+    return image_response(filename, original_name, created)
+
+
+@app.route('/upload/session', methods=['POST'])
+def start_upload():
+    """Start or resume a chunked upload
+
+    Clients send the file name, size and (if they can compute it) SHA-256.
+    Content already stored comes back straight away without any bytes being
+    sent; otherwise the reply gives the session id and the offset to send from.
+    """
+    data = request.json or {}
+    original_name = secure_filename(data.get('filename', ''))
+    if not original_name or not allowed_file(original_name):
+        return jsonify({'error': 'File type not allowed'}), 400
 
-    filepath = os.path.join(IMAGES_DIR, filename)
-    file.save(filepath)
+    try:
+        size = int(data.get('size', -1))
+        session, existing = upload_store.start(original_name, size, data.get('sha256'))
+    except ValueError:
+        return jsonify({'error': 'Invalid size'}), 400
+    except UploadError as e:
+        return upload_error(e)
 
-    # Return the markdown-ready path
-    markdown_path = f"/assets/images/blog/{filename}"
+    if existing:
+        return image_response(existing, original_name, created=False)
+    return jsonify({'id': session.id, 'offset': session.offset, 'size': size, 'chunk_size': SESSION_CHUNK_SIZE})
 
-    return jsonify({
-        'success': True,
-        'filename': filename,
-        'markdown': f"![{name}]({markdown_path})",
-        'path': markdown_path
-    })
+
+@app.route('/upload/session/<upload_id>', methods=['GET', 'PUT'])
+def upload_chunk(upload_id):
+    """GET: how much of the upload has arrived. PUT: append the request body at the Upload-Offset header"""
+    session = upload_store.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+
+    if request.method == 'GET':
+        return jsonify({'id': session.id, 'offset': session.offset, 'size': session.meta['size']})
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        offset, stored = upload_store.append(session, offset, request.stream)
+    except ValueError:
+        return jsonify({'error': 'Missing Upload-Offset header'}), 400
+    except UploadError as e:
+        return upload_error(e)
+
+    if stored is None:
+        return jsonify({'id': session.id, 'offset': offset, 'size': session.meta['size']})
+    return image_response(stored[0], session.meta['filename'], stored[1])
+
+
+@app.route('/upload/status/<filename>', methods=['GET'])
+def upload_status(filename):
+    """Progress of an upload's image variants"""
+    filename = secure_filename(filename)
+    status = image_pipeline.status(filename)
+    if status is None:
+        return jsonify({'error': 'Unknown image'}), 404
+    return jsonify(dict(status, path=f"{IMAGES_URL}/{default_filename(filename, status)}"))
 
 
 @app.route('/posts', methods=['GET'])
 def list_posts():
-    """List existing posts and drafts"""
-    posts = []
-    drafts = []
-
-    # Get published posts
-    if os.path.exists(POSTS_DIR):
-        for filename in os.listdir(POSTS_DIR):
-            if filename.endswith('.md'):
-                posts.append({
-                    'filename': filename,
-                    'path': os.path.join(POSTS_DIR, filename),
-                    'status': 'published'
-                })
-
-    # Get drafts
-    if os.path.exists(DRAFTS_DIR):
-        for filename in os.listdir(DRAFTS_DIR):
-            if filename.endswith('.md'):
-                drafts.append({
-                    'filename': filename,
-                    'path': os.path.join(DRAFTS_DIR, filename),
-                    'status': 'draft'
-                })
-
-    return jsonify({'posts': posts, 'drafts': drafts})
+    """List posts and drafts from the catalogue
+
+    Query parameters: status (published/draft), tag, sort (date, title,
+    modified, words), order (asc/desc), page and per_page (default 50).
+    """
+    catalogue.refresh()
+
+    status = request.args.get('status') or None
+    if status not in (None, 'published', 'draft'):
+        return jsonify({'error': 'Unknown status'}), 400
+    sort = request.args.get('sort', 'date')
+    if sort not in SORT_COLUMNS:
+        return jsonify({'error': 'Unknown sort'}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+
+    items, total = catalogue.query(
+        status=status,
+        tag=request.args.get('tag') or None,
+        sort=sort,
+        descending=request.args.get('order', 'desc') != 'asc',
+        page=page,
+        per_page=per_page,
+    )
+
+    return jsonify({
+        'items': items,
+        'posts': [item for item in items if item['status'] == 'published'],
+        'drafts': [item for item in items if item['status'] == 'draft'],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page,
+        'tags': catalogue.tags(),
+    })
+
+
+def search_document(path):
+    """Fields to index and result metadata for a catalogued post"""
+    entry = catalogue.get(path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            parsed = parse_post(f.read())
+    except (OSError, UnicodeDecodeError):
+        return None
+    if entry is None or parsed is None:
+        return None
+    fields, body = parsed
+    return {'title': entry['title'], 'tags': fields['tags'], 'body': body}, entry
+
+
+@app.route('/search', methods=['GET'])
+def search_posts():
+    """Ranked full-text search over posts and drafts: /search?q=...&limit=50"""
+    catalogue.refresh()
+    search_index.sync(catalogue.signatures(), search_document)
+
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    results = search_index.search(request.args.get('q', ''), limit)
+    return jsonify({
+        'items': results,
+        'posts': [item for item in results if item['status'] == 'published'],
+        'drafts': [item for item in results if item['status'] == 'draft'],
+        'total': len(results),
+    })
 
 
 @app.route('/load/<path:filename>', methods=['GET'])
 def load_post(filename):
-    """Load an existing post for editing"""
-    # Check both directories
-    for directory in [POSTS_DIR, DRAFTS_DIR]:
-        filepath = os.path.join(directory, filename)
-        if os.path.exists(filepath):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # Parse frontmatter
-            match = re.match(r'^---\n(.*?)\n---\n(.*)$', content, re.DOTALL)
-            if match:
-                frontmatter_str = match.group(1)
-                body = match.group(2)
-
-                # Extract title
-                title_match = re.search(r'title:\s*["\']?(.+?)["\']?\s*$', frontmatter_str, re.MULTILINE)
-                title = title_match.group(1) if title_match else ''
-
-                # Extract tags
-                tags_match = re.search(r'tags:\s*\[(.+?)\]', frontmatter_str)
-                tags = [t.strip() for t in tags_match.group(1).split(',')] if tags_match else []
-
-                is_draft = directory == DRAFTS_DIR
-
-                return jsonify({
-                    'title': title,
-                    'content': body.strip(),
-                    'tags': tags,
-                    'is_draft': is_draft
-                })
-
-    return jsonify({'error': 'Post not found'}), 404
+    """Load an existing post for editing, including autosaves not yet written to the file"""
+    filepath, is_draft = post_path(filename)
+    draft, warning = open_draft(filepath) if filepath else (None, None)
+    if draft is None:
+        return jsonify({'error': 'Post not found'}), 404
+
+    result = {
+        'filename': filename,
+        'title': draft.title,
+        'content': draft.text,
+        'tags': draft.tags,
+        'is_draft': is_draft,
+        'version': draft.version,
+    }
+    if warning:
+        result['warning'] = warning
+    return jsonify(result)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,321 @@
+"""
+Journaled autosave - keeps drafts safe without rewriting them on every keystroke
+Autosaves arrive as text deltas against a numbered version and are appended
+to a per-post journal; the Markdown file itself is only rewritten when the
+journal is compacted (periodically, on a full save and on exit), always via
+a temp file and an atomic rename so a crash never leaves a truncated post
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from catalogue import MANAGED_KEYS, format_post, front_matter_keys, parse_post
+
+COMPACT_RECORDS = 20        # Journal entries before the post file is rewritten
+COMPACT_SECONDS = 60        # ... or seconds since the last rewrite
+COMPACT_BYTES = 256 * 1024  # ... or journal size
+
+
+class AutosaveError(Exception):
+    """Raised when a delta can't be applied; carries the HTTP status"""
+
+    def __init__(self, message, status=409, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def write_atomic(path, text):
+    """Write a file through a temp file in the same folder and an atomic rename"""
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def has_astral(text):
+    """True if text has characters outside the BMP, which count as two UTF-16 units in the browser"""
+    return any(ord(c) > 0xFFFF for c in text)
+
+
+def utf16_length(text, astral):
+    return len(text.encode('utf-16-le')) // 2 if astral else len(text)
+
+
+def to_index(text, offset, astral):
+    """Python string index for a UTF-16 offset (as sent by the browser)"""
+    if not astral:
+        return offset
+    return len(text.encode('utf-16-le')[:offset * 2].decode('utf-16-le', errors='ignore'))
+
+
+class Draft:
+    """The latest text of one post: its file contents plus the journal entries not yet compacted"""
+
+    def __init__(self, path, journal_path, title, date, tags, text, front_matter=None):
+        self.path = path
+        self.journal_path = journal_path
+        self.title = title
+        self.date = date
+        self.tags = tags
+        self.text = text
+        # The file's front matter as read; its other keys (layout, ...) are written back as they were
+        self.front_matter = front_matter
+        self.astral = has_astral(text)
+        self.version = 0
+        self.file_hash = None     # Hash and signature of the file as last read or written
+        self.signature = None
+        self.records = 0
+        self.journal_bytes = 0
+        self.compacted_at = time.monotonic()
+
+    def apply(self, changes):
+        """Apply [{'from', 'to', 'text'}] in order; offsets are UTF-16 units into the current text"""
+        text = self.text
+        for change in changes:
+            start = to_index(text, change['from'], self.astral)
+            end = to_index(text, change['to'], self.astral)
+            if not 0 <= start <= end <= len(text):
+                raise AutosaveError('Change out of range', 409, version=self.version)
+            inserted = change.get('text', '')
+            text = text[:start] + inserted + text[end:]
+            self.astral = self.astral or has_astral(inserted)
+        self.text = text
+
+    def length(self):
+        return utf16_length(self.text, self.astral)
+
+    def serialize(self):
+        """The post file for this draft; raises AutosaveError rather than drop front matter keys"""
+        content = format_post(self.title, self.date, self.tags, self.text, self.front_matter)
+        parsed = parse_post(content)
+        lost = front_matter_keys(self.front_matter) - front_matter_keys(parsed[0]['front_matter'] if parsed else '')
+        lost.difference_update(MANAGED_KEYS)
+        if lost:
+            raise AutosaveError('Saving would drop front matter keys', 500, keys=sorted(lost))
+        return content
+
+
+class AutosaveStore:
+    """Open drafts by post path, with their journals kept in journal_dir"""
+
+    def __init__(self, journal_dir):
+        self.journal_dir = journal_dir
+        os.makedirs(journal_dir, exist_ok=True)
+        self._drafts = {}
+        self._lock = threading.Lock()
+
+    def _journal_path(self, path):
+        return os.path.join(self.journal_dir, hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:20] + '.journal')
+
+    def open(self, path):
+        """The draft for a post file, replaying any journal left by a crash or restart; None if missing"""
+        with self._lock:
+            return self._open(path)
+
+    def _open(self, path):
+        path = os.path.abspath(path)
+        draft = self._drafts.get(path)
+        if draft is not None:
+            # Pick up edits made outside the editor, unless autosaves are still pending
+            if draft.records or file_signature(path) == draft.signature:
+                return draft
+            del self._drafts[path]
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            return None
+
+        parsed = parse_post(content)
+        fields, body = parsed if parsed else ({'title': '', 'tags': [], 'date': None, 'front_matter': None}, content)
+        # The text is kept exactly as the file holds it, so journal offsets replay against the same string;
+        # the journal only applies to this exact file, so its front matter is the one the draft keeps
+        draft = Draft(path, self._journal_path(path), fields['title'], fields['date'], fields['tags'], body,
+                      fields['front_matter'])
+        draft.file_hash = content_hash(content)
+        draft.signature = file_signature(path)
+        if self._replay(draft, draft.file_hash):
+            self._compact(draft)
+        self._drafts[path] = draft
+        return draft
+
+    def _replay(self, draft, file_hash):
+        """Apply journal entries written against this exact file; returns True if any were applied"""
+        try:
+            with open(draft.journal_path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return False
+        applied = False
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except ValueError:
+            header = {}
+        if isinstance(header, dict) and header.get('base') == file_hash:
+            for line in lines[1:]:
+                try:
+                    record = json.loads(line)
+                    draft.apply(record['changes'])
+                except (ValueError, KeyError, TypeError, AttributeError, AutosaveError):
+                    break  # A torn final write; everything before it is intact
+                draft.title = record.get('title', draft.title)
+                draft.tags = record.get('tags', draft.tags)
+                applied = True
+        if not applied:
+            self._remove_journal(draft)
+        return applied
+
+    def apply(self, path, version, changes, length, title=None, tags=None):
+        """Apply one autosave to an open draft and journal it; returns the draft
+
+        Raises AutosaveError (409) when the client's base version or the
+        resulting length doesn't match, so the client falls back to a full save.
+        """
+        with self._lock:
+            draft = self._open(path)
+            if draft is None:
+                raise AutosaveError('Post not found', 404)
+            if version != draft.version:
+                raise AutosaveError('Version mismatch', 409, version=draft.version)
+
+            previous = (draft.text, draft.astral, draft.title, draft.tags)
+            draft.apply(changes)
+            if draft.length() != length:
+                draft.text, draft.astral = previous[:2]
+                raise AutosaveError('Length mismatch', 409, version=draft.version)
+            if title is not None:
+                draft.title = title
+            if tags is not None:
+                draft.tags = tags
+
+            try:
+                self._append(draft, {'changes': changes, 'title': draft.title, 'tags': draft.tags})
+            except OSError as e:
+                # Not journaled, so not applied: later deltas must build on what the journal holds
+                draft.text, draft.astral, draft.title, draft.tags = previous
+                raise AutosaveError('Could not write the autosave journal', 500,
+                                    version=draft.version, reason=str(e)) from e
+            draft.version += 1
+            if (draft.records >= COMPACT_RECORDS or draft.journal_bytes >= COMPACT_BYTES
+                    or time.monotonic() - draft.compacted_at >= COMPACT_SECONDS):
+                self._compact(draft)
+            return draft
+
+    def _append(self, draft, record):
+        new = draft.records == 0
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with open(draft.journal_path, 'w' if new else 'a', encoding='utf-8') as f:
+            start = f.tell()
+            try:
+                if new:
+                    # The header ties the journal to the file it applies to; after a
+                    # compaction the file changes and any leftover journal is ignored
+                    f.write(json.dumps({'base': draft.file_hash}) + '\n')
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                # Cut off a partly written record, so the next one doesn't follow a torn line
+                try:
+                    f.truncate(start)
+                except OSError:
+                    pass
+                raise
+        draft.records += 1
+        draft.journal_bytes += len(line)
+
+    def _compact(self, draft):
+        """Rewrite the post file from the draft and drop the journal"""
+        content = draft.serialize()
+        write_atomic(draft.path, content)
+        draft.file_hash = content_hash(content)
+        draft.signature = file_signature(draft.path)
+        self._remove_journal(draft)
+
+    def _remove_journal(self, draft):
+        try:
+            os.remove(draft.journal_path)
+        except OSError:
+            pass
+        draft.records = 0
+        draft.journal_bytes = 0
+        draft.compacted_at = time.monotonic()
+
+    def set_aside(self, path):
+        """Move the journal of a post out of the way when it can't be replayed; returns where it went, or None"""
+        path = os.path.abspath(path)
+        with self._lock:
+            self._drafts.pop(path, None)
+            journal_path = self._journal_path(path)
+            aside = f'{journal_path}.{time.strftime("%Y%m%d-%H%M%S")}.bad'
+            try:
+                os.replace(journal_path, aside)
+            except OSError:
+                return None
+            return aside
+
+    def save(self, path, title, date, tags, text):
+        """Full save: write the file atomically and start a fresh draft from it; returns the draft"""
+        path = os.path.abspath(path)
+        with self._lock:
+            # An existing file is opened first, so its front matter is kept
+            draft = self._open(path)
+            if draft is None:
+                draft = self._drafts[path] = Draft(path, self._journal_path(path), title, date, tags, text)
+            else:
+                draft.title, draft.date, draft.tags, draft.text = title, date, tags, text
+                draft.astral = has_astral(text)
+                draft.version += 1
+            self._compact(draft)
+            return draft
+
+    def move(self, old_path, new_path):
+        """Follow a post to its new location (published <-> draft), compacting it first"""
+        old_path, new_path = os.path.abspath(old_path), os.path.abspath(new_path)
+        with self._lock:
+            draft = self._drafts.pop(old_path, None)
+            if draft is not None and draft.records:
+                self._compact(draft)
+            os.replace(old_path, new_path)
+            if draft is not None:
+                # Kept open under the new path, front matter and all
+                draft.path = new_path
+                draft.journal_path = self._journal_path(new_path)
+                draft.signature = file_signature(new_path)
+                self._drafts[new_path] = draft
+
+    def compact_all(self):
+        """Write every draft with pending journal entries (on shutdown)"""
+        with self._lock:
+            for draft in self._drafts.values():
+                if draft.records:
+                    try:
+                        self._compact(draft)
+                    except AutosaveError as e:
+                        # The journal is kept, so the edits are replayed on the next start
+                        print(f"Could not write {draft.path}: {e} {e.details}")
@@ -0,0 +1,159 @@
+"""
+Block-level incremental Markdown rendering for the live preview
+The document is split into top-level blocks and each block's HTML is memoized
+by content hash (in the shared renderer), so a keystroke only re-renders the
+block being edited
+"""
+
+import hashlib
+import re
+
+import markdown_render
+
+FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+LIST_ITEM_RE = re.compile(r'^ {0,3}([*+-]|\d+[.)])\s')
+HTML_OPEN_RE = re.compile(r'^ {0,3}<([a-zA-Z][a-zA-Z0-9-]*)[\s>]')
+HEADER_ID_RE = re.compile(r'(<h[1-6][^>]*\sid=")([^"]+)(")')
+ID_COUNT_RE = re.compile(r'^(.*)_([0-9]+)$')
+
+# Raw HTML blocks that run until their terminator, blank lines and all
+HTML_SPAN_OPENERS = (('<!--', '-->'), ('<![CDATA[', ']]>'), ('<?', '?>'))
+
+# Documents using these need the whole text in one pass (shared state across blocks)
+REFERENCE_DEF_RE = re.compile(r'^ {0,3}\[[^\]]+\]:\s', re.MULTILINE)
+TOC_MARKER_RE = re.compile(r'^\s*\[TOC\]\s*$', re.MULTILINE)
+
+VOID_TAGS = {'br', 'hr', 'img', 'input', 'meta', 'link', 'source', 'wbr', 'area', 'col', 'embed'}
+
+
+def split_blocks(text):
+    """Split Markdown into top-level blocks, returned as source strings
+
+    Blocks are separated by blank lines, except that fenced code is never split,
+    and a block is merged into the previous one when it continues it:
+    indented continuation lines, further items of a loose list, further
+    blockquote paragraphs, or raw HTML whose opening tag (or comment, <?...?>,
+    CDATA section) is not yet closed.
+    Merged blocks keep their original separators, so rendering a merged block
+    gives exactly what the full document would.
+    """
+    lines = text.split('\n')
+    ranges = []
+    start = None
+    fence = None
+
+    for i, line in enumerate(lines):
+        if fence:
+            stripped = line.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+            continue
+
+        match = FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+            if start is None:
+                start = i
+            continue
+
+        if not line.strip():
+            if start is not None:
+                ranges.append([start, i])
+                start = None
+        elif start is None:
+            start = i
+
+    if start is not None:
+        ranges.append([start, len(lines)])
+
+    merged = []
+    for block in ranges:
+        if merged and _continues(lines, merged[-1], block):
+            merged[-1][1] = block[1]
+        else:
+            merged.append(block)
+
+    return ['\n'.join(lines[s:e]) for s, e in merged]
+
+
+def _continues(lines, previous, block):
+    first = lines[block[0]]
+    prev_first = lines[previous[0]]
+
+    if first[:1] in (' ', '\t') and not FENCE_RE.match(first):
+        return True
+    if LIST_ITEM_RE.match(first) and LIST_ITEM_RE.match(prev_first):
+        return True
+    if first.lstrip().startswith('>') and prev_first.lstrip().startswith('>'):
+        return True
+
+    # Comment, processing instruction or CDATA section not yet terminated
+    opening = prev_first.lstrip(' ')
+    if len(prev_first) - len(opening) <= 3:
+        for opener, terminator in HTML_SPAN_OPENERS:
+            if opening.startswith(opener):
+                source = '\n'.join(lines[previous[0]:previous[1]])
+                return terminator not in source[source.index(opener) + len(opener):]
+
+    # Raw HTML block still open (e.g. <div> ... blank line ... </div>)
+    match = HTML_OPEN_RE.match(prev_first)
+    if match and match.group(1).lower() not in VOID_TAGS:
+        tag = match.group(1).lower()
+        source = '\n'.join(lines[previous[0]:previous[1]]).lower()
+        opened = len(re.findall(r'<' + re.escape(tag) + r'[\s>]', source))
+        closed = source.count(f'</{tag}>')
+        return opened > closed
+    return False
+
+
+def block_id(source):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+
+class BlockRenderer:
+    """Render Markdown block by block through a memoizing MarkdownRenderer"""
+
+    def __init__(self, renderer=None):
+        self.renderer = renderer or markdown_render.renderer
+
+    def render_block(self, source):
+        return self.renderer.render(source)
+
+    def render_blocks(self, text, cancelled=None):
+        """Render text into a list of (fragment_id, html) in document order
+
+        cancelled() is checked before each block; once it returns True the
+        render stops and None is returned.
+        """
+        if REFERENCE_DEF_RE.search(text) or TOC_MARKER_RE.search(text):
+            sources = [text]
+        else:
+            sources = split_blocks(text)
+
+        fragments = []
+        seen_ids = set()
+        for source in sources:
+            if cancelled is not None and cancelled():
+                return None
+            html = self.render_block(source)
+            # Header ids are only unique within a block; de-duplicate across the document
+            if '<h' in html:
+                html = HEADER_ID_RE.sub(lambda m: m.group(1) + _unique_id(m.group(2), seen_ids) + m.group(3), html)
+            fragments.append((block_id(html), html))
+        return fragments
+
+    def render(self, text):
+        """Render the whole document to one HTML string"""
+        return '\n'.join(html for _, html in self.render_blocks(text))
+
+
+def _unique_id(header_id, seen_ids):
+    """header_id, or the next free header_id_N, checked against every id used so far (as the toc extension does)"""
+    while header_id in seen_ids:
+        match = ID_COUNT_RE.match(header_id)
+        if match:
+            header_id = f'{match.group(1)}_{int(match.group(2)) + 1}'
+        else:
+            header_id = f'{header_id}_1'
+    seen_ids.add(header_id)
+    return header_id
@@ -0,0 +1,261 @@
+"""
+Post catalogue - title, date, tags, word count and status of every post and draft
+Kept in SQLite under tools/.cache and refreshed incrementally: a refresh
+lists the post folders and re-parses only files whose mtime or size changed,
+so listing, sorting and filtering hundreds of posts is a single indexed query
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA_VERSION = 1
+
+FRONT_MATTER_RE = re.compile(r'^---\n(.*?)\n---\n(.*)$', re.DOTALL)
+TITLE_RE = re.compile(r'title:\s*["\']?(.+?)["\']?\s*$', re.MULTILINE)
+TAGS_RE = re.compile(r'tags:\s*\[(.+?)\]')
+DATE_RE = re.compile(r'^date:\s*["\']?(\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?)', re.MULTILINE)
+FILENAME_DATE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})-')
+FRONT_MATTER_KEY_RE = re.compile(r'^([A-Za-z_][\w-]*)\s*:')
+
+# Front matter keys the editor sets; every other key is kept as the file has it
+MANAGED_KEYS = ('title', 'date', 'tags')
+
+SORT_COLUMNS = {'date': 'date', 'title': 'title COLLATE NOCASE', 'modified': 'mtime_ns', 'words': 'word_count'}
+
+
+def parse_post(content):
+    """Split a post into (front matter fields, body) with the editor's front matter conventions
+
+    The fields include the raw front matter text, so a save can keep the keys
+    the editor doesn't manage. Returns None when the file has no front matter block.
+    """
+    match = FRONT_MATTER_RE.match(content)
+    if not match:
+        return None
+    front_matter, body = match.groups()
+
+    title_match = TITLE_RE.search(front_matter)
+    tags_match = TAGS_RE.search(front_matter)
+    date_match = DATE_RE.search(front_matter)
+    return {
+        'title': title_match.group(1) if title_match else '',
+        'tags': [t.strip() for t in tags_match.group(1).split(',') if t.strip()] if tags_match else [],
+        'date': date_match.group(1).replace('T', ' ') if date_match else None,
+        'front_matter': front_matter,
+    }, body
+
+
+def front_matter_keys(front_matter):
+    """Top-level keys of a front matter block"""
+    keys = set()
+    for line in (front_matter or '').split('\n'):
+        match = FRONT_MATTER_KEY_RE.match(line)
+        if match:
+            keys.add(match.group(1))
+    return keys
+
+
+def format_post(title, date, tags, body, front_matter=None):
+    """A post file in the editor's front matter format
+
+    Given the post's existing front matter, only title, date and tags are
+    rewritten in place; every other line is kept. A date of None keeps the
+    existing date and empty tags remove the tags key.
+    """
+    managed = {'title': f'title: "{title}"', 'tags': f"tags: [{', '.join(tags)}]" if tags else None}
+    if date:
+        managed['date'] = f'date: {date}'
+
+    lines = ['---']
+    written = set()
+    key = None
+    for line in front_matter.split('\n') if front_matter else []:
+        match = FRONT_MATTER_KEY_RE.match(line)
+        if match:
+            key = match.group(1)
+        elif not (line.strip() and line[0] in ' \t-'):
+            key = None   # Not a continuation (indented or block list) line of the key above
+        if key in managed:
+            # The key's first line is replaced; its continuation lines go with it
+            if match and key not in written:
+                written.add(key)
+                if managed[key] is not None:
+                    lines.append(managed[key])
+            continue
+        lines.append(line)
+    for key in MANAGED_KEYS:
+        if key in managed and key not in written and managed[key] is not None:
+            lines.append(managed[key])
+    lines.append('---')
+    lines.append('')
+    return '\n'.join(lines) + body
+
+
+class PostCatalogue:
+    """SQLite-backed index of the posts and drafts folders"""
+
+    def __init__(self, db_path, folders):
+        """folders maps a status ('published', 'draft') to its directory"""
+        self.db_path = db_path
+        self.folders = {status: os.path.abspath(path) for status, path in folders.items()}
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._create_schema()
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.db_path, timeout=10)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def _create_schema(self):
+        db = self._connect()
+        if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            db.executescript('''
+                DROP TABLE IF EXISTS post_tags;
+                DROP TABLE IF EXISTS posts;
+            ''')
+        db.executescript(f'''
+            CREATE TABLE IF NOT EXISTS posts (
+                path TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                status TEXT NOT NULL,
+                title TEXT NOT NULL,
+                date TEXT,
+                tags TEXT NOT NULL,
+                word_count INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS posts_folder_date ON posts (folder, date);
+            CREATE TABLE IF NOT EXISTS post_tags (
+                path TEXT NOT NULL REFERENCES posts (path) ON DELETE CASCADE,
+                tag TEXT NOT NULL COLLATE NOCASE
+            );
+            CREATE INDEX IF NOT EXISTS post_tags_tag ON post_tags (tag, path);
+            CREATE INDEX IF NOT EXISTS post_tags_path ON post_tags (path);
+            PRAGMA user_version = {SCHEMA_VERSION};
+        ''')
+        db.commit()
+
+    def refresh(self):
+        """Bring the catalogue in line with the folders; returns the number of files re-parsed"""
+        with self._refresh_lock:
+            db = self._connect()
+            changed = 0
+            for status, folder in self.folders.items():
+                known = {
+                    row['path']: (row['mtime_ns'], row['size'])
+                    for row in db.execute('SELECT path, mtime_ns, size FROM posts WHERE folder = ?', (folder,))
+                }
+                seen = set()
+                try:
+                    entries = list(os.scandir(folder))
+                except OSError:
+                    entries = []
+
+                for entry in entries:
+                    if not entry.name.endswith('.md') or not entry.is_file():
+                        continue
+                    path = os.path.abspath(entry.path)
+                    seen.add(path)
+                    stat = entry.stat()
+                    if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                        continue
+                    self._index(db, path, folder, entry.name, status, stat)
+                    changed += 1
+
+                for path in known.keys() - seen:
+                    db.execute('DELETE FROM post_tags WHERE path = ?', (path,))
+                    db.execute('DELETE FROM posts WHERE path = ?', (path,))
+                    changed += 1
+            db.commit()
+            return changed
+
+    def _index(self, db, path, folder, filename, status, stat):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            content = ''
+
+        parsed = parse_post(content)
+        fields, body = parsed if parsed else ({'title': '', 'tags': [], 'date': None}, content)
+        date = fields['date']
+        if date is None:
+            date_match = FILENAME_DATE_RE.match(filename)
+            date = date_match.group(1) if date_match else datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+        db.execute('DELETE FROM post_tags WHERE path = ?', (path,))
+        db.execute(
+            'INSERT OR REPLACE INTO posts (path, folder, filename, status, title, date, tags, word_count, mtime_ns, size) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, folder, filename, status, fields['title'] or os.path.splitext(filename)[0], date,
+             json.dumps(fields['tags']), len(body.split()), stat.st_mtime_ns, stat.st_size),
+        )
+        db.executemany('INSERT INTO post_tags (path, tag) VALUES (?, ?)', [(path, tag) for tag in set(fields['tags'])])
+
+    def query(self, status=None, tag=None, sort='date', descending=True, page=1, per_page=50):
+        """One page of posts plus the total number of matches, newest first by default"""
+        where = ['folder IN (%s)' % ','.join('?' * len(self.folders))]
+        params = list(self.folders.values())
+        if status:
+            where.append('status = ?')
+            params.append(status)
+        if tag:
+            where.append('path IN (SELECT path FROM post_tags WHERE tag = ?)')
+            params.append(tag)
+        clause = ' AND '.join(where)
+
+        db = self._connect()
+        total = db.execute(f'SELECT COUNT(*) FROM posts WHERE {clause}', params).fetchone()[0]
+        order = f"{SORT_COLUMNS.get(sort, 'date')} {'DESC' if descending else 'ASC'}, filename"
+        limit = ''
+        if per_page:
+            limit = ' LIMIT ? OFFSET ?'
+            params += [per_page, (max(page, 1) - 1) * per_page]
+        rows = db.execute(f'SELECT * FROM posts WHERE {clause} ORDER BY {order}{limit}', params).fetchall()
+        return [self._row(row) for row in rows], total
+
+    def signatures(self):
+        """{path: (mtime_ns, size)} of every catalogued file"""
+        folders = list(self.folders.values())
+        rows = self._connect().execute(
+            f"SELECT path, mtime_ns, size FROM posts WHERE folder IN ({','.join('?' * len(folders))})", folders)
+        return {row['path']: (row['mtime_ns'], row['size']) for row in rows}
+
+    def get(self, path):
+        """Catalogue entry for one file, or None"""
+        row = self._connect().execute('SELECT * FROM posts WHERE path = ?', (path,)).fetchone()
+        return self._row(row) if row else None
+
+    def tags(self):
+        """Every tag with the number of posts and drafts using it"""
+        folders = list(self.folders.values())
+        rows = self._connect().execute(
+            'SELECT tag, COUNT(*) AS count FROM post_tags JOIN posts USING (path) '
+            f"WHERE folder IN ({','.join('?' * len(folders))}) GROUP BY tag COLLATE NOCASE ORDER BY count DESC, tag",
+            folders,
+        ).fetchall()
+        return [{'tag': row['tag'], 'count': row['count']} for row in rows]
+
+    @staticmethod
+    def _row(row):
+        return {
+            'filename': row['filename'],
+            'path': row['path'],
+            'status': row['status'],
+            'title': row['title'],
+            'date': row['date'],
+            'tags': json.loads(row['tags']),
+            'word_count': row['word_count'],
+            'modified': row['mtime_ns'] / 1e9,
+        }
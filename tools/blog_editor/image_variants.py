@@ -0,0 +1,194 @@
+"""
+Background image-variant pipeline for uploads
+Each uploaded image is queued to a small worker pool that records its
+dimensions and writes metadata-free copies: one at full size, resized ones
+and WebP versions at a few widths. The upload itself is never modified (it is
+stored under the hash of its bytes). Results are kept in a manifest next to the images (.variants.json,
+which the site build skips as a dotfile) so the status survives restarts
+
+Needs Pillow; without it uploads are kept as they are and reported as skipped
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+WIDTHS = (480, 960, 1600)
+DEFAULT_WIDTH = 960          # Width the Markdown snippet points at
+MANIFEST_NAME = '.variants.json'
+
+# Formats we re-encode; anything else (SVG, animated GIF) is kept as uploaded
+RASTER_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+
+def variant_name(filename, width, ext=None):
+    """File name of a resized variant: photo_20260101_120000.jpg -> photo_20260101_120000-960w.jpg"""
+    name, original_ext = os.path.splitext(filename)
+    return f'{name}-{width}w{ext or original_ext}'
+
+
+def read_dimensions(path):
+    """(width, height) from the image header, or None if it can't be read"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            # EXIF orientations 5-8 are rotated by 90 degrees
+            if image.format == 'JPEG' and image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width, height = height, width
+            return width, height
+    except (OSError, ValueError):
+        return None
+
+
+def default_filename(filename, status):
+    """Image the Markdown snippet should use, once the pipeline reports its variants written
+
+    The DEFAULT_WIDTH variant, or for narrower images the full-size copy
+    without metadata. Until then (queued, processing), and when there is none
+    (failed, skipped, kept as uploaded), the original.
+    """
+    if not status or status.get('status') != 'ready':
+        return filename
+    written = {v['path'].rsplit('/', 1)[-1] for v in status.get('variants', [])}
+    for candidate in (variant_name(filename, DEFAULT_WIDTH), variant_name(filename, status.get('width'))):
+        if candidate in written:
+            return candidate
+    return filename
+
+
+def save_image(image, path, image_format):
+    """Encode without metadata (EXIF, ICC text chunks, comments aren't passed on) via a temp file"""
+    temp_path = path + '.tmp'
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(temp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        image.save(temp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(temp_path, image_format, optimize=True)
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+
+class ImagePipeline:
+    """Queue of uploads to post-process, with per-file status"""
+
+    def __init__(self, images_dir, url_prefix, workers=2):
+        self.images_dir = images_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.manifest_path = os.path.join(images_dir, MANIFEST_NAME)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.manifest_path)
+
+    def submit(self, filename):
+        """Queue an uploaded file; returns its initial status"""
+        reason = None
+        if Image is None:
+            reason = 'Pillow is not installed'
+        elif filename.lower().endswith('.svg'):
+            reason = 'Vector image'
+        if reason:
+            job = {'status': 'skipped', 'reason': reason}
+            with self._lock:
+                self._jobs[filename] = job
+            return dict(job)
+
+        job = {'status': 'queued'}
+        with self._lock:
+            self._jobs[filename] = job
+        status = dict(job)
+        self._executor.submit(self._run, filename)
+        return status
+
+    def status(self, filename):
+        """Status of a file: queued, processing, ready (with dimensions and variants), failed or skipped"""
+        with self._lock:
+            job = self._jobs.get(filename)
+            if job is not None:
+                return dict(job)
+            entry = self._manifest.get(filename)
+        if entry is not None:
+            return dict(entry, status='ready')
+        return None
+
+    def _run(self, filename):
+        with self._lock:
+            self._jobs[filename]['status'] = 'processing'
+        try:
+            entry = self.process(filename)
+        except Exception as e:
+            with self._lock:
+                self._jobs[filename] = {'status': 'failed', 'error': str(e)}
+            return
+
+        with self._lock:
+            self._manifest[filename] = entry
+            self._save_manifest()
+            self._jobs[filename] = dict(entry, status='ready')
+
+    def process(self, filename):
+        """Write an upload's variants, leaving the upload as it is; returns its manifest entry"""
+        path = os.path.join(self.images_dir, filename)
+        with Image.open(path) as source:
+            image_format = source.format
+            animated = getattr(source, 'is_animated', False)
+            if image_format not in RASTER_FORMATS or animated:
+                # Kept as uploaded: vector or animated images
+                return {'width': source.width, 'height': source.height, 'variants': []}
+
+            # Apply the EXIF rotation before the EXIF block is dropped
+            image = ImageOps.exif_transpose(source)
+            image.load()
+
+        width, height = image.size
+        variants = []
+
+        def add(variant_filename, variant, variant_format):
+            size = save_image(variant, os.path.join(self.images_dir, variant_filename), variant_format)
+            variants.append({
+                'width': variant.width,
+                'height': variant.height,
+                'format': variant_format.lower(),
+                'path': f'{self.url_prefix}/{variant_filename}',
+                'bytes': size,
+            })
+
+        for target in WIDTHS:
+            if target >= width:
+                continue
+            resized = image.resize((target, round(height * target / width)), Image.LANCZOS)
+            if image_format != 'WEBP':
+                add(variant_name(filename, target), resized, image_format)
+            add(variant_name(filename, target, '.webp'), resized, 'WEBP')
+        # Full size without metadata, in the upload's own format and as WebP
+        add(variant_name(filename, width), image, image_format)
+        if image_format != 'WEBP':
+            add(variant_name(filename, width, '.webp'), image, 'WEBP')
+
+        return {'width': width, 'height': height, 'variants': variants}
@@ -0,0 +1,137 @@
+"""
+Live preview channel - edits in as deltas, rendered fragments out over one event stream
+Each editor tab opens a session: its text is kept server-side and updated
+from numbered deltas (POST /preview/edit), and the session's event stream
+(GET /preview/stream) renders only the newest text, abandoning a render as
+soon as a newer edit arrives. Updates carry the sequence number they were
+rendered from and only the fragments the tab doesn't already show
+"""
+
+import json
+import threading
+
+from autosave import has_astral, to_index, utf16_length
+
+KEEPALIVE_SECONDS = 15
+
+
+class PreviewError(Exception):
+    """Raised when an edit can't be applied; carries the HTTP status"""
+
+    def __init__(self, message, status=409, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class PreviewSession:
+    """The text one editor tab is previewing, and the fragments it currently shows"""
+
+    def __init__(self):
+        self.text = ''
+        self.astral = False
+        self.seq = 0              # Sequence number of the latest edit applied to text
+        self.rendered = 0         # Sequence number of the last update sent
+        self.known = set()        # Fragment ids the tab has, as of the last update sent
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def apply(self, changes):
+        """Apply [{'from', 'to', 'text'}] in order; offsets are UTF-16 units, as in the browser"""
+        text = self.text
+        astral = self.astral
+        for change in changes:
+            start = to_index(text, change['from'], astral)
+            end = to_index(text, change['to'], astral)
+            if not 0 <= start <= end <= len(text):
+                raise PreviewError('Change out of range', 409, seq=self.seq)
+            inserted = change.get('text', '')
+            text = text[:start] + inserted + text[end:]
+            astral = astral or has_astral(inserted)
+        return text, astral
+
+
+class PreviewChannel:
+    """Preview sessions by id, each rendered by its own event stream"""
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def edit(self, session_id, seq, base=None, changes=None, length=None, content=None):
+        """Apply an edit numbered seq: a delta against edit `base`, or the whole content
+
+        Raises PreviewError: 404 for an unknown session (the client reconnects),
+        409 when the delta doesn't apply to the server's copy (the client sends
+        the whole content instead).
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise PreviewError('Unknown preview session', 404)
+        if not isinstance(seq, int):
+            raise PreviewError('Missing sequence number', 400)
+
+        with session.condition:
+            if seq <= session.seq:
+                return session.seq   # A retry of an edit already applied
+            if content is not None:
+                text, astral = content, has_astral(content)
+            else:
+                if base != session.seq:
+                    raise PreviewError('Base mismatch', 409, seq=session.seq)
+                text, astral = session.apply(changes or [])
+                if utf16_length(text, astral) != length:
+                    raise PreviewError('Length mismatch', 409, seq=session.seq)
+            session.text, session.astral, session.seq = text, astral, seq
+            session.condition.notify_all()
+            return seq
+
+    def stream(self, session_id):
+        """Generator of SSE messages for one session: a `preview` event per rendered update"""
+        session = PreviewSession()
+        with self._lock:
+            previous = self._sessions.get(session_id)
+            self._sessions[session_id] = session
+        if previous is not None:
+            # The tab reconnected; the old stream stops at its next wake-up
+            with previous.condition:
+                previous.closed = True
+                previous.condition.notify_all()
+
+        try:
+            yield 'retry: 1000\n\n'
+            yield 'event: ready\ndata: {}\n\n'
+            while True:
+                with session.condition:
+                    if session.rendered == session.seq and not session.closed:
+                        session.condition.wait(KEEPALIVE_SECONDS)
+                    if session.closed:
+                        return
+                    if session.rendered == session.seq:
+                        message = ': keepalive\n\n'
+                        seq = None
+                    else:
+                        seq, text = session.seq, session.text
+                if seq is None:
+                    yield message
+                    continue
+
+                # Rendered outside the lock so edits keep landing; a newer one cancels this render
+                fragments = self.renderer.render_blocks(text, cancelled=lambda: session.seq != seq)
+                if fragments is None:
+                    continue
+
+                # Sent even if an edit landed just now: updates only ever move forward,
+                # and the tab must apply every one for `known` to match what it shows
+                with session.condition:
+                    known = session.known
+                    session.known = {fragment_id for fragment_id, _ in fragments}
+                    session.rendered = seq
+                blocks = [{'id': fragment_id} if fragment_id in known else {'id': fragment_id, 'html': html}
+                          for fragment_id, html in fragments]
+                yield f"event: preview\ndata: {json.dumps({'seq': seq, 'blocks': blocks})}\n\n"
+        finally:
+            with self._lock:
+                if self._sessions.get(session_id) is session:
+                    del self._sessions[session_id]
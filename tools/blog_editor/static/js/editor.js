@@ -30,14 +30,26 @@ let tags = [];
 let isDraft = true;
 let previewVisible = true;
 let previewTimeout = null;
+let previewSeq = 0;
+const previewHtml = new Map(); // fragment id -> html currently shown in the preview
+
+// Preview channel: one event stream per tab brings rendered updates; edits go up as numbered deltas
+const previewSession = Math.random().toString(36).slice(2) + Date.now().toString(36);
+let previewSource = null;    // EventSource, while the channel is usable
+let previewSent = null;      // Text the server's session has (null: send the whole text next)
+let previewBase = 0;         // seq of the edit that produced previewSent
+let previewSending = false;  // An edit is in flight; later ones wait for it, so they arrive in order
+let previewPending = false;
 let hasUnsavedChanges = false;
 let lastSavedContent = '';
 let lastSavedTitle = '';
+let currentFile = null;   // File name of the post being edited, once it has been saved
+let savedVersion = null;  // Server-side version lastSavedContent corresponds to
 let autoSaveTimeout = null;
 let confirmCallback = null;
 
-// Auto-save interval (30 seconds)
-const AUTO_SAVE_DELAY = 30000;
+// Auto-save delay after the last edit (5 seconds); autosaves only send what changed
+const AUTO_SAVE_DELAY = 5000;
 
 // Initialize
 document.addEventListener('DOMContentLoaded', () => {
@@ -94,12 +106,32 @@ function markAsUnsaved() {
     }
 }
 
-function markAsSaved() {
+// content/title are what was actually sent, in case the user kept typing while it was saving
+function markAsSaved(content = editor.value, title = titleInput.value) {
     hasUnsavedChanges = false;
-    lastSavedContent = editor.value;
-    lastSavedTitle = titleInput.value;
+    lastSavedContent = content;
+    lastSavedTitle = title;
     unsavedIndicator.classList.remove('visible');
     clearTimeout(autoSaveTimeout);
+    markAsUnsaved();
+}
+
+// The single edit turning before into after: {from, to, text} in UTF-16 offsets, like the textarea's
+function textDelta(before, after) {
+    const max = Math.min(before.length, after.length);
+    let start = 0;
+    while (start < max && before.charCodeAt(start) === after.charCodeAt(start)) start++;
+    let end = 0;
+    while (end < max - start
+        && before.charCodeAt(before.length - 1 - end) === after.charCodeAt(after.length - 1 - end)) end++;
+
+    // Never split a surrogate pair
+    const isHigh = (code) => code >= 0xD800 && code <= 0xDBFF;
+    const isLow = (code) => code >= 0xDC00 && code <= 0xDFFF;
+    if (start > 0 && isHigh(before.charCodeAt(start - 1))) start--;
+    if (end > 0 && isLow(before.charCodeAt(before.length - end))) end--;
+
+    return { from: start, to: before.length - end, text: after.slice(start, after.length - end) };
 }
 
 // Auto-save
@@ -118,22 +150,49 @@ async function autoSave() {
     autosaveIndicator.classList.add('visible', 'saving');
     autosaveText.textContent = 'Saving...';
 
+    const content = editor.value;
+    const title = titleInput.value;
+
     try {
-        const response = await fetch('/save', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                title: titleInput.value.trim(),
-                content: editor.value.trim(),
-                tags,
-                is_draft: true
-            })
-        });
+        let data = null;
+
+        // Saved posts get a delta appended to their journal; a conflict falls back to a full save
+        if (currentFile && savedVersion !== null) {
+            const response = await fetch('/autosave', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    filename: currentFile,
+                    version: savedVersion,
+                    changes: [textDelta(lastSavedContent, content)],
+                    length: content.length,
+                    title: title.trim(),
+                    tags
+                })
+            });
+            data = await response.json();
+            if (response.status === 409 || response.status === 404) data = null;
+        }
 
-        const data = await response.json();
+        if (!data) {
+            const response = await fetch('/save', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    filename: currentFile,
+                    title: title.trim(),
+                    content,
+                    tags,
+                    is_draft: true
+                })
+            });
+            data = await response.json();
+            if (!data.error) currentFile = data.filename;
+        }
 
         if (!data.error) {
-            markAsSaved();
+            savedVersion = data.version;
+            markAsSaved(content, title);
             autosaveIndicator.classList.remove('saving');
             autosaveIndicator.classList.add('saved');
             autosaveText.textContent = 'Auto-saved';
@@ -395,28 +454,188 @@ function initPreview() {
 
     editor.addEventListener('input', () => {
         clearTimeout(previewTimeout);
-        previewTimeout = setTimeout(updatePreview, 300);
+        // Deltas are small and stale renders are dropped server-side, so the channel can keep up sooner
+        previewTimeout = setTimeout(updatePreview, previewSource ? 100 : 300);
         updateWordCount();
     });
+
+    openPreviewChannel();
+}
+
+function openPreviewChannel() {
+    if (!window.EventSource) return;
+
+    const source = new EventSource(`/preview/stream?session=${previewSession}`);
+    previewSource = source;
+
+    // Sent on every (re)connect: the session starts empty, so it gets the whole text
+    source.addEventListener('ready', () => {
+        previewSent = null;
+        updatePreview();
+    });
+
+    // Updates arrive in order and only ever move forward; every one is applied
+    // so the server's idea of which fragments are shown stays right
+    source.addEventListener('preview', (e) => {
+        const data = JSON.parse(e.data);
+        patchPreview(data.blocks || []);
+    });
+
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED && previewSource === source) {
+            // Fall back to one request per update
+            previewSource = null;
+        }
+    });
+}
+
+function reconnectPreviewChannel() {
+    if (previewSource) previewSource.close();
+    previewSource = null;
+    previewSent = null;
+    openPreviewChannel();
+}
+
+async function sendPreviewEdit() {
+    if (previewSending) {
+        previewPending = true;
+        return;
+    }
+
+    const text = editor.value;
+    if (text === previewSent) return;
+
+    const seq = ++previewSeq;
+    const body = { session: previewSession, seq };
+    if (previewSent === null) {
+        body.content = text;
+    } else {
+        body.base = previewBase;
+        body.changes = [textDelta(previewSent, text)];
+        body.length = text.length;
+    }
+
+    previewSending = true;
+    try {
+        const response = await fetch('/preview/edit', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(body)
+        });
+
+        if (response.ok) {
+            previewSent = text;
+            previewBase = seq;
+        } else if (response.status === 404) {
+            // The session is gone (server restarted); a new stream resends everything
+            reconnectPreviewChannel();
+        } else {
+            // The server's copy differs; resend the whole text
+            previewSent = null;
+            previewPending = true;
+        }
+    } catch (error) {
+        console.error('Preview error:', error);
+        previewSent = null;
+    } finally {
+        previewSending = false;
+        if (previewPending) {
+            previewPending = false;
+            sendPreviewEdit();
+        }
+    }
 }
 
 async function updatePreview() {
     if (!previewVisible) return;
 
+    if (previewSource && previewSource.readyState === EventSource.OPEN) {
+        sendPreviewEdit();
+        return;
+    }
+
+    const seq = ++previewSeq;
+
     try {
         const response = await fetch('/preview', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ content: editor.value })
+            body: JSON.stringify({ content: editor.value, known: [...previewHtml.keys()] })
         });
 
         const data = await response.json();
-        preview.innerHTML = data.html || '<p class="empty">Start writing to see preview...</p>';
+
+        // A newer request is in flight; its response will replace this one
+        if (seq !== previewSeq) return;
+
+        patchPreview(data.blocks || []);
     } catch (error) {
         console.error('Preview error:', error);
     }
 }
 
+// Rebuild the preview from ordered fragments, reusing the DOM of unchanged blocks
+function patchPreview(blocks) {
+    if (!blocks.length) {
+        previewHtml.clear();
+        preview.innerHTML = '<p class="empty">Start writing to see preview...</p>';
+        return;
+    }
+
+    if (blocks.some(block => block.html === undefined && !previewHtml.has(block.id))) {
+        // Server assumed HTML we no longer have; ask for everything
+        previewHtml.clear();
+        if (previewSource) {
+            reconnectPreviewChannel();
+        } else {
+            updatePreview();
+        }
+        return;
+    }
+
+    if (!preview.querySelector(':scope > .preview-block')) {
+        preview.innerHTML = '';
+    }
+
+    const reusable = new Map();
+    preview.querySelectorAll(':scope > .preview-block').forEach(node => {
+        if (!reusable.has(node.dataset.id)) reusable.set(node.dataset.id, []);
+        reusable.get(node.dataset.id).push(node);
+    });
+
+    const nextHtml = new Map();
+    let cursor = preview.firstChild;
+
+    blocks.forEach(block => {
+        const html = block.html !== undefined ? block.html : previewHtml.get(block.id);
+        nextHtml.set(block.id, html);
+
+        let node = (reusable.get(block.id) || []).shift();
+        if (!node) {
+            node = document.createElement('div');
+            node.className = 'preview-block';
+            node.dataset.id = block.id;
+            node.innerHTML = html;
+        }
+
+        if (node === cursor) {
+            cursor = cursor.nextSibling;
+        } else {
+            preview.insertBefore(node, cursor);
+        }
+    });
+
+    // Anything left after the last fragment is from blocks that were removed
+    while (cursor) {
+        const next = cursor.nextSibling;
+        preview.removeChild(cursor);
+        cursor = next;
+    }
+
+    previewHtml.clear();
+    nextHtml.forEach((html, id) => previewHtml.set(id, html));
+}
+
 // Word Count
 function initWordCount() {
     updateWordCount();
@@ -435,6 +654,7 @@ function updateWordCount() {
 function initModals() {
     // Load Posts Modal
     document.getElementById('loadPostsBtn').addEventListener('click', openPostsModal);
+    initPostsPicker();
     document.getElementById('closeModal').addEventListener('click', () => {
         postsModal.classList.remove('visible');
     });
@@ -468,45 +688,112 @@ function initModals() {
     saveBtn.addEventListener('click', savePost);
 }
 
-async function openPostsModal() {
-    try {
-        const response = await fetch('/posts');
-        const data = await response.json();
+let postsPage = 1;
 
-        const draftsList = document.getElementById('draftsList');
-        const publishedList = document.getElementById('publishedList');
+function renderPostItem(post) {
+    const date = post.date ? post.date.slice(0, 10) : '';
+    const tagText = post.tags.length ? ` · ${post.tags.join(', ')}` : '';
+    return `<li data-filename="${escapeHtml(post.filename)}">
+        ${escapeHtml(post.title)}
+        <span class="post-meta">${escapeHtml(date)} · ${post.word_count} words${escapeHtml(tagText)}</span>
+    </li>`;
+}
 
-        if (data.drafts.length === 0) {
-            draftsList.innerHTML = '<li class="empty">No drafts</li>';
-        } else {
-            draftsList.innerHTML = data.drafts.map(post =>
-                `<li data-filename="${post.filename}">${post.filename}</li>`
-            ).join('');
-        }
+let postsSearchTimeout = null;
+let postsSearchSeq = 0;
 
-        if (data.posts.length === 0) {
-            publishedList.innerHTML = '<li class="empty">No published posts</li>';
-        } else {
-            publishedList.innerHTML = data.posts.map(post =>
-                `<li data-filename="${post.filename}">${post.filename}</li>`
-            ).join('');
-        }
-
-        // Add click handlers
-        document.querySelectorAll('.posts-list li[data-filename]').forEach(li => {
-            li.addEventListener('click', () => {
-                if (hasUnsavedChanges) {
-                    showConfirm(
-                        'Discard changes?',
-                        'You have unsaved changes. Load another post anyway?',
-                        () => loadPost(li.dataset.filename)
-                    );
-                } else {
-                    loadPost(li.dataset.filename);
-                }
-            });
+function fillPostLists(data, append) {
+    const draftsList = document.getElementById('draftsList');
+    const publishedList = document.getElementById('publishedList');
+    if (!append) {
+        draftsList.innerHTML = '';
+        publishedList.innerHTML = '';
+    }
+
+    draftsList.insertAdjacentHTML('beforeend', data.drafts.map(renderPostItem).join(''));
+    publishedList.insertAdjacentHTML('beforeend', data.posts.map(renderPostItem).join(''));
+
+    if (!draftsList.children.length) {
+        draftsList.innerHTML = '<li class="empty">No drafts</li>';
+    }
+    if (!publishedList.children.length) {
+        publishedList.innerHTML = '<li class="empty">No published posts</li>';
+    }
+}
+
+// Full-text search replaces the lists with ranked matches; clearing the box restores the catalogue view
+async function searchPosts(query) {
+    const seq = ++postsSearchSeq;
+    const response = await fetch(`/search?${new URLSearchParams({ q: query })}`);
+    const data = await response.json();
+    if (seq !== postsSearchSeq) return;  // A newer query is on its way
+
+    fillPostLists(data, false);
+    document.getElementById('postsMore').classList.remove('visible');
+}
+
+// Fetch one page of the post catalogue; later pages are appended to the lists
+async function fetchPosts(page) {
+    const query = document.getElementById('postsSearch').value.trim();
+    if (query) {
+        return searchPosts(query);
+    }
+    postsSearchSeq++;
+
+    const [sort, order] = document.getElementById('postsSort').value.split(':');
+    const tagSelect = document.getElementById('postsTag');
+    const params = new URLSearchParams({ sort, order, page, per_page: 50 });
+    if (tagSelect.value) params.set('tag', tagSelect.value);
+
+    const response = await fetch(`/posts?${params}`);
+    const data = await response.json();
+    postsPage = data.page;
+
+    if (page === 1) {
+        draftsList.innerHTML = '';
+        publishedList.innerHTML = '';
+
+        const selected = tagSelect.value;
+        tagSelect.innerHTML = '<option value="">All tags</option>' + data.tags.map(t =>
+            `<option value="${escapeHtml(t.tag)}">${escapeHtml(t.tag)} (${t.count})</option>`
+        ).join('');
+        tagSelect.value = selected;
+    }
+
+    fillPostLists(data, page > 1);
+    document.getElementById('postsMore').classList.toggle('visible', data.page < data.pages);
+}
+
+function initPostsPicker() {
+    document.getElementById('postsTag').addEventListener('change', () => fetchPosts(1));
+    document.getElementById('postsSort').addEventListener('change', () => fetchPosts(1));
+    document.getElementById('postsMore').addEventListener('click', () => fetchPosts(postsPage + 1));
+    document.getElementById('postsSearch').addEventListener('input', () => {
+        clearTimeout(postsSearchTimeout);
+        postsSearchTimeout = setTimeout(() => fetchPosts(1), 150);
+    });
+
+    // Delegated, so items added by later pages work too
+    document.querySelectorAll('.posts-list').forEach(list => {
+        list.addEventListener('click', (e) => {
+            const li = e.target.closest('li[data-filename]');
+            if (!li) return;
+            if (hasUnsavedChanges) {
+                showConfirm(
+                    'Discard changes?',
+                    'You have unsaved changes. Load another post anyway?',
+                    () => loadPost(li.dataset.filename)
+                );
+            } else {
+                loadPost(li.dataset.filename);
+            }
         });
+    });
+}
 
+async function openPostsModal() {
+    try {
+        await fetchPosts(1);
         postsModal.classList.add('visible');
     } catch (error) {
         showNotification('Error', 'Failed to load posts', 'error');
@@ -527,6 +814,8 @@ async function loadPost(filename) {
         editor.value = data.content;
         tags = data.tags || [];
         isDraft = data.is_draft;
+        currentFile = data.filename;
+        savedVersion = data.version;
 
         renderTags();
         setStatus(isDraft);
@@ -541,7 +830,11 @@ async function loadPost(filename) {
         // Update saved state
         markAsSaved();
 
-        showNotification('Post loaded', `"${data.title}" is ready to edit`, 'success');
+        if (data.warning) {
+            showNotification('Autosave not restored', data.warning, 'warning');
+        } else {
+            showNotification('Post loaded', `"${data.title}" is ready to edit`, 'success');
+        }
     } catch (error) {
         showNotification('Error', 'Failed to load post', 'error');
     }
@@ -577,8 +870,9 @@ async function savePost() {
         return;
     }
 
-    const content = editor.value.trim();
-    if (!content) {
+    const content = editor.value;
+    const title = titleInput.value;
+    if (!content.trim()) {
         showNotification('Validation Error', 'Please enter some content', 'error');
         editor.focus();
         return;
@@ -593,7 +887,8 @@ async function savePost() {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                title: titleInput.value.trim(),
+                filename: currentFile,
+                title: title.trim(),
                 content,
                 tags,
                 is_draft: isDraft
@@ -607,7 +902,9 @@ async function savePost() {
             return;
         }
 
-        markAsSaved();
+        currentFile = data.filename;
+        savedVersion = data.version;
+        markAsSaved(content, title);
 
         const status = isDraft ? 'draft' : 'published';
         showNotification(
@@ -628,6 +925,8 @@ function clearEditor() {
     editor.value = '';
     tags = [];
     isDraft = true;
+    currentFile = null;
+    savedVersion = null;
 
     renderTags();
     setStatus(true);
@@ -691,6 +990,59 @@ function openUploadModal() {
     document.getElementById('uploadZone').classList.remove('uploading');
 }
 
+// SHA-256 of a file as hex, or null where Web Crypto isn't available
+async function hashFile(file) {
+    if (!window.crypto || !crypto.subtle) return null;
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Chunked, resumable upload: files the server already has are not sent again,
+// and an interrupted upload carries on from the server's offset
+async function sendImage(file, onProgress) {
+    const response = await fetch('/upload/session', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, sha256: await hashFile(file) })
+    });
+    let data = await response.json();
+    if (data.error || data.complete) return data;
+
+    const id = data.id;
+    const chunkSize = data.chunk_size;
+    let offset = data.offset;
+    let failures = 0;
+
+    while (true) {
+        onProgress(offset / file.size);
+        try {
+            const chunkResponse = await fetch(`/upload/session/${id}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream', 'Upload-Offset': String(offset) },
+                body: file.slice(offset, offset + chunkSize)
+            });
+            data = await chunkResponse.json();
+            if (chunkResponse.status === 409 && data.offset !== undefined) {
+                offset = data.offset;
+                continue;
+            }
+            if (data.error || data.complete) return data;
+            offset = data.offset;
+            failures = 0;
+        } catch (error) {
+            // Network hiccup: ask where the server got to and resume from there
+            if (++failures > 5) throw error;
+            await new Promise(resolve => setTimeout(resolve, 500 * failures));
+            try {
+                const status = await (await fetch(`/upload/session/${id}`)).json();
+                if (status.offset !== undefined) offset = status.offset;
+            } catch (statusError) {
+                // Still offline; retry with the offset we have
+            }
+        }
+    }
+}
+
 async function uploadImage(file) {
     const uploadZone = document.getElementById('uploadZone');
     const uploadStatus = document.getElementById('uploadStatus');
@@ -698,17 +1050,12 @@ async function uploadImage(file) {
     // Show loading state
     uploadZone.classList.add('uploading');
 
-    const formData = new FormData();
-    formData.append('image', file);
-
     try {
-        const response = await fetch('/upload', {
-            method: 'POST',
-            body: formData
+        const data = await sendImage(file, (fraction) => {
+            uploadStatus.textContent = `Uploading... ${Math.round(fraction * 100)}%`;
+            uploadStatus.className = 'upload-status';
         });
 
-        const data = await response.json();
-
         uploadZone.classList.remove('uploading');
 
         if (data.error) {
@@ -721,23 +1068,58 @@ async function uploadImage(file) {
         const start = editor.selectionStart;
         editor.setRangeText(data.markdown + '\n', start, start, 'end');
 
-        uploadStatus.textContent = `Uploaded: ${data.filename}`;
+        uploadStatus.textContent = data.deduplicated ? `Already uploaded: ${data.filename}` : `Uploaded: ${data.filename}`;
         uploadStatus.className = 'upload-status success';
 
         updatePreview();
         markAsUnsaved();
 
+        if (data.variants === 'queued') {
+            watchImageVariants(data.filename, data.status_url, data.path);
+        }
+
         // Close modal after short delay
         setTimeout(() => {
             uploadModal.classList.remove('visible');
         }, 1000);
     } catch (error) {
         uploadZone.classList.remove('uploading');
-        uploadStatus.textContent = 'Upload failed';
+        uploadStatus.textContent = 'Upload interrupted - choose the file again to resume';
         uploadStatus.className = 'upload-status error';
     }
 }
 
+// Resized/WebP variants are generated in the background; report when they're done
+// and point the inserted snippet at the default-width variant once it exists
+async function watchImageVariants(filename, statusUrl, insertedPath) {
+    for (let attempt = 0; attempt < 60; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        try {
+            const response = await fetch(statusUrl);
+            const data = await response.json();
+
+            if (data.status === 'ready') {
+                if (data.path && data.path !== insertedPath && editor.value.includes(`(${insertedPath})`)) {
+                    const { selectionStart, selectionEnd } = editor;
+                    editor.value = editor.value.split(`(${insertedPath})`).join(`(${data.path})`);
+                    editor.setSelectionRange(selectionStart, selectionEnd);
+                    updatePreview();
+                    markAsUnsaved();
+                }
+                const sizes = data.variants.length ? `${data.variants.length} variants` : 'no variants needed';
+                showNotification('Image ready', `${filename} (${data.width}×${data.height}): ${sizes}`, 'success');
+                return;
+            }
+            if (data.status === 'failed' || data.error) {
+                showNotification('Image variants failed', data.error || filename, 'warning');
+                return;
+            }
+        } catch (error) {
+            return;
+        }
+    }
+}
+
 // Keyboard Shortcuts
 function initKeyboardShortcuts() {
     document.addEventListener('keydown', (e) => {
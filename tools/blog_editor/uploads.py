@@ -0,0 +1,246 @@
+"""
+Content-addressed upload storage
+Uploads are streamed to disk in chunks while their SHA-256 is computed, then
+stored under a name derived from the hash, so an identical file maps to the
+file already on disk. A stored file is never modified afterwards (processed
+copies are separate files), and one whose bytes no longer match its name is
+treated as missing and replaced by the next upload of that content. Large uploads go through resumable sessions: the data
+is appended to a partial file at a client-supplied offset, and a client that
+was cut off asks for the current offset and carries on from there
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+CHUNK_SIZE = 64 * 1024
+SESSION_CHUNK_SIZE = 1024 * 1024    # Bytes per PUT the client is told to send
+HASH_PREFIX = 20                    # Hex digits of the SHA-256 used in file names
+PARTIAL_DIR = '.partial'
+STALE_SESSION_SECONDS = 24 * 60 * 60
+
+# One spelling per format so the same bytes always get the same name
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+
+class UploadError(Exception):
+    """Raised for uploads that can't be accepted; carries the HTTP status"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def normalize_extension(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return EXTENSION_ALIASES.get(ext, ext)
+
+
+def stored_name(digest, ext):
+    return f'{digest[:HASH_PREFIX]}{ext}'
+
+
+def file_digest(path):
+    """SHA-256 of a file on disk, or None if it can't be read"""
+    hasher = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+class UploadSession:
+    """A resumable upload in progress: metadata in <id>.json, bytes in <id>.part"""
+
+    def __init__(self, store, upload_id, meta):
+        self.store = store
+        self.id = upload_id
+        self.meta = meta
+        self.lock = threading.Lock()
+        self.part_path = os.path.join(store.partial_dir, f'{upload_id}.part')
+        self._hasher = None
+        self._hashed = 0
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    def hasher(self):
+        """SHA-256 of the bytes received so far (re-read from disk after a restart)"""
+        offset = self.offset
+        if self._hasher is None or self._hashed != offset:
+            self._hasher = hashlib.sha256()
+            if offset:
+                with open(self.part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        self._hasher.update(chunk)
+            self._hashed = offset
+        return self._hasher
+
+
+class UploadStore:
+    """Stores uploads in images_dir as <sha256 prefix><ext>"""
+
+    def __init__(self, images_dir, max_size):
+        self.images_dir = images_dir
+        self.max_size = max_size
+        self.partial_dir = os.path.join(images_dir, PARTIAL_DIR)
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.remove_stale_sessions()
+
+    def _holds(self, filename, digest):
+        """True if the stored file exists and its bytes still hash to digest"""
+        digest_of_file = file_digest(os.path.join(self.images_dir, filename))
+        return digest_of_file is not None and digest_of_file[:len(digest)] == digest
+
+    def find(self, digest, ext):
+        """Stored file name for content with this hash, if it is on disk with exactly that content"""
+        filename = stored_name(digest, ext)
+        if self._holds(filename, digest):
+            return filename
+        return None
+
+    def _commit(self, temp_path, digest, ext):
+        """Move a fully received temp file into place; returns (filename, created)
+
+        A file already stored under the name is only kept if it still holds
+        these bytes; otherwise (rewritten by an older version of the editor)
+        the received copy replaces it, atomically.
+        """
+        filename = stored_name(digest, ext)
+        target = os.path.join(self.images_dir, filename)
+        if self._holds(filename, digest):
+            os.remove(temp_path)
+            return filename, False
+        os.replace(temp_path, target)
+        return filename, True
+
+    def store_stream(self, stream, filename):
+        """Stream a whole file to disk, hashing as it goes; returns (filename, created)"""
+        ext = normalize_extension(filename)
+        hasher = hashlib.sha256()
+        temp_path = os.path.join(self.partial_dir, f'{uuid.uuid4().hex}.part')
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise UploadError('File too large', 413)
+                    hasher.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return self._commit(temp_path, hasher.hexdigest(), ext)
+
+    # --- Resumable sessions ---
+
+    def start(self, filename, size, digest=None):
+        """Open (or re-open) a session; returns it, or a stored file name if the content is already here
+
+        Sessions for a known hash use the hash as their id, so a client that
+        restarts the same upload resumes the partial file instead of starting over.
+        """
+        if size < 0 or size > self.max_size:
+            raise UploadError('File too large', 413)
+        ext = normalize_extension(filename)
+        if digest:
+            digest = digest.lower()
+            existing = self.find(digest, ext)
+            if existing:
+                return None, existing
+
+        upload_id = digest or uuid.uuid4().hex
+        session = self.get(upload_id)
+        if session is not None:
+            if session.meta['size'] != size or session.meta['ext'] != ext:
+                raise UploadError('Upload does not match the existing session', 409)
+            return session, None
+
+        meta = {'filename': filename, 'ext': ext, 'size': size, 'sha256': digest, 'started': time.time()}
+        with open(os.path.join(self.partial_dir, f'{upload_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        open(os.path.join(self.partial_dir, f'{upload_id}.part'), 'ab').close()
+        session = UploadSession(self, upload_id, meta)
+        with self._lock:
+            self._sessions[upload_id] = session
+        return session, None
+
+    def get(self, upload_id):
+        """Session by id, re-loaded from disk if the server restarted since it began"""
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            return None
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is not None:
+                return session
+            try:
+                with open(os.path.join(self.partial_dir, f'{upload_id}.json'), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                return None
+            session = self._sessions[upload_id] = UploadSession(self, upload_id, meta)
+            return session
+
+    def append(self, session, offset, stream):
+        """Append a chunk at offset; returns (new offset, (filename, created) once the upload is complete)"""
+        with session.lock:
+            current = session.offset
+            if offset != current:
+                raise UploadError('Offset mismatch', 409, offset=current)
+
+            size = session.meta['size']
+            hasher = session.hasher()
+            with open(session.part_path, 'ab') as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    if current + len(chunk) > size:
+                        raise UploadError('More data than the declared size', 400)
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    current += len(chunk)
+                    session._hashed = current
+            if current < size:
+                return current, None
+            return current, self._finish(session, hasher.hexdigest())
+
+    def _finish(self, session, digest):
+        expected = session.meta['sha256']
+        if expected and expected != digest:
+            self.discard(session)
+            raise UploadError('Checksum mismatch, upload discarded', 422)
+        result = self._commit(session.part_path, digest, session.meta['ext'])
+        self.discard(session)
+        return result
+
+    def discard(self, session):
+        with self._lock:
+            self._sessions.pop(session.id, None)
+        for name in (f'{session.id}.part', f'{session.id}.json'):
+            try:
+                os.remove(os.path.join(self.partial_dir, name))
+            except OSError:
+                pass
+
+    def remove_stale_sessions(self):
+        """Delete partial uploads nobody has touched for a day"""
+        cutoff = time.time() - STALE_SESSION_SECONDS
+        for name in os.listdir(self.partial_dir):
+            path = os.path.join(self.partial_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
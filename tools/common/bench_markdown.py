@@ -0,0 +1,77 @@
+"""
+Micro-benchmark for the shared Markdown renderer
+Compares a fresh markdown.markdown() call (the old per-call setup) against a
+pooled converter and a memo hit, using the site's own posts and pages
+
+Usage: python bench_markdown.py [--repeat N] [--rounds N]
+"""
+
+import argparse
+import timeit
+from pathlib import Path
+
+import markdown
+
+from markdown_render import EXTENSIONS, KRAMDOWN_ATTR_RE, MarkdownRenderer
+
+SITE_ROOT = Path(__file__).parent.parent.parent
+
+
+def load_samples():
+    """Markdown bodies of every post and top-level page"""
+    samples = []
+    for path in sorted(SITE_ROOT.glob('_posts/*.md')) + sorted(SITE_ROOT.glob('*/index.md')):
+        text = path.read_text(encoding='utf-8')
+        if text.startswith('---'):
+            text = text.split('---', 2)[2]
+        samples.append(text)
+    return samples or ['# Heading\n\nSome *text* with `code`.\n']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark shared Markdown rendering')
+    parser.add_argument('--repeat', type=int, default=20, help='Renders per sample per round (default: 20)')
+    parser.add_argument('--rounds', type=int, default=5, help='Timing rounds; the fastest is reported (default: 5)')
+    args = parser.parse_args()
+
+    samples = load_samples()
+    renderer = MarkdownRenderer()
+
+    def fresh():
+        for text in samples:
+            markdown.markdown(KRAMDOWN_ATTR_RE.sub(r'{.\1}', text), extensions=EXTENSIONS)
+
+    def pooled():
+        for text in samples:
+            renderer.convert(text)
+
+    def memoized():
+        for text in samples:
+            renderer.render(text)
+
+    memoized()  # warm the memo
+
+    def setup_only():
+        markdown.Markdown(extensions=EXTENSIONS)
+
+    def best(func, number):
+        return min(timeit.repeat(func, number=number, repeat=args.rounds))
+
+    calls = args.repeat * len(samples)
+    results = {
+        'fresh markdown.markdown()': best(fresh, args.repeat),
+        'pooled converter': best(pooled, args.repeat),
+        'memo hit': best(memoized, args.repeat),
+    }
+    setup = best(setup_only, calls) / calls
+
+    print(f"{len(samples)} documents x {args.repeat} renders, best of {args.rounds} rounds")
+    print(f"  converter construction saved per call: {setup * 1000:.3f} ms")
+    baseline = results['fresh markdown.markdown()'] / calls
+    for name, total in results.items():
+        per_call = total / calls
+        print(f"  {name:<28} {per_call * 1000:8.3f} ms/call   {baseline / per_call:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Syntax highlighting for fenced code blocks, shared by the site tools
+Code blocks that name a language are highlighted with Pygments into the
+markup Jekyll's Rouge highlighter produces, and the highlighted HTML is kept
+in a SQLite cache in tools/.cache keyed by language and a hash of the code,
+so an unchanged block is lexed once across requests, restarts and both tools.
+Stylesheets are generated once per style and Pygments version and served as
+files. Without Pygments, code blocks are left as they are
+"""
+
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+HIGHLIGHT_VERSION = 1
+
+# Python-Markdown's fenced_code output for ```lang blocks (other attributes leave a block alone)
+CODE_BLOCK_RE = re.compile(r'<pre><code class="language-([\w#+.-]+)">(.*?)</code></pre>', re.DOTALL)
+CODE_BLOCK_MARKER = '<pre><code class="language-'
+HIGHLIGHTED_MARKER = 'class="highlight"'
+
+# Light style for the site, dark style for its [data-theme="dark"] mode and the editor
+LIGHT_STYLE = 'default'
+DARK_STYLE = 'github-dark'
+DARK_SCOPE = '[data-theme="dark"]'
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
+
+
+def pygments_version():
+    """Installed Pygments version, or None when it isn't installed"""
+    try:
+        import pygments
+    except ImportError:
+        return None
+    return pygments.__version__
+
+
+def code_key(language, code):
+    return f"{language}:{hashlib.sha1(code.encode('utf-8')).hexdigest()}"
+
+
+def stylesheet(light=LIGHT_STYLE, dark=DARK_STYLE, dark_scope=DARK_SCOPE, directory=CACHE_DIR):
+    """Path of the CSS for highlighted blocks, written the first time it's asked for; None without Pygments
+
+    dark styles blocks under dark_scope, or all blocks when dark_scope is empty
+    and there is no light style.
+    """
+    version = pygments_version()
+    if version is None:
+        return None
+    name = hashlib.sha1(repr((HIGHLIGHT_VERSION, version, light, dark, dark_scope)).encode()).hexdigest()[:10]
+    path = os.path.join(directory, f'highlight-{name}.css')
+    if os.path.exists(path):
+        return path
+
+    from pygments.formatters import HtmlFormatter
+    rules = []
+    if light:
+        rules.append(HtmlFormatter(style=light).get_style_defs('.highlight'))
+    if dark:
+        scope = f'{dark_scope} .highlight' if dark_scope else '.highlight'
+        rules.append(HtmlFormatter(style=dark).get_style_defs(scope))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(rules) + '\n')
+    os.replace(temp_path, path)
+    return path
+
+
+def link_stylesheet(page, href):
+    """Add a <link> to the highlighting stylesheet to a page that has highlighted code"""
+    if HIGHLIGHTED_MARKER not in page:
+        return page
+    link = f'<link rel="stylesheet" href="{href}">'
+    index = page.lower().rfind('</head>')
+    if index == -1:
+        return link + page
+    return page[:index] + link + page[index:]
+
+
+class Highlighter:
+    """Highlights the code blocks in rendered HTML, through a memo and a persistent cache"""
+
+    def __init__(self, path=None, memo_size=2048):
+        self.path = path or os.path.join(CACHE_DIR, 'highlight.sqlite3')
+        self.memo_size = memo_size
+        self.version = f'{HIGHLIGHT_VERSION}-{pygments_version()}'
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._local = threading.local()
+        self._lexers = {}
+        self._formatter = None
+        self.hits = 0
+        self.misses = 0
+        if hasattr(os, 'register_at_fork'):
+            # SQLite connections must not be shared with forked children
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+    @property
+    def available(self):
+        return not self.version.endswith('-None')
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = self._local.db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS blocks (key TEXT PRIMARY KEY, version TEXT, html TEXT)')
+        return db
+
+    def _lex(self, language, code):
+        """Highlighted HTML for the code, or None when Pygments has no lexer for the language"""
+        # Imported on first use, so processes served from the caches never load it
+        from pygments import highlight
+        from pygments.formatters import HtmlFormatter
+        from pygments.lexers import get_lexer_by_name
+        from pygments.util import ClassNotFound
+
+        lexer = self._lexers.get(language)
+        if lexer is None:
+            try:
+                lexer = get_lexer_by_name(language, stripnl=False)
+            except ClassNotFound:
+                return None
+            self._lexers[language] = lexer
+        if self._formatter is None:
+            self._formatter = HtmlFormatter(nowrap=True)
+        return highlight(code, lexer, self._formatter)
+
+    def highlight_code(self, language, code):
+        """Highlighted HTML for one block: memo, then the persistent cache, then Pygments"""
+        key = code_key(language, code)
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self.hits += 1
+                return self._memo[key]
+
+        try:
+            db = self._connect()
+            row = db.execute('SELECT html FROM blocks WHERE key = ? AND version = ?', (key, self.version)).fetchone()
+        except sqlite3.Error:
+            db = row = None
+        if row is not None:
+            result = row[0]
+            self.hits += 1
+        else:
+            result = self._lex(language, code)
+            self.misses += 1
+            if db is not None:
+                try:
+                    db.execute('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)', (key, self.version, result))
+                except sqlite3.Error:
+                    pass   # Read-only or locked cache: still highlighted, just not kept
+
+        with self._memo_lock:
+            self._memo[key] = result
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def highlight(self, page):
+        """Replace fenced code blocks that name a known language with highlighted ones"""
+        if not self.available or CODE_BLOCK_MARKER not in page:
+            return page
+
+        def replace(match):
+            language = match.group(1).lower()
+            highlighted = self.highlight_code(language, html.unescape(match.group(2)))
+            if highlighted is None:
+                return match.group(0)
+            return (f'<div class="language-{language} highlighter-rouge"><div class="highlight">'
+                    f'<pre class="highlight"><code>{highlighted}</code></pre></div></div>')
+
+        return CODE_BLOCK_RE.sub(replace, page)
@@ -0,0 +1,109 @@
+"""
+Shared Markdown rendering for the site tools (website_tester and blog_editor)
+Keeps a pool of pre-built Markdown converters that are reset() between uses,
+and memoizes rendered HTML by a hash of the source, so both tools render
+posts identically and never rebuild the extension stack per call. Fenced
+code is syntax highlighted (highlight.py) as part of rendering
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from highlight import Highlighter
+
+# One extension set for the live site preview and the editor preview
+EXTENSIONS = ['fenced_code', 'tables', 'toc', 'nl2br', 'attr_list']
+
+# Jekyll/kramdown attribute lists like {: .btn-primary} -> Python-Markdown's {.btn-primary}
+KRAMDOWN_ATTR_RE = re.compile(r'\{:\s*\.([^}]+)\}')
+
+
+def source_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class MarkdownRenderer:
+    """Thread-safe pool of reusable converters with an LRU memo of rendered HTML"""
+
+    def __init__(self, extensions=None, pool_size=4, memo_size=1024, highlighter=None):
+        self.extensions = list(EXTENSIONS if extensions is None else extensions)
+        self.highlighter = highlighter
+        self.pool_size = pool_size
+        self.memo_size = memo_size
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        # Optional persistent memo (get/put by source hash) behind the in-memory one
+        self.store = None
+        self.hits = 0
+        self.misses = 0
+
+    def _acquire(self):
+        with self._pool_lock:
+            if self._pool:
+                return self._pool.pop()
+        # Imported on first use, so processes served from the persistent memo never load it
+        import markdown
+        return markdown.Markdown(extensions=self.extensions)
+
+    def _release(self, md):
+        md.reset()
+        with self._pool_lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(md)
+
+    def convert(self, text):
+        """Render Markdown with a pooled converter, bypassing the memo"""
+        text = KRAMDOWN_ATTR_RE.sub(r'{.\1}', text)
+        md = self._acquire()
+        try:
+            html = md.convert(text)
+        finally:
+            self._release(md)
+        if self.highlighter is not None:
+            html = self.highlighter.highlight(html)
+        return html
+
+    @property
+    def version(self):
+        """What the rendered HTML depends on besides the source, for tagging persisted output"""
+        return repr((self.extensions, self.highlighter.version if self.highlighter else None))
+
+    def render(self, text):
+        """Render Markdown, returning memoized HTML when the same source was seen before"""
+        key = source_hash(text)
+        with self._memo_lock:
+            html = self._memo.get(key)
+            if html is not None:
+                self._memo.move_to_end(key)
+                self.hits += 1
+                return html
+
+        html = self.store.get(key) if self.store is not None else None
+        if html is None:
+            html = self.convert(text)
+            if self.store is not None:
+                self.store.put(key, html)
+
+        with self._memo_lock:
+            self.misses += 1
+            self._memo[key] = html
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._memo_lock:
+            self._memo.clear()
+
+
+# Default renderer shared by everything in a process
+renderer = MarkdownRenderer(highlighter=Highlighter())
+
+
+def render_markdown(text):
+    """Render Markdown to HTML with the shared, memoized renderer"""
+    return renderer.render(text)
@@ -0,0 +1,219 @@
+"""
+Full-text search over posts, shared by the site tools
+An inverted index of title, tag and body terms with BM25 ranking. Each tool
+feeds it the posts it has already parsed; sync() re-indexes only documents
+whose (mtime, size) signature changed and the index is saved as compressed
+JSON, so a restart doesn't re-read unchanged posts and queries never touch
+the post files
+"""
+
+import bisect
+import json
+import math
+import os
+import re
+import threading
+import zlib
+
+INDEX_VERSION = 1
+
+# Term weights per field, and BM25 parameters
+FIELD_WEIGHTS = {'title': 3, 'tags': 2, 'body': 1}
+K1 = 1.2
+B = 0.75
+
+TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+MARKDOWN_NOISE_RE = re.compile(r'!?\[([^\]]*)\]\([^)]*\)|<[^>]+>|\{[%{].*?[%}]\}')
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from has have in is it its of on or that the this to was were will with'.split()
+)
+
+
+def stem(term):
+    """Plural folding, enough that 'posts' finds 'post' and 'queries' finds 'query'"""
+    if len(term) > 4 and term.endswith('ies'):
+        return term[:-3] + 'y'
+    if len(term) > 3 and term.endswith('s') and not term.endswith(('ss', 'us', 'is')):
+        return term[:-1]
+    return term
+
+
+def tokenize(text):
+    """Lower-cased, stemmed terms of a text (links and images keep their text, tags are dropped)"""
+    text = MARKDOWN_NOISE_RE.sub(lambda m: m.group(1) or ' ', text or '')
+    return [stem(token) for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class SearchIndex:
+    """Weighted term frequencies per document plus the inverted postings built from them"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._docs = {}       # key -> {'sig', 'length', 'terms': {term: weighted tf}, 'meta'}
+        self._postings = {}   # term -> {key: weighted tf}
+        self._terms = None    # Sorted term list for prefix matching, rebuilt on demand
+        self._total_length = 0
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- Persistence ---
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return
+        if data.get('version') != INDEX_VERSION:
+            return
+        for key, doc in data['docs'].items():
+            doc['sig'] = tuple(doc['sig']) if doc['sig'] is not None else None
+            self._add(key, doc)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {'version': INDEX_VERSION, 'docs': self._docs}
+            payload = zlib.compress(json.dumps(data, separators=(',', ':'), default=str).encode('utf-8'), 6)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, self.path)
+
+    # --- Updates ---
+
+    def _add(self, key, doc):
+        self._docs[key] = doc
+        self._total_length += doc['length']
+        for term, tf in doc['terms'].items():
+            self._postings.setdefault(term, {})[key] = tf
+        self._terms = None
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        self._total_length -= doc['length']
+        for term in doc['terms']:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+        self._terms = None
+
+    def update(self, key, signature, fields, meta=None):
+        """Index (or re-index) one document from its title, tags and body"""
+        terms = {}
+        length = 0
+        for field, weight in FIELD_WEIGHTS.items():
+            value = fields.get(field) or ''
+            if isinstance(value, (list, tuple)):
+                value = ' '.join(str(v) for v in value)
+            tokens = tokenize(str(value))
+            length += len(tokens)
+            for token in tokens:
+                terms[token] = terms.get(token, 0) + weight
+        with self._lock:
+            self._remove(key)
+            self._add(key, {'sig': signature, 'length': length, 'terms': terms, 'meta': meta or {}})
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def sync(self, signatures, load):
+        """Match the index to the current documents
+
+        signatures maps each document key to its current signature; load(key)
+        returns (fields, meta) for a new or changed document, or None to skip
+        it. Documents no longer listed are dropped. Saves and returns the
+        number of changes when anything changed.
+        """
+        changed = 0
+        for key in [key for key in self._docs if key not in signatures]:
+            self.remove(key)
+            changed += 1
+        for key, signature in signatures.items():
+            doc = self._docs.get(key)
+            if doc is not None and doc['sig'] == signature:
+                continue
+            loaded = load(key)
+            if loaded is None:
+                # Remember unreadable files so they are only retried once they change
+                self.update(key, signature, {}, None)
+            else:
+                self.update(key, signature, *loaded)
+            changed += 1
+        if changed:
+            self.save()
+        return changed
+
+    # --- Queries ---
+
+    def _expand(self, term, prefix):
+        """Index terms matching a query term: itself, or every term it starts (for the word being typed)"""
+        if not prefix or len(term) < 2:
+            return [term] if term in self._postings else []
+        if self._terms is None:
+            self._terms = sorted(self._postings)
+        start = bisect.bisect_left(self._terms, term)
+        matches = []
+        for candidate in self._terms[start:]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+
+    def search(self, query, limit=20, match=None):
+        """Documents containing every query term (the last one as a prefix), best BM25 score first
+
+        match(meta) can exclude documents. Returns [{'key', 'score', **meta}].
+        """
+        words = [word for word in TOKEN_RE.findall((query or '').lower()) if word not in STOP_WORDS]
+        terms = [stem(word) for word in words]
+        if not terms:
+            return []
+        typing = not (query or '').endswith(' ')
+
+        with self._lock:
+            count = len(self._docs)
+            if not count:
+                return []
+            average = (self._total_length / count) or 1
+            scores = None
+            for i, term in enumerate(terms):
+                prefix = typing and i == len(terms) - 1
+                # A prefix query also matches the unstemmed form the user is typing
+                expanded = set(self._expand(term, prefix))
+                if prefix and words[-1] != term:
+                    expanded.update(self._expand(words[-1], True))
+                term_scores = {}
+                for index_term in expanded:
+                    postings = self._postings[index_term]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, tf in postings.items():
+                        norm = K1 * (1 - B + B * self._docs[key]['length'] / average)
+                        score = idf * tf * (K1 + 1) / (tf + norm)
+                        term_scores[key] = max(term_scores.get(key, 0), score)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {key: scores[key] + s for key, s in term_scores.items() if key in scores}
+                if not scores:
+                    return []
+
+            results = []
+            for key, score in scores.items():
+                meta = self._docs[key]['meta']
+                if match is None or match(meta):
+                    results.append((score, key, meta))
+
+        results.sort(key=lambda r: (-r[0], r[1]))
+        return [dict(meta, key=key, score=round(score, 4)) for score, key, meta in results[:limit]]
@@ -3,443 +3,794 @@ Jekyll Site Preview - Local development server for Jekyll sites
 Properly renders the site with layout, CSS, and Liquid template processing
 """
 
+import hashlib
 import os
-import re
-import yaml
-import markdown
-import frontmatter
-from flask import Flask, send_from_directory, Response, abort
+import sys
+from flask import Flask, send_file, Response, abort, request, jsonify
+from werkzeug.security import safe_join
 from pathlib import Path
 from datetime import datetime
 
+# Shared modules (Markdown rendering) live in tools/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))
+
+import feeds
+import highlight
+import liquid
+import livereload
+import markdown_render
+import pagination
+import postprocess
+import posts
+from cache import RenderCache, file_signature
+from livereload import LiveReload
+from posts import PostIndex
+from routes import RouteTable, skipped
+from search_index import SearchIndex
+from static_files import CACHE_CONTROL, StaticFiles
+from stats import Stats, hit_rate, server_timing
+from warm_cache import WarmCache, code_version
+from watcher import FileWatcher
+
 app = Flask(__name__)
+app.config['LIVE_RELOAD'] = False  # Turned on when running the preview server
+app.config['OPTIMIZE_HTML'] = False  # Turned on with --optimize
 
-# Site root (tools/website_tester -> site root)
-SITE_ROOT = Path(__file__).parent.parent.parent
+# Site root (tools/website_tester -> site root); JEKYLL_SITE_ROOT points the tool at another site
+SITE_ROOT = Path(os.environ.get('JEKYLL_SITE_ROOT') or Path(__file__).resolve().parent.parent.parent).resolve()
 LAYOUTS_DIR = SITE_ROOT / '_layouts'
 INCLUDES_DIR = SITE_ROOT / '_includes'
 ASSETS_DIR = SITE_ROOT / 'assets'
 POSTS_DIR = SITE_ROOT / '_posts'
 DRAFTS_DIR = SITE_ROOT / '_drafts'
+CACHE_DIR = Path(__file__).resolve().parent.parent / '.cache'
+SITE_KEY = hashlib.sha1(str(SITE_ROOT).encode()).hexdigest()[:10]
+
+# Files under the site root that serve_page returns as-is, with their content types
+DIRECT_FILE_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.svg': 'image/svg+xml',
+    '.ico': 'image/x-icon',
+    '.webp': 'image/webp',
+    '.xml': 'application/xml',
+    '.txt': 'text/plain',
+    '.pdf': 'application/pdf',
+}
+
+# Parsed config, posts, template sources and Markdown kept on disk between runs,
+# so a fresh process serves its first pages without re-parsing the site
+warm_cache = WarmCache(str(CACHE_DIR / f'warm-{SITE_KEY}'))
+markdown_render.renderer.store = warm_cache.section(
+    'markdown', code_version(markdown_render, highlight) + markdown_render.renderer.version, limit=4096)
+
+# Stylesheet for highlighted code blocks, linked from pages that have them (on the
+# live site the theme's Rouge styles cover the same markup)
+HIGHLIGHT_CSS_PATH = '/__highlight.css'
 
-# Load Jekyll config
+# Jekyll config, reloaded whenever _config.yml changes
 config = {}
 config_path = SITE_ROOT / '_config.yml'
-if config_path.exists():
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f) or {}
+config_signature = None
 
 # Site variables
-SITE = {
-    'title': config.get('title', 'My Site'),
-    'description': config.get('description', ''),
-    'url': 'http://localhost:5001',  # Local preview URL
-    'baseurl': '',
-    'logo': config.get('logo', ''),
-    'author': config.get('author', ''),
-    'lang': config.get('lang', 'en-US'),
-    'github': {
-        'is_user_page': True,
-        'owner_url': 'https://github.com/' + config.get('author', '').replace(' ', ''),
-        'repository_name': config.get('title', ''),
-        'build_revision': 'preview'
-    }
-}
+SITE = {}
+
+
+def load_config():
+    """Load _config.yml into config and SITE, re-reading it only when the file has changed"""
+    global config_signature
+    signature = file_signature(config_path)
+    if signature == config_signature:
+        return
+
+    loaded = {}
+    store = warm_cache.section('config')
+    stored = store.get('config')
+    if stored is not None and stored[0] == signature:
+        loaded = stored[1]
+    elif signature is not None:
+        # Imported on first use: warm starts take the parsed config from the cache
+        import yaml
+        with open(config_path, 'r', encoding='utf-8') as f:
+            loaded = yaml.safe_load(f) or {}
+        store.put('config', (signature, loaded))
+
+    config.clear()
+    config.update(loaded)
+    SITE.clear()
+    SITE.update({
+        'title': config.get('title', 'My Site'),
+        'description': config.get('description', ''),
+        'url': 'http://localhost:5001',  # Local preview URL
+        'baseurl': '',
+        'logo': config.get('logo', ''),
+        'author': config.get('author', ''),
+        'lang': config.get('lang', 'en-US'),
+        'github': {
+            'is_user_page': True,
+            'owner_url': 'https://github.com/' + config.get('author', '').replace(' ', ''),
+            'repository_name': config.get('title', ''),
+            'build_revision': 'preview'
+        }
+    })
+    config_signature = signature
+
+
+load_config()
+
+# Parsed posts, refreshed incrementally by mtime/size
+post_index = PostIndex(POSTS_DIR, warm_cache.section('posts', code_version(posts)))
+drafts_index = PostIndex(DRAFTS_DIR, warm_cache.section('drafts', code_version(posts)))
+
+# Full-text index of posts and drafts, kept on disk per site and updated from the post indexes
+search_index = SearchIndex(str(CACHE_DIR / f'search-{SITE_KEY}.idx'))
+
+
+def posts_version():
+    post_index.refresh()
+    return post_index.version
+
+
+# Rendered pages per route, invalidated when any file they were built from changes
+render_cache = RenderCache()
+render_cache.register_source('posts', posts_version)
+
+# Per-stage timers and per-route latency, reported in Server-Timing headers and at /__stats
+stats = Stats()
+STATS_ENDPOINT = '/__stats'
+
+
+# Static files with their compressed variants, refreshed when a file changes
+static_files = StaticFiles()
+
+# Rendered post bodies for feed entries, so a post change re-renders only its own entry
+feed_entries = RenderCache()
+
+# Post list items (a for loop's body rendered for one post), so index pages re-render only changed posts
+post_fragments = RenderCache()
+
+
+# Image dimensions and the parsed site stylesheet for --optimize
+image_index = postprocess.ImageIndex(warm_cache.section('images', code_version(postprocess)))
+CRITICAL_CSS_PATH = ASSETS_DIR / 'css' / 'custom.css'
+stylesheets = {}   # path -> (signature, Stylesheet)
+
 
+# Browsers connected to the live reload stream
+live_reload = LiveReload()
 
+
+def on_site_change(paths):
+    """Update routes and posts, invalidate cached renders built from the changed files and tell browsers to refresh"""
+    invalidate_renders(paths)
+    apply_site_change(paths)
+
+
+def invalidate_renders(paths):
+    """Drop cached pages built from the changed files (in pre-fork mode, once for every worker)"""
+    render_cache.invalidate_files(paths)
+    if any(POSTS_DIR in path.parents for path in paths):
+        render_cache.invalidate_source('posts')
+
+
+def apply_site_change(paths):
+    """Update this process's own state for changed files: config, routes, post indexes and live reload"""
+    if config_path in paths:
+        load_config()
+        route_table.rebuild(config.get('exclude', []))
+    else:
+        route_table.update(paths)
+    if any(DRAFTS_DIR in path.parents for path in paths):
+        drafts_index.mark_changed()
+    if any(POSTS_DIR in path.parents for path in paths):
+        post_index.mark_changed()
+
+    # Stylesheet-only changes are hot-swapped; anything else reloads the page
+    if all(path.suffix == '.css' for path in paths):
+        for path in paths:
+            live_reload.publish('css', '/' + path.relative_to(SITE_ROOT).as_posix())
+    else:
+        live_reload.publish('reload')
+
+
+def track_template(template):
+    """Record a template as a dependency of the page being rendered"""
+    if template.path is not None:
+        render_cache.depend(template.path)
+    if template.uses('site.posts'):
+        render_cache.depend_on('posts')
+    return template
+
+
+@stats.timed('load_layout')
 def load_layout(layout_name='default'):
-    """Load a layout file from _layouts directory"""
+    """Load a compiled layout from _layouts directory"""
     layout_path = LAYOUTS_DIR / f'{layout_name}.html'
-    if layout_path.exists():
-        with open(layout_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    return '<html><body>{{ content }}</body></html>'
+    layout = env.get_template(layout_path)
+    if layout is None:
+        # Record the missing file so creating it invalidates cached pages
+        render_cache.depend(layout_path)
+        return FALLBACK_LAYOUT
+    return track_template(layout)
 
 
+@stats.timed('load_include')
 def load_include(include_name):
-    """Load an include file from _includes directory"""
+    """Load a compiled include from _includes directory"""
     include_path = INCLUDES_DIR / include_name
-    if include_path.exists():
-        with open(include_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    return ''
+    include = env.get_template(include_path)
+    if include is None:
+        render_cache.depend(include_path)
+        return None
+    return track_template(include)
+
+
+def render_seo(ctx, markup):
+    """Render the {% seo %} tag - basic title and description meta tags"""
+    page = ctx.get('page') or {}
+    title = page.get('title', SITE['title'])
+    description = page.get('description', SITE['description'])
+    return f'''<title>{title}</title>
+    <meta name="description" content="{description}">
+    <meta property="og:title" content="{title}">
+    <meta property="og:description" content="{description}">'''
+
+
+def post_fragment(loop, item, render):
+    """A loop body rendered for one post, re-rendered only when that post's file changes"""
+    file_path = item.get('file_path') if isinstance(item, dict) else None
+    if file_path is None:
+        return None
+    key = f'{loop.key}:{file_path}'
+    entry = post_fragments.get(key)
+    if entry is None:
+        with render_cache.recording() as deps:
+            render_cache.depend(file_path)
+            body = render()
+        entry = post_fragments.put(key, body, deps)
+    else:
+        for path in entry.files:
+            render_cache.depend(path)
+    return entry.body
+
+
+# Compiled templates are cached by path and mtime inside the environment
+env = liquid.Environment(
+    store=warm_cache.section('templates', code_version(liquid)),
+    include_loader=load_include,
+    fragment=post_fragment,
+    filters={'markdownify': lambda value: render_markdown(str(value or ''))},
+    tags={
+        'seo': render_seo,
+        'feed_meta': lambda ctx, markup: feeds.feed_meta(SITE),
+    }
+)
+FALLBACK_LAYOUT = env.from_string('<html><body>{{ content }}</body></html>')
 
 
+def page_permalink(file_path):
+    try:
+        template = env.get_template(file_path)
+    except (OSError, UnicodeDecodeError):
+        return None
+    return template.front_matter.get('permalink') if template is not None else None
+
+
+# URL -> page or file under the site root, built at startup and updated from watcher notifications
+route_table = RouteTable(SITE_ROOT, DIRECT_FILE_TYPES, page_permalink)
+route_table.rebuild(config.get('exclude', []))
+
+
+def start_watcher():
+    """Watch the site; from then on routes and posts are updated from change notifications, not disk checks"""
+    watcher = FileWatcher(SITE_ROOT, on_site_change, ignore=['tools']).start()
+    follow_notifications()
+    return watcher
+
+
+def follow_notifications():
+    """Trust on_site_change() calls for routes and posts from now on, instead of checking the disk"""
+    route_table.watched = post_index.watched = drafts_index.watched = True
+    # Catch anything that changed before notifications started
+    route_table.rebuild(config.get('exclude', []))
+    post_index.mark_changed()
+    drafts_index.mark_changed()
+
+
+@stats.timed('load_posts')
 def load_posts():
-    """Load all posts from _posts directory"""
-    posts = []
-
-    if POSTS_DIR.exists():
-        for post_file in sorted(POSTS_DIR.glob('*.md'), reverse=True):
-            try:
-                with open(post_file, 'r', encoding='utf-8') as f:
-                    post = frontmatter.load(f)
-
-                # Parse date from filename (YYYY-MM-DD-title.md)
-                filename = post_file.stem
-                date_match = re.match(r'(\d{4}-\d{2}-\d{2})-(.+)', filename)
-
-                if date_match:
-                    date_str = date_match.group(1)
-                    slug = date_match.group(2)
-                    post_date = datetime.strptime(date_str, '%Y-%m-%d')
-                else:
-                    post_date = datetime.now()
-                    slug = filename
-
-                # Get excerpt (first paragraph)
-                content_lines = post.content.strip().split('\n\n')
-                excerpt = content_lines[0] if content_lines else ''
-                # Remove markdown headers from excerpt
-                excerpt = re.sub(r'^#+\s*', '', excerpt)
-
-                posts.append({
-                    'title': post.metadata.get('title', slug.replace('-', ' ').title()),
-                    'date': post.metadata.get('date', post_date),
-                    'url': f'/blog/{date_str}-{slug}',
-                    'excerpt': excerpt,
-                    'tags': post.metadata.get('tags', []),
-                    'content': post.content,
-                    'file_path': post_file
-                })
-            except Exception as e:
-                print(f"Error loading post {post_file}: {e}")
-
-    return posts
-
-
-def process_liquid(content, page=None):
-    """Process Liquid template tags"""
+    """Load all posts from _posts directory (served from the in-memory post index)"""
+    return post_index.posts()
+
+
+def site_variables():
+    """Build the `site` Liquid variable, including the post list"""
+    load_config()
+    render_cache.depend(config_path)
+    site = dict(SITE)
+    site['posts'] = load_posts()
+    site['time'] = datetime.now()
+    return site
+
+
+@stats.timed('process_liquid')
+def process_liquid(template, page=None, content=None, layout=None, site=None):
+    """Render a compiled Liquid template (or template source) with site and page variables"""
     if page is None:
         page = {}
+    if site is None:
+        site = site_variables()
+
+    return env.render(template, {
+        'site': site,
+        'page': page,
+        'layout': layout or {},
+        'content': page.get('content', '') if content is None else content,
+        # Set on the page jekyll-paginate paginates, as Jekyll does through page.pager
+        'paginator': page.get('paginator'),
+    })
+
+
+def apply_layouts(content, page_data, site=None):
+    """Wrap rendered content in its layout chain (layout -> parent layout -> ...)"""
+    if site is None:
+        site = site_variables()
+    layout_name = page_data.get('layout', 'default')
+    seen = set()
 
-    # Load posts for loops
-    posts = load_posts()
-
-    # Process for loops: {% for post in site.posts %}...{% endfor %}
-    def process_for_loop(match):
-        loop_content = match.group(1)
-        result = []
-
-        for post in posts:
-            item_html = loop_content
-
-            # Format date
-            if isinstance(post['date'], datetime):
-                formatted_date = post['date'].strftime('%B %d, %Y')
-            else:
-                formatted_date = str(post['date'])
-
-            # Replace post variables
-            item_html = re.sub(r'\{\{\s*post\.title\s*\}\}', post['title'], item_html)
-            item_html = re.sub(r'\{\{\s*post\.url\s*\}\}', post['url'], item_html)
-            item_html = re.sub(r'\{\{\s*post\.date\s*\|\s*date:\s*"[^"]*"\s*\}\}', formatted_date, item_html)
-            item_html = re.sub(r'\{\{\s*post\.date\s*\}\}', formatted_date, item_html)
-            item_html = re.sub(r'\{\{\s*post\.excerpt\s*\}\}', post['excerpt'], item_html)
-
-            result.append(item_html)
-
-        return ''.join(result)
-
-    content = re.sub(
-        r'\{%\s*for\s+post\s+in\s+site\.posts\s*%\}(.*?)\{%\s*endfor\s*%\}',
-        process_for_loop,
-        content,
-        flags=re.DOTALL
-    )
-
-    # Process if site.posts.size == 0
-    if len(posts) == 0:
-        content = re.sub(
-            r'\{%\s*if\s+site\.posts\.size\s*==\s*0\s*%\}(.*?)\{%\s*endif\s*%\}',
-            r'\1',
-            content,
-            flags=re.DOTALL
-        )
-    else:
-        content = re.sub(
-            r'\{%\s*if\s+site\.posts\.size\s*==\s*0\s*%\}.*?\{%\s*endif\s*%\}',
-            '',
-            content,
-            flags=re.DOTALL
-        )
-
-    # Process includes: {% include filename %}
-    def replace_include(match):
-        include_name = match.group(1).strip()
-        return load_include(include_name)
-    content = re.sub(r'\{%\s*include\s+([^\s%]+)\s*%\}', replace_include, content)
-
-    # Process seo tag - generate basic SEO
-    seo_html = f'''<title>{page.get('title', SITE['title'])}</title>
-    <meta name="description" content="{page.get('description', SITE['description'])}">
-    <meta property="og:title" content="{page.get('title', SITE['title'])}">
-    <meta property="og:description" content="{page.get('description', SITE['description'])}">'''
-    content = re.sub(r'\{%\s*seo\s*%\}', seo_html, content)
-
-    # Process feed_meta
-    content = re.sub(r'\{%\s*feed_meta\s*%\}', '', content)
-
-    # Process if/endif blocks for site.logo
-    if SITE['logo']:
-        # Keep content inside if site.logo block
-        content = re.sub(
-            r'\{%\s*if\s+site\.logo\s*%\}(.*?)\{%\s*endif\s*%\}',
-            r'\1',
-            content,
-            flags=re.DOTALL
-        )
-    else:
-        # Remove if site.logo block entirely
-        content = re.sub(
-            r'\{%\s*if\s+site\.logo\s*%\}.*?\{%\s*endif\s*%\}',
-            '',
-            content,
-            flags=re.DOTALL
-        )
-
-    # Process if/endif for site.github.is_user_page
-    content = re.sub(
-        r'\{%\s*if\s+site\.github\.is_user_page\s*%\}(.*?)\{%\s*endif\s*%\}',
-        r'\1',
-        content,
-        flags=re.DOTALL
-    )
-
-    # Remove any remaining if/endif blocks
-    content = re.sub(r'\{%\s*if\s+.*?%\}', '', content)
-    content = re.sub(r'\{%\s*endif\s*%\}', '', content)
-
-    # Process variable outputs with filters
-
-    # Handle CSS paths: {{ "/assets/css/style.css?v=" | append: site.github.build_revision | relative_url }}
-    content = re.sub(
-        r'\{\{\s*"/assets/css/style\.css\?v="[^}]*\}\}',
-        '/assets/css/style.css',
-        content
-    )
-    content = re.sub(
-        r'\{\{\s*"/assets/css/custom\.css\?v="[^}]*\}\}',
-        '/assets/css/custom.css',
-        content
-    )
-
-    # Handle feed.xml path
-    content = re.sub(
-        r'\{\{\s*"/feed\.xml"\s*\|\s*relative_url\s*\}\}',
-        '/feed.xml',
-        content
-    )
-
-    # Handle root path
-    content = re.sub(
-        r'\{\{\s*"/"\s*\|\s*absolute_url\s*\}\}',
-        '/',
-        content
-    )
-
-    # Site variables
-    content = re.sub(r'\{\{\s*site\.title\s*\}\}', SITE['title'], content)
-    content = re.sub(r'\{\{\s*site\.description\s*\}\}', SITE['description'], content)
-    content = re.sub(r'\{\{\s*site\.url\s*\}\}', SITE['url'], content)
-    content = re.sub(r'\{\{\s*site\.baseurl\s*\}\}', SITE['baseurl'], content)
-    content = re.sub(r'\{\{\s*site\.author\s*\}\}', SITE['author'], content)
-    content = re.sub(r'\{\{\s*site\.lang\s*\}\}', SITE['lang'], content)
-
-    # Site logo with relative_url filter
-    content = re.sub(
-        r'\{\{\s*site\.logo\s*\|\s*relative_url\s*\}\}',
-        SITE['logo'],
-        content
-    )
-    content = re.sub(r'\{\{\s*site\.logo\s*\}\}', SITE['logo'], content)
-
-    # GitHub variables
-    content = re.sub(r'\{\{\s*site\.github\.owner_url\s*\}\}', SITE['github']['owner_url'], content)
-    content = re.sub(r'\{\{\s*site\.github\.repository_name\s*\}\}', SITE['github']['repository_name'], content)
-    content = re.sub(r'\{\{\s*site\.github\.build_revision\s*\}\}', SITE['github']['build_revision'], content)
-
-    # Fallback patterns with default
-    content = re.sub(
-        r'\{\{\s*site\.title\s*\|\s*default:\s*site\.github\.repository_name\s*\}\}',
-        SITE['title'],
-        content
-    )
-    content = re.sub(
-        r'\{\{\s*site\.description\s*\|\s*default:\s*site\.github\.project_tagline\s*\}\}',
-        SITE['description'],
-        content
-    )
-    content = re.sub(
-        r'\{\{\s*site\.lang\s*\|\s*default:\s*"en-US"\s*\}\}',
-        SITE['lang'],
-        content
-    )
-
-    # Page variables
-    content = re.sub(r'\{\{\s*page\.title\s*\}\}', str(page.get('title', '')), content)
-    content = re.sub(r'\{\{\s*page\.date\s*\}\}', str(page.get('date', '')), content)
-    content = re.sub(r'\{\{\s*page\.description\s*\}\}', str(page.get('description', '')), content)
-
-    # Content placeholder
-    content = re.sub(r'\{\{\s*content\s*\}\}', page.get('content', ''), content)
-
-    # Clean up any remaining unprocessed Liquid
-    content = re.sub(r'\{%[^%]*%\}', '', content)
-    content = re.sub(r'\{\{[^}]*\}\}', '', content)
+    # Handle layout: none, and stop on layout cycles
+    while layout_name is not None and layout_name != 'none' and layout_name not in seen:
+        seen.add(layout_name)
+        layout = load_layout(layout_name)
+        content = process_liquid(layout, page_data, content=content, layout=layout.front_matter, site=site)
+        layout_name = layout.front_matter.get('layout')
 
     return content
 
 
+def page_url(file_path):
+    """Public URL for a page source file"""
+    relative = file_path.relative_to(SITE_ROOT).with_suffix('')
+    if relative.name == 'index':
+        parent = relative.parent.as_posix()
+        return '/' if parent == '.' else f'/{parent}/'
+    return f'/{relative.as_posix()}'
+
+
+@stats.timed('render_markdown')
 def render_markdown(md_content):
-    """Convert Markdown to HTML with Jekyll-style attribute lists"""
-    # Process Jekyll-style attribute lists like {: .btn-primary}
-    # Convert {: .class} to {.class} for Python markdown
-    md_content = re.sub(r'\{:\s*\.([^}]+)\}', r'{.\1}', md_content)
+    """Convert Markdown to HTML with Jekyll-style attribute lists (shared, memoized renderer)"""
+    return markdown_render.render_markdown(md_content)
+
+
+def render_content(file_path, page_data=None, site=None):
+    """Render a page's own content, without layouts: returns (content, page variables)"""
+    template = track_template(env.get_template(file_path))
+    data = dict(template.front_matter)
+    data.setdefault('url', data.get('permalink', page_url(file_path)))
+    data.update(page_data or {})
+
+    # Like Jekyll: Liquid first (front matter files only), then Markdown
+    if site is None:
+        site = site_variables()
+    if template.has_front_matter:
+        content = process_liquid(template, data, site=site)
+    else:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
 
-    return markdown.markdown(
-        md_content,
-        extensions=['fenced_code', 'tables', 'toc', 'nl2br', 'attr_list']
-    )
+    if file_path.suffix == '.md':
+        content = render_markdown(content)
+    return content, data
 
 
-def process_page(file_path):
+def process_page(file_path, page_data=None):
     """Process a markdown or HTML file with frontmatter"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    site = site_variables()
+    content, data = render_content(file_path, page_data, site)
+    data['content'] = content
+    return apply_layouts(content, data, site)
+
+
+def paginated_index():
+    """(posts per page, paginate_path, index.html source) when _config.yml turns on pagination, else None"""
+    load_config()
+    render_cache.depend(config_path)
+    settings = pagination.settings(config)
+    if settings is None:
+        return None
+    per_page, paginate_path = settings
+    for folder in pagination.template_folders(paginate_path):
+        # Adding or removing an index page changes its folder's mtime
+        render_cache.depend(SITE_ROOT / folder)
+        route = route_table.resolve(folder)
+        if route is not None and route.kind == 'page' and route.source.name == 'index.html':
+            return per_page, paginate_path, route.source
+    return None
+
+
+def paginated_page(path):
+    """(index.html source, page number) for a later page of the paginated index, e.g. blog/page/2/; else None"""
+    index = paginated_index()
+    if index is None:
+        return None
+    num = pagination.page_number(index[1], path)
+    return (index[2], num) if num else None
+
+
+def render_page(file_path, num=1):
+    """Render a page; the paginated index gets its `paginator` for page num. None past the last page"""
+    index = paginated_index()
+    if index is None or index[2] != file_path:
+        return process_page(file_path) if num == 1 else None
+
+    per_page, paginate_path, _ = index
+    render_cache.depend_on('posts')
+    first_url = page_url(file_path)
+    paginator = pagination.paginator(load_posts(), per_page, num, paginate_path, first_url)
+    if paginator is None:
+        return None
+    return process_page(file_path, {
+        'url': pagination.page_path(paginate_path, num, first_url),
+        'paginator': paginator,
+    })
+
+
+def render_post(post):
+    """Render a post through its layouts, with previous/next links"""
+    # Posts are newest first: next is the newer neighbour, previous the older
+    render_cache.depend_on('posts')
+    posts = load_posts()
+    i = posts.index(post)
+    return process_page(post['file_path'], {
+        'title': post['title'],
+        'date': post['date'],
+        'url': post['url'],
+        'tags': post['tags'],
+        'next': posts[i - 1] if i > 0 else None,
+        'previous': posts[i + 1] if i + 1 < len(posts) else None,
+    })
+
+
+def cached_response(key, render, mimetype='text/html'):
+    """Serve a page from the render cache; on a miss render it while recording its dependencies
+
+    render() returns (body, status). 200 responses carry a strong ETag and
+    answer a matching If-None-Match with 304 Not Modified.
+    """
+    with stats.stage('cache_lookup'):
+        entry = render_cache.get(key)
+    if entry is None:
+        with render_cache.recording() as deps:
+            with stats.stage('render'):
+                html, status = render()
+            if mimetype == 'text/html':
+                html = highlight.link_stylesheet(html, HIGHLIGHT_CSS_PATH)
+            if app.config['OPTIMIZE_HTML'] and mimetype == 'text/html':
+                # Inside the recording, so the stylesheet and images become dependencies of the page
+                with stats.stage('optimize'):
+                    html = optimize_page(html)
+        entry = render_cache.put(key, html, deps, status)
+
+    response = Response(entry.body, status=entry.status, mimetype=mimetype)
+    if entry.status == 200:
+        response.set_etag(entry.etag)
+        response = response.make_conditional(request)
+    return response
+
+
+def load_stylesheet(path):
+    """Parsed stylesheet, re-parsed only when the file changes; None if missing"""
+    render_cache.depend(path)
+    signature = file_signature(path)
+    if signature is None:
+        return None
+    cached = stylesheets.get(path)
+    if cached is None or cached[0] != signature:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = stylesheets[path] = (signature, postprocess.Stylesheet(f.read()))
+    return cached[1]
+
+
+def image_dimensions(src):
+    """(width, height) of a site image referenced by a root-relative src, or None"""
+    baseurl = config.get('baseurl') or ''
+    if not src.startswith('/') or src.startswith('//'):
+        return None
+    path = src.split('?', 1)[0].split('#', 1)[0]
+    if baseurl and path.startswith(baseurl + '/'):
+        path = path[len(baseurl):]
+    file_path = safe_join(str(SITE_ROOT), path.lstrip('/'))
+    if file_path is None:
+        return None
+    render_cache.depend(file_path)
+    return image_index.get(file_path)
+
+
+def optimize_page(html):
+    """Inline the stylesheet rules the top of the page uses (when small enough), size its images and minify it"""
+    stylesheet = load_stylesheet(CRITICAL_CSS_PATH)
+    if stylesheet is not None:
+        href = (config.get('baseurl') or '') + '/' + CRITICAL_CSS_PATH.relative_to(SITE_ROOT).as_posix()
+        html = postprocess.defer_stylesheet(html, href, stylesheet.critical(html))
+    html = postprocess.size_images(html, image_dimensions)
+    return postprocess.minify_html(html)
+
+
+def site_files(skip=None):
+    """Every source file of the site, skipping folders starting with _ or ., the config's exclude list and skip
+
+    Walked folders are recorded as dependencies, so adding or removing a file
+    invalidates whatever was built from the listing.
+    """
+    excluded = set(config.get('exclude', []))
+    for root, dirs, files in os.walk(SITE_ROOT):
+        root = Path(root)
+        render_cache.depend(root)
+        dirs[:] = sorted(d for d in dirs if not skipped(d, excluded) and root / d != skip)
+        for name in sorted(files):
+            if not skipped(name, excluded):
+                yield root / name
+
+
+def has_front_matter(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read(3) == b'---'
+
+
+def feed_entry(site, post):
+    """Serialized Atom entry for a post, re-rendered only when something it was built from changes"""
+    key = str(post['file_path'])
+    entry = feed_entries.get(key)
+    if entry is None:
+        with render_cache.recording() as deps:
+            content, _ = render_content(post['file_path'], {
+                'title': post['title'], 'date': post['date'], 'url': post['url'], 'tags': post['tags'],
+            }, site)
+            # Entries embed the site URL and author, so they also depend on the config
+            render_cache.depend(config_path)
+        entry = feed_entries.put(key, feeds.feed_entry(site, post, content), deps)
+    else:
+        # Pass the entry's dependencies on to the feed being rendered
+        for path in entry.files:
+            render_cache.depend(path)
+        for name in entry.sources:
+            render_cache.depend_on(name)
+    return entry.body
+
+
+def render_feed():
+    """Atom feed of the newest posts (jekyll-feed)"""
+    render_cache.depend_on('posts')
+    site = site_variables()
+    limit = (config.get('feed') or {}).get('posts_limit', feeds.FEED_POSTS_LIMIT)
+    posts = site['posts'][:limit]
+    return feeds.atom_feed(site, posts, [feed_entry(site, post) for post in posts]), 200
+
+
+def render_sitemap(skip=None):
+    """sitemap.xml listing posts, pages and HTML/PDF files (jekyll-sitemap); skip is a folder to leave out"""
+    render_cache.depend_on('posts')
+    site = site_variables()
+    urls = [(post['url'], post.get('last_modified_at') or post['date']) for post in site['posts']]
+    static = []
+    for file_path in site_files(skip):
+        if file_path.suffix in ('.md', '.html') and has_front_matter(file_path):
+            front_matter = track_template(env.get_template(file_path)).front_matter
+            url = front_matter.get('permalink') or page_url(file_path)
+            if front_matter.get('sitemap') is False or url in ('/404', '/404.html'):
+                continue
+            urls.append((url, front_matter.get('last_modified_at')))
+        elif file_path.suffix.lower() in feeds.SITEMAP_STATIC_EXTENSIONS:
+            render_cache.depend(file_path)
+            modified = datetime.fromtimestamp(file_path.stat().st_mtime)
+            static.append(('/' + file_path.relative_to(SITE_ROOT).as_posix(), modified))
+    return feeds.sitemap(site, urls + static), 200
+
+
+def render_not_found():
+    """Render the 404 page"""
+    four_oh_four = SITE_ROOT / '404.md'
+    render_cache.depend(four_oh_four)
+    if four_oh_four.exists():
+        return process_page(four_oh_four), 404
+    return '<h1>404 - Page Not Found</h1>', 404
 
-    # Check for frontmatter
-    if content.startswith('---'):
-        post = frontmatter.loads(content)
-        page_data = dict(post.metadata)
 
-        # Render markdown content
-        if file_path.suffix == '.md':
-            page_data['content'] = render_markdown(post.content)
-        else:
-            page_data['content'] = post.content
-    else:
-        page_data = {'content': content if file_path.suffix == '.html' else render_markdown(content)}
+@app.before_request
+def start_timing():
+    stats.begin_request()
+
+
+# Registered before the other after_request hooks so it runs last and times them too
+@app.after_request
+def record_timing(response):
+    """Record the request in the route stats and report stage durations in Server-Timing"""
+    if request.path == livereload.ENDPOINT:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    total, timings = stats.end_request(route, response.status_code)
+    if total is not None:
+        response.headers['Server-Timing'] = server_timing(total, timings)
+    return response
+
+
+@app.route(STATS_ENDPOINT)
+def serve_stats():
+    """Rolling latency histograms, request counts per route and cache hit rates"""
+    report = stats.snapshot()
+    report['caches'] = {
+        'pages': dict(hit_rate(render_cache.hits, render_cache.misses), entries=len(render_cache)),
+        'markdown': hit_rate(markdown_render.renderer.hits, markdown_render.renderer.misses),
+        'highlight': hit_rate(markdown_render.renderer.highlighter.hits, markdown_render.renderer.highlighter.misses),
+    }
+    report['posts'] = len(post_index.posts())
+    return jsonify(report)
+
+
+def search_document(post, draft):
+    """Fields to index and result metadata for a parsed post"""
+    if post is None:
+        return None
+    date = post['date']
+    return {'title': post['title'], 'tags': post['tags'], 'body': post['content']}, {
+        'title': post['title'],
+        'url': None if draft else post['url'],
+        'date': date.isoformat() if hasattr(date, 'isoformat') else str(date),
+        'tags': post['tags'],
+        'excerpt': post['excerpt'],
+        'draft': draft,
+    }
 
-    # Get layout (default to 'default')
-    layout_name = page_data.get('layout', 'default')
 
-    # Handle layout: none
-    if layout_name is None or layout_name == 'none':
-        return page_data['content']
+def refresh_search_index():
+    """Re-index posts and drafts whose files changed since the last query"""
+    documents = {}
+    for index, draft in ((post_index, False), (drafts_index, True)):
+        for path, signature, post in index.entries():
+            documents[str(path)] = (signature, post, draft)
+    search_index.sync({key: doc[0] for key, doc in documents.items()},
+                      lambda key: search_document(*documents[key][1:]))
 
-    # Load and process layout
-    layout = load_layout(layout_name)
-    html = process_liquid(layout, page_data)
 
-    return html
+@app.route('/search')
+def search():
+    """Ranked full-text search over post titles, tags and text: /search?q=...&limit=20&drafts=1"""
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    include_drafts = request.args.get('drafts') in ('1', 'true')
+
+    with stats.stage('search'):
+        refresh_search_index()
+        results = search_index.search(query, limit, None if include_drafts else lambda meta: not meta.get('draft'))
+    return jsonify({'query': query, 'count': len(results), 'results': results})
 
 
 @app.route('/')
 def index():
     """Serve the homepage"""
-    index_md = SITE_ROOT / 'index.md'
-    index_html = SITE_ROOT / 'index.html'
+    return serve_page('')
+
+
+@app.route(livereload.ENDPOINT)
+def live_reload_events():
+    """Server-Sent Events stream for live reload"""
+    return Response(live_reload.stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.after_request
+def inject_live_reload(response):
+    """Add the live reload client to served pages"""
+    if (app.config['LIVE_RELOAD'] and response.mimetype == 'text/html'
+            and response.status_code != 304 and not response.direct_passthrough):
+        response.set_data(livereload.inject_script(response.get_data(as_text=True)))
+    return response
+
 
-    if index_md.exists():
-        return process_page(index_md)
-    elif index_html.exists():
-        return process_page(index_html)
-    return '<h1>No index file found</h1>', 404
+def serve_static_file(file_path, mimetype=None):
+    """Serve a file with validators and Cache-Control; compressed if it compresses and the client accepts it
+
+    Uncompressed files go through send_file, which answers If-None-Match,
+    If-Modified-Since and Range requests (the CV PDF) from the file itself.
+    """
+    with stats.stage('static'):
+        static = static_files.get(file_path, mimetype) if file_path else None
+        if static is None:
+            abort(404)
+
+        encoding, body = static_files.negotiate(static, request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            response = send_file(static.path, mimetype=static.content_type, conditional=True,
+                                 etag=static.etag, last_modified=static.mtime)
+        else:
+            response = Response(body, mimetype=static.content_type)
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(f'{static.etag}-{encoding}')
+            response.last_modified = static.mtime
+            response = response.make_conditional(request)
+
+        if static.compressible:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
 
 
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
     """Serve static assets"""
-    return send_from_directory(ASSETS_DIR, filename)
+    return serve_static_file(safe_join(str(ASSETS_DIR), filename))
 
 
-@app.route('/feed.xml')
-def serve_feed():
-    """Serve RSS feed"""
-    feed_path = SITE_ROOT / 'feed.xml'
-    if feed_path.exists():
-        with open(feed_path, 'r', encoding='utf-8') as f:
-            return Response(f.read(), mimetype='application/xml')
-    abort(404)
+@app.route(HIGHLIGHT_CSS_PATH)
+def serve_highlight_css():
+    """Serve the code highlighting stylesheet (generated once per Pygments version)"""
+    return serve_static_file(highlight.stylesheet(), 'text/css')
 
 
-@app.route('/blog/<path:post_slug>')
-def serve_post(post_slug):
-    """Serve individual blog post"""
-    # Try to find matching post file
-    posts = load_posts()
+@app.route(feeds.FEED_PATH)
+def serve_feed():
+    """Serve the Atom feed: a feed.xml in the site wins, as with jekyll-feed"""
+    if (SITE_ROOT / 'feed.xml').is_file():
+        return serve_static_file(SITE_ROOT / 'feed.xml', 'application/xml')
+    return cached_response(feeds.FEED_PATH, render_feed, 'application/xml')
+
 
-    for post in posts:
-        # Check if URL matches
-        if post['url'] == f'/blog/{post_slug}':
-            # Process the post
-            page_data = {
-                'title': post['title'],
-                'date': post['date'],
-                'content': render_markdown(post['content']),
-                'layout': 'default'
-            }
+@app.route(feeds.SITEMAP_PATH)
+def serve_sitemap():
+    """Serve the sitemap, generated unless the site has its own sitemap.xml"""
+    if (SITE_ROOT / 'sitemap.xml').is_file():
+        return serve_static_file(SITE_ROOT / 'sitemap.xml', 'application/xml')
+    return cached_response(feeds.SITEMAP_PATH, render_sitemap, 'application/xml')
 
-            layout = load_layout('default')
-            html = process_liquid(layout, page_data)
-            return html
 
-    # Also check _posts directory directly
-    for post_file in POSTS_DIR.glob('*.md'):
-        if post_slug in post_file.stem:
-            return process_page(post_file)
+@app.route('/blog/<path:post_slug>')
+def serve_post(post_slug):
+    """Serve individual blog post, or a page that lives under /blog/"""
+    post = post_index.get(f'/blog/{post_slug}') or post_index.get(post_slug)
+    if post is None:
+        return serve_page(f'blog/{post_slug}')
 
-    abort(404)
+    return cached_response(post['url'], lambda: (render_post(post), 200))
 
 
 @app.route('/<path:path>')
 def serve_page(path):
-    """Serve any page"""
-    # Remove trailing slash
-    path = path.rstrip('/')
+    """Serve any page or file under the site root, as found in the route table"""
+    with stats.stage('route'):
+        route = route_table.resolve(path)
+    if route is None:
+        paginated = paginated_page(path)
+        if paginated is None:
+            abort(404)
+        source, num = paginated
+
+        def render_paginated():
+            html = render_page(source, num)
+            return render_not_found() if html is None else (html, 200)
+
+        return cached_response(f'{source}#page{num}', render_paginated)
 
     # Direct file requests (images, etc.)
-    direct_path = SITE_ROOT / path
-    if direct_path.exists() and direct_path.is_file():
-        ext = direct_path.suffix.lower()
-        if ext in ['.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp']:
-            return send_from_directory(direct_path.parent, direct_path.name)
-        elif ext == '.xml':
-            with open(direct_path, 'r', encoding='utf-8') as f:
-                return Response(f.read(), mimetype='application/xml')
-        elif ext == '.txt':
-            return send_from_directory(direct_path.parent, direct_path.name, mimetype='text/plain')
-        elif ext == '.pdf':
-            return send_from_directory(direct_path.parent, direct_path.name, mimetype='application/pdf')
-
-    # Try different file patterns for pages
-    possible_paths = [
-        SITE_ROOT / path / 'index.md',
-        SITE_ROOT / path / 'index.html',
-        SITE_ROOT / f'{path}.md',
-        SITE_ROOT / f'{path}.html',
-    ]
-
-    for file_path in possible_paths:
-        if file_path.exists():
-            return process_page(file_path)
-
-    # 404
-    four_oh_four = SITE_ROOT / '404.md'
-    if four_oh_four.exists():
-        return process_page(four_oh_four), 404
+    if route.kind == 'file':
+        return serve_static_file(route.source, route.content_type)
 
-    return '<h1>404 - Page Not Found</h1>', 404
+    # Cached per source file, so a file that takes over a URL never gets another file's render
+    def render():
+        if not route.source.is_file():
+            return render_not_found()
+        return render_page(route.source), 200
+
+    return cached_response(str(route.source), render)
 
 
 @app.errorhandler(404)
 def page_not_found(e):
     """Handle 404 errors"""
-    four_oh_four = SITE_ROOT / '404.md'
-    if four_oh_four.exists():
-        return process_page(four_oh_four), 404
-    return '<h1>404 - Page Not Found</h1>', 404
+    return cached_response('404', render_not_found)
 
 
 if __name__ == '__main__':
@@ -449,7 +800,18 @@ if __name__ == '__main__':
     print(f"\nSite: {SITE['title']}")
     print(f"Root: {SITE_ROOT}")
     print(f"\nOpen your browser to: http://localhost:5001")
+
+    # Site edits are picked up by the watcher and pushed to the browser,
+    # so the process no longer restarts on every change
+    app.config['LIVE_RELOAD'] = True
+    watcher = start_watcher()
+    print(f"Live reload: watching site files ({watcher.mode})")
+    print(f"Timings: Server-Timing headers, stats at http://localhost:5001{STATS_ENDPOINT}")
+    if '--optimize' in sys.argv[1:]:
+        app.config['OPTIMIZE_HTML'] = True
+        print("Optimize: minified HTML, above-the-fold CSS inlined when under budget, image sizes added")
+
     print("\nPress Ctrl+C to stop")
     print("=" * 50 + "\n")
 
-    app.run(debug=True, port=5001, use_reloader=True)
+    app.run(debug=True, port=5001, use_reloader=False, threaded=True)
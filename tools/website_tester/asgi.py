@@ -0,0 +1,315 @@
+"""
+ASGI serving mode for the site preview
+Static files (/assets/... and direct files such as the CV PDF) are streamed
+from the event loop in chunks (or sent as their compressed variant, with
+byte ranges for uncompressed files), with disk reads kept off the loop; rendered
+routes (/, /feed.xml, /blog/<slug>, /<path>) run the Flask views on a worker
+pool, so one slow render no longer holds up the images, CSS and feed
+requests its page triggers. Live reload streams are served on the event loop
+itself and end as soon as the browser disconnects.
+
+Usage: python asgi.py [--host HOST] [--port PORT] [--workers N]   (needs uvicorn)
+"""
+
+import argparse
+import asyncio
+import io
+import mimetypes
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+from werkzeug.security import safe_join
+
+import app as site
+from livereload import KEEPALIVE_MESSAGE, RETRY_MESSAGE, event_message
+from static_files import CACHE_CONTROL, byte_range
+
+CHUNK_SIZE = 64 * 1024
+
+# Renders share the process-wide template, post and page caches, so threads
+# (not processes) keep the caches warm across requests
+render_pool = ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) + 2), thread_name_prefix='render')
+
+# Disk reads for static files, kept apart from the loop's default executor
+static_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='static')
+
+
+def resolve_static(path):
+    """Map a request path to (file path, content type) if it is served as a static file"""
+    if path.startswith('/assets/'):
+        file_path = safe_join(str(site.ASSETS_DIR), path[len('/assets/'):])
+        content_type = None
+    else:
+        route = site.route_table.resolve(path)
+        if route is None or route.kind != 'file':
+            return None
+        file_path, content_type = str(route.source), route.content_type
+
+    if file_path is None:
+        return None
+    if content_type is None:
+        content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    return file_path, content_type
+
+
+def header(scope, name):
+    name = name.encode('latin-1')
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def send_simple(send, status, body=b'', headers=()):
+    await send({'type': 'http.response.start', 'status': status, 'headers': list(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def serve_static(scope, send, file_path, content_type):
+    """Send a file (or its compressed variant), answering conditional GETs with 304 and ranges with 206"""
+    loop = asyncio.get_running_loop()
+    static = await loop.run_in_executor(static_pool, site.static_files.get, file_path, content_type)
+    if static is None:
+        return False
+
+    encoding, body = await loop.run_in_executor(
+        static_pool, site.static_files.negotiate, static, header(scope, 'accept-encoding'))
+    etag = f'"{static.etag}-{encoding}"' if encoding else f'"{static.etag}"'
+    headers = [
+        (b'content-type', static.content_type.encode('latin-1')),
+        (b'etag', etag.encode('latin-1')),
+        (b'last-modified', static.last_modified.encode('latin-1')),
+        (b'cache-control', CACHE_CONTROL.encode('latin-1')),
+    ]
+    if static.compressible:
+        headers.append((b'vary', b'Accept-Encoding'))
+
+    if_none_match = header(scope, 'if-none-match')
+    if_modified_since = header(scope, 'if-modified-since')
+    not_modified = False
+    if if_none_match is not None:
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    elif if_modified_since:
+        try:
+            not_modified = int(static.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            pass
+    if not_modified:
+        await send_simple(send, 304, headers=headers[1:])
+        return True
+
+    if encoding:
+        headers.append((b'content-encoding', encoding.encode('latin-1')))
+        headers.append((b'content-length', str(len(body)).encode('latin-1')))
+        await send_simple(send, 200, b'' if scope['method'] == 'HEAD' else body, headers)
+        return True
+
+    # Byte ranges, unless If-Range names another version
+    start, end, status = 0, static.size - 1, 200
+    headers.append((b'accept-ranges', b'bytes'))
+    if_range = header(scope, 'if-range')
+    requested = byte_range(header(scope, 'range'), static.size) if if_range in (None, etag) else None
+    if requested is False:
+        await send_simple(send, 416, headers=[(b'content-range', f'bytes */{static.size}'.encode('latin-1'))])
+        return True
+    if requested:
+        start, end = requested
+        status = 206
+        headers.append((b'content-range', f'bytes {start}-{end}/{static.size}'.encode('latin-1')))
+
+    remaining = end - start + 1
+    headers.append((b'content-length', str(remaining).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    if scope['method'] == 'HEAD' or remaining <= 0:
+        await send({'type': 'http.response.body', 'body': b''})
+        return True
+
+    f = await loop.run_in_executor(static_pool, open, static.path, 'rb')
+    try:
+        await loop.run_in_executor(static_pool, f.seek, start)
+        while remaining > 0:
+            chunk = await loop.run_in_executor(static_pool, f.read, min(CHUNK_SIZE, remaining))
+            remaining = remaining - len(chunk) if chunk else 0
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+    finally:
+        await loop.run_in_executor(static_pool, f.close)
+    return True
+
+
+class LoopClient:
+    """Live reload client on the event loop: the broadcaster's put() lands in an asyncio.Queue"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def serve_live_reload(receive, send):
+    """SSE stream, served on the loop until the client disconnects; no thread is held per client"""
+    client = site.live_reload.subscribe(LoopClient(asyncio.get_running_loop()))
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+        ]})
+        await send({'type': 'http.response.body', 'body': RETRY_MESSAGE.encode('utf-8'), 'more_body': True})
+        while True:
+            event = asyncio.ensure_future(client.queue.get())
+            done, _ = await asyncio.wait({event, disconnected}, timeout=site.live_reload.keepalive,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                event.cancel()
+                return
+            if event in done:
+                message = event_message(*event.result())
+            else:
+                event.cancel()
+                message = KEEPALIVE_MESSAGE
+            await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+    except OSError:
+        pass  # Client went away
+    finally:
+        site.live_reload.unsubscribe(client)
+        disconnected.cancel()
+
+
+def wsgi_environ(scope, body):
+    """Build a WSGI environ for the Flask app from an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('127.0.0.1', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def run_wsgi(environ):
+    """Run one request through the Flask app (on a worker thread)"""
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result['status'] = int(status.split(' ', 1)[0])
+        result['headers'] = headers
+
+    iterable = site.app.wsgi_app(environ, start_response)
+    try:
+        body = b''.join(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return result['status'], result['headers'], body
+
+
+async def serve_rendered(scope, receive, send):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    loop = asyncio.get_running_loop()
+    status, headers, content = await loop.run_in_executor(render_pool, run_wsgi, wsgi_environ(scope, body))
+    await send_simple(send, status, content, [
+        (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+    ])
+
+
+async def application(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                render_pool.shutdown(wait=False)
+                static_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    if path == site.livereload.ENDPOINT:
+        await serve_live_reload(receive, send)
+        return
+
+    if scope['method'] in ('GET', 'HEAD'):
+        static = resolve_static(path)
+        if static and await serve_static(scope, send, *static):
+            return
+
+    await serve_rendered(scope, receive, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the site preview over ASGI')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=None, help='Render threads (default: cores + 2, max 8)')
+    parser.add_argument('--optimize', action='store_true', help='Minify pages, inline critical CSS and size images')
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("ASGI mode needs uvicorn: pip install uvicorn")
+
+    global render_pool
+    if args.workers:
+        render_pool = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='render')
+
+    site.app.config['LIVE_RELOAD'] = True
+    site.app.config['OPTIMIZE_HTML'] = args.optimize
+    watcher = site.start_watcher()
+
+    print("\n" + "=" * 50)
+    print("Website Tester - ASGI Preview Server")
+    print("=" * 50)
+    print(f"\nSite: {site.SITE['title']}")
+    print(f"Open your browser to: http://{args.host}:{args.port}")
+    print(f"Live reload: watching site files ({watcher.mode})")
+    print("\nPress Ctrl+C to stop")
+    print("=" * 50 + "\n")
+
+    uvicorn.run(application, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
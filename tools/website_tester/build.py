@@ -0,0 +1,254 @@
+"""
+Static site build - renders every page, post and the 404 page to an output directory
+Uses the same process_page / process_liquid pipeline as the preview server,
+spreads rendering over a process pool, and keeps a dependency manifest so
+rebuilds only re-render outputs whose inputs changed
+
+Usage: python build.py [--output DIR] [--jobs N] [--clean] [--optimize]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import app
+import pagination
+import postprocess
+from cache import file_signature
+
+TOOL_DIR = Path(__file__).parent
+MANIFEST_NAME = '.build-manifest.json'
+MANIFEST_VERSION = 2
+
+# Changes to the renderer itself invalidate every output
+TOOL_FILES = [TOOL_DIR / name for name in ('app.py', 'liquid.py', 'posts.py', 'cache.py', 'feeds.py', 'routes.py', 'postprocess.py', 'pagination.py', 'build.py')] + [
+    TOOL_DIR.parent / 'common' / 'markdown_render.py',
+    TOOL_DIR.parent / 'common' / 'highlight.py',
+]
+
+PAGE_EXTENSIONS = {'.md', '.html'}
+
+
+def output_path_for(url):
+    """Map a page URL to its file path relative to the output directory"""
+    path = url.lstrip('/')
+    if not path or url.endswith('/'):
+        return path + 'index.html'
+    if path.endswith('.html'):
+        return path
+    return path + '.html'
+
+
+def discover(output_dir):
+    """Find everything to build: (rendered jobs, static files)
+
+    Jobs are (kind, source, output) tuples; static files are (source, output) pairs.
+    Like Jekyll, .md/.html files with front matter are rendered and everything
+    else is copied. Folders starting with _ or . and the config's exclude list are skipped.
+    """
+    jobs = []
+    static = []
+
+    for source in app.site_files(skip=output_dir):
+        relative = source.relative_to(app.SITE_ROOT).as_posix()
+        if source.suffix in PAGE_EXTENSIONS and app.has_front_matter(source):
+            template = app.env.get_template(source)
+            url = template.front_matter.get('permalink') or app.page_url(source)
+            jobs.append(('page', str(source), output_path_for(url)))
+        else:
+            static.append((str(source), relative))
+
+    for post in app.load_posts():
+        jobs.append(('post', str(post['file_path']), output_path_for(post['url'])))
+
+    # Later pages of the paginated index (jekyll-paginate), by URL; page 1 is the index page's own job
+    index = app.paginated_index()
+    if index is not None:
+        per_page, paginate_path, _ = index
+        total_pages = -(-len(app.load_posts()) // per_page)
+        for num in range(2, total_pages + 1):
+            url = pagination.page_path(paginate_path, num, None)
+            jobs.append(('pager', url, output_path_for(url)))
+
+    # Generated like jekyll-feed and jekyll-sitemap, unless the site has its own
+    for kind, output in (('feed', 'feed.xml'), ('sitemap', 'sitemap.xml')):
+        if not (app.SITE_ROOT / output).is_file():
+            jobs.append((kind, str(app.config_path), output))
+
+    return jobs, static
+
+
+def tool_signature():
+    return [list(file_signature(path) or ()) for path in TOOL_FILES]
+
+
+def load_manifest(output_dir, optimize=False):
+    try:
+        with open(output_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (manifest.get('version') != MANIFEST_VERSION or manifest.get('tool') != tool_signature()
+            or manifest.get('optimize') != optimize):
+        return None
+    return manifest
+
+
+def is_fresh(entry, output_file):
+    """True if the output exists and none of its recorded inputs changed"""
+    if entry is None or not output_file.exists():
+        return False
+    for path, signature in entry['deps'].items():
+        current = file_signature(path)
+        if (list(current) if current else None) != signature:
+            return False
+    return True
+
+
+def render_job(job, output_dir, optimize=False):
+    """Render one page or post in a worker process and write it; returns (output, deps)"""
+    kind, source, output = job
+    with app.render_cache.recording() as deps:
+        if kind == 'post':
+            html = app.render_post(app.post_index.get(Path(source).stem))
+        elif kind == 'feed':
+            html = app.render_feed()[0]
+        elif kind == 'sitemap':
+            html = app.render_sitemap(skip=output_dir)[0]
+        elif kind == 'pager':
+            html = app.render_page(*app.paginated_page(source))
+        else:
+            html = app.render_page(Path(source))
+        if optimize and kind in ('page', 'post', 'pager'):
+            html = app.optimize_page(html)
+
+    files = dict(deps[0])
+    if 'posts' in deps[1]:
+        # The post set is a process-local version; persist it as the post files
+        # themselves plus the folder (whose mtime changes on add/remove/rename)
+        files[str(app.POSTS_DIR)] = file_signature(app.POSTS_DIR)
+        for post in app.load_posts():
+            files[str(post['file_path'])] = file_signature(post['file_path'])
+
+    target = output_dir / output
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write(html)
+
+    return output, {path: list(sig) if sig else None for path, sig in files.items()}
+
+
+def _render_chunk(args):
+    jobs, output_dir, optimize = args
+    return [render_job(job, Path(output_dir), optimize) for job in jobs]
+
+
+def build(output_dir, jobs=None, clean=False, optimize=False):
+    """Build the site into output_dir; returns a summary dict"""
+    started = time.perf_counter()
+    output_dir = Path(output_dir).resolve()
+
+    if clean and output_dir.exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = None if clean else load_manifest(output_dir, optimize)
+    previous = manifest['outputs'] if manifest else {}
+    outputs = {}
+
+    render_jobs, static = discover(output_dir)
+
+    # Static files: copy when the source signature differs from the last build
+    copied = 0
+    for source, output in static:
+        signature = file_signature(source)
+        entry = previous.get(output)
+        target = output_dir / output
+        if entry and entry['deps'] == {source: list(signature)} and target.exists():
+            outputs[output] = entry
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(source, target)
+        outputs[output] = {'deps': {source: list(signature)}}
+        copied += 1
+
+    dirty = []
+    for job in render_jobs:
+        entry = previous.get(job[2])
+        if is_fresh(entry, output_dir / job[2]):
+            outputs[job[2]] = entry
+        else:
+            dirty.append(job)
+
+    # Render dirty outputs across the pool in one chunk per worker
+    workers = max(1, min(jobs or os.cpu_count() or 1, len(dirty)))
+    if len(dirty) > 1 and workers > 1:
+        chunks = [(dirty[i::workers], str(output_dir), optimize) for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for results in pool.map(_render_chunk, chunks):
+                for output, deps in results:
+                    outputs[output] = {'deps': deps}
+    else:
+        for job in dirty:
+            output, deps = render_job(job, output_dir, optimize)
+            outputs[output] = {'deps': deps}
+
+    # Remove outputs that no longer have a source
+    removed = 0
+    for output in previous.keys() - outputs.keys():
+        try:
+            (output_dir / output).unlink()
+            removed += 1
+        except OSError:
+            pass
+
+    with open(output_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'tool': tool_signature(), 'optimize': optimize,
+                   'outputs': outputs}, f, indent=1)
+
+    # --optimize: pages that kept a blocking stylesheet because their critical CSS was over budget
+    blocking = []
+    if optimize:
+        for kind, source, output in render_jobs:
+            if kind in ('page', 'post', 'pager') and output.endswith('.html'):
+                html = (output_dir / output).read_text(encoding='utf-8')
+                if not postprocess.has_deferred_stylesheet(html):
+                    blocking.append(output)
+
+    return {
+        'rendered': len(dirty),
+        'blocking_css': blocking,
+        'skipped': len(render_jobs) - len(dirty),
+        'copied': copied,
+        'removed': removed,
+        'workers': workers if dirty else 0,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the whole site to a static output directory')
+    parser.add_argument('--output', '-o', default=str(app.SITE_ROOT / '_site'), help='Output directory (default: _site)')
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--clean', action='store_true', help='Ignore the manifest and rebuild everything')
+    parser.add_argument('--optimize', action='store_true', help='Minify pages, inline critical CSS and size images')
+    args = parser.parse_args()
+
+    summary = build(args.output, jobs=args.jobs, clean=args.clean, optimize=args.optimize)
+
+    print(f"Built {args.output}")
+    print(f"  Rendered: {summary['rendered']} ({summary['workers']} workers)")
+    print(f"  Up to date: {summary['skipped']}")
+    print(f"  Static files copied: {summary['copied']}")
+    print(f"  Removed: {summary['removed']}")
+    print(f"  Time: {summary['seconds']:.2f}s")
+    if args.optimize and summary['blocking_css']:
+        print(f"  Critical CSS over budget, stylesheet left blocking: {', '.join(sorted(summary['blocking_css']))}")
+
+
+if __name__ == '__main__':
+    main()
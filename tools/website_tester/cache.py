@@ -0,0 +1,147 @@
+"""
+Rendered-page cache - stores the final HTML per route with the files it was built from
+An entry stays valid until one of its dependencies changes on disk
+"""
+
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class CacheEntry:
+    __slots__ = ('body', 'status', 'etag', 'files', 'sources')
+
+    def __init__(self, body, status, files, sources):
+        self.body = body
+        self.status = status
+        self.etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        self.files = files        # path -> signature at render time
+        self.sources = sources    # source name -> version at render time
+
+
+class RenderCache:
+    """Route -> rendered output, invalidated by file signatures and named source versions
+
+    Files are recorded while a render is in progress via depend(); named sources
+    (such as the post set) are registered once with a callable returning their
+    current version and recorded with depend_on().
+
+    Entries live in a dict in this process unless `store` is set to a shared
+    store (pre-fork workers), which then holds them for every process.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.store = None
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries if self.store is None else self.store)
+
+    def register_source(self, name, version):
+        self._sources[name] = version
+
+    @contextmanager
+    def recording(self):
+        """Collect the dependencies touched by the render inside this block"""
+        deps = ({}, {})
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(deps)
+        try:
+            yield deps
+        finally:
+            stack.pop()
+
+    def depend(self, path):
+        """Record a file dependency for every render currently recording on this thread"""
+        stack = getattr(self._local, 'stack', None)
+        if not stack:
+            return
+        path = os.path.abspath(path)
+        signature = file_signature(path)
+        for files, _ in stack:
+            files.setdefault(path, signature)
+
+    def depend_on(self, name):
+        """Record a dependency on a registered source"""
+        stack = getattr(self._local, 'stack', None)
+        if not stack:
+            return
+        version = self._sources[name]()
+        for _, sources in stack:
+            sources.setdefault(name, version)
+
+    def is_valid(self, entry):
+        for path, signature in entry.files.items():
+            if file_signature(path) != signature:
+                return False
+        for name, version in entry.sources.items():
+            if self._sources[name]() != version:
+                return False
+        return True
+
+    def get(self, key):
+        """Return the cached entry for key if all of its dependencies are unchanged"""
+        entry = (self._entries if self.store is None else self.store).get(key)
+        if entry is not None and self.is_valid(entry):
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, key, body, deps, status=200):
+        entry = CacheEntry(body, status, dict(deps[0]), dict(deps[1]))
+        if self.store is not None:
+            self.store.put(key, entry)
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def invalidate_files(self, paths):
+        """Drop every entry that depends on any of the given files; returns how many were dropped"""
+        paths = {os.path.abspath(p) for p in paths}
+        if self.store is not None:
+            return self.store.invalidate_files(paths)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if paths.intersection(entry.files)]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def invalidate_source(self, name):
+        """Drop every entry that depends on a registered source"""
+        if self.store is not None:
+            return self.store.invalidate_source(name)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if name in entry.sources]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or everything when key is None"""
+        if self.store is not None:
+            self.store.invalidate(key)
+            return
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,477 @@
+"""
+Site crawler and load tester for the preview server
+Starts at / and follows every same-origin link and asset reference (href,
+src, srcset, CSS url()) with a pool of concurrent asyncio workers, then
+optionally replays the discovered URLs for a while as a load test. Reports
+broken links with the pages that reference them, per-route p50/p95/p99
+latency, bytes transferred and throughput, and exits non-zero when a link is
+broken or a latency budget is exceeded, so it can gate a deploy.
+
+Runs against a live server (the plain HTTP/1.1 client below keeps one
+keep-alive connection per worker) or, with --in-process, against the Flask
+app itself on a thread pool, with no network
+
+Usage: python crawl.py [--url http://localhost:5001 | --in-process] [--concurrency N]
+                       [--duration SECONDS] [--max-p95 MS] [--ignore PATTERN] [--json FILE] [--top N]
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import gzip
+import html
+import json
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+USER_AGENT = 'website-tester-crawler'
+IN_PROCESS_ORIGIN = 'http://localhost'
+
+# Endpoints that never finish (event streams) or only report on the server itself
+SKIP_PATHS = ('/__livereload', '/__stats')
+
+LINK_ATTR_RE = re.compile(r'\s(?:href|src|poster)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+))', re.IGNORECASE)
+SRCSET_RE = re.compile(r'\ssrcset\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.IGNORECASE)
+CSS_URL_RE = re.compile(r'url\(\s*["\']?([^"\')]+)["\']?\s*\)')
+IGNORED_SCHEMES = ('mailto:', 'tel:', 'javascript:', 'data:')
+
+
+def extract_links(body, content_type):
+    """Raw link targets referenced by an HTML page or stylesheet"""
+    if 'html' in content_type:
+        links = [a or b or c for a, b, c in LINK_ATTR_RE.findall(body)]
+        for match in SRCSET_RE.finditer(body):
+            links.extend(candidate.split()[0] for candidate in (match.group(1) or match.group(2)).split(',')
+                         if candidate.strip())
+        links.extend(CSS_URL_RE.findall(body))   # Inline styles
+        return [html.unescape(link) for link in links]
+    if 'css' in content_type:
+        return CSS_URL_RE.findall(body)
+    return []
+
+
+def same_origin_path(base_url, link, origin):
+    """Path (with query) of a link resolved against base_url, or None if it leaves the origin"""
+    link = link.strip()
+    if not link or link.startswith('#') or link.lower().startswith(IGNORED_SCHEMES):
+        return None
+    parts = urlsplit(urljoin(base_url, link))
+    if f'{parts.scheme}://{parts.netloc}' != origin:
+        return None
+    path = parts.path or '/'
+    if path.startswith(SKIP_PATHS):
+        return None
+    return f'{path}?{parts.query}' if parts.query else path
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+# --- Clients ---
+
+class Response:
+    __slots__ = ('status', 'headers', 'body', 'wire_bytes', 'ms')
+
+    def __init__(self, status, headers, body, wire_bytes, ms):
+        self.status = status
+        self.headers = headers        # Lower-cased names
+        self.body = body              # Decoded (gunzipped) body
+        self.wire_bytes = wire_bytes  # Status line, headers and body as received
+        self.ms = ms
+
+
+class HttpConnection:
+    """One keep-alive HTTP/1.1 connection, used by one worker at a time"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        reused = self.writer is not None
+        try:
+            return await self._get(path)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            if not reused:
+                raise
+            # The server dropped an idle keep-alive connection; retry once on a fresh one
+            return await self._get(path)
+
+    async def _get(self, path):
+        started = time.perf_counter()
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        host = self.host if self.port == 80 else f'{self.host}:{self.port}'
+        self.writer.write((f'GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: {USER_AGENT}\r\n'
+                           f'Accept-Encoding: gzip\r\nConnection: keep-alive\r\n\r\n').encode('latin-1'))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed before a response')
+        wire_bytes = len(status_line)
+        version, status = status_line.decode('latin-1').split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            wire_bytes += len(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size_line = await self.reader.readline()
+                size = int(size_line.split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                wire_bytes += len(size_line) + len(chunk)
+                if size == 0:
+                    # Trailers (rare) end with a blank line
+                    while chunk not in (b'\r\n', b'\n', b''):
+                        chunk = await self.reader.readline()
+                        wire_bytes += len(chunk)
+                    break
+                body += chunk[:-2]
+            body = bytes(body)
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        elif int(status) in (204, 304) or 100 <= int(status) < 200:
+            body = b''
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        wire_bytes += len(body)
+        ms = (time.perf_counter() - started) * 1000
+
+        if headers.get('connection', '').lower() == 'close' or (
+                version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive'):
+            await self.close()
+        if headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return Response(int(status), headers, body, wire_bytes, ms)
+
+
+class HttpClient:
+    """Fetches from a running server; each worker gets its own connection"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        if parts.scheme != 'http':
+            raise ValueError('Only http:// servers can be crawled')
+        self.origin = f'{parts.scheme}://{parts.netloc}'
+        self.host = parts.hostname
+        self.port = parts.port or 80
+
+    def connection(self):
+        return HttpConnection(self.host, self.port)
+
+    def close(self):
+        pass
+
+
+class InProcessConnection:
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, path):
+        return await asyncio.get_running_loop().run_in_executor(self.client.pool, self.client.get, path)
+
+    async def close(self):
+        pass
+
+
+class InProcessClient:
+    """Calls the Flask app directly on a thread pool (one test client per thread), with no network"""
+
+    def __init__(self, workers):
+        # Imported on first use, so crawling a live server doesn't load the whole site
+        import app as site
+        self.site = site
+        self.origin = IN_PROCESS_ORIGIN
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crawl')
+        self._local = threading.local()
+
+    def connection(self):
+        return InProcessConnection(self)
+
+    def get(self, path):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.site.app.test_client()
+        started = time.perf_counter()
+        response = client.get(path, headers={'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'})
+        body = response.get_data()
+        ms = (time.perf_counter() - started) * 1000
+        headers = {name.lower(): value for name, value in response.headers.items()}
+        wire_bytes = len(body) + sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+        if headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return Response(response.status_code, headers, body, wire_bytes, ms)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+# --- Crawling and load ---
+
+class Results:
+    """Latencies, sizes and statuses per route, plus where every URL was linked from"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.bytes = defaultdict(int)
+        self.statuses = {}
+        self.errors = {}
+        self.referrers = defaultdict(set)
+        self.requests = 0
+        self.total_bytes = 0
+        self.seconds = 0.0
+
+    def record(self, path, response):
+        self.latencies[path].append(response.ms)
+        self.bytes[path] += response.wire_bytes
+        self.statuses[path] = response.status
+        self.requests += 1
+        self.total_bytes += response.wire_bytes
+
+    def broken(self, ignore=()):
+        """{path: (status or error, [referring pages])}, leaving out paths matching an ignore pattern"""
+        broken = {path: (status, sorted(self.referrers[path]))
+                  for path, status in self.statuses.items() if status >= 400}
+        for path, error in self.errors.items():
+            broken[path] = (error, sorted(self.referrers[path]))
+        return {path: entry for path, entry in sorted(broken.items())
+                if not any(fnmatch.fnmatchcase(path.split('?', 1)[0], pattern) for pattern in ignore)}
+
+    def routes(self):
+        rows = []
+        for path, values in self.latencies.items():
+            values = sorted(values)
+            rows.append({
+                'path': path,
+                'status': self.statuses.get(path),
+                'requests': len(values),
+                'bytes': self.bytes[path],
+                'p50_ms': round(percentile(values, 50), 3),
+                'p95_ms': round(percentile(values, 95), 3),
+                'p99_ms': round(percentile(values, 99), 3),
+                'max_ms': round(values[-1], 3),
+            })
+        return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+
+async def crawl(client, concurrency, results, start='/'):
+    """Visit every same-origin URL reachable from start; returns the paths found, in discovery order"""
+    queue = asyncio.Queue()
+    seen = {start: None}
+    queue.put_nowait(start)
+
+    async def worker():
+        connection = client.connection()
+        try:
+            while True:
+                path = await queue.get()
+                try:
+                    await visit(connection, path)
+                finally:
+                    queue.task_done()
+        finally:
+            await connection.close()
+
+    async def visit(connection, path):
+        try:
+            response = await connection.get(path)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            results.errors[path] = f'{type(e).__name__}: {e}'
+            return
+        results.record(path, response)
+
+        links = []
+        location = response.headers.get('location')
+        if 300 <= response.status < 400 and location:
+            links.append(location)
+        content_type = response.headers.get('content-type', '')
+        if response.status == 200 and ('html' in content_type or 'css' in content_type):
+            links.extend(extract_links(response.body.decode('utf-8', errors='replace'), content_type))
+
+        page_url = client.origin + path
+        for link in links:
+            target = same_origin_path(page_url, link, client.origin)
+            if target is None:
+                continue
+            results.referrers[target].add(path)
+            if target not in seen:
+                seen[target] = None
+                queue.put_nowait(target)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return list(seen)
+
+
+async def load(client, paths, concurrency, duration, results):
+    """Request paths round-robin from every worker until duration seconds have passed"""
+    deadline = time.perf_counter() + duration
+    paths = [path for path in paths if path not in results.errors]
+    if not paths:
+        return
+
+    async def worker(offset):
+        connection = client.connection()
+        i = offset
+        try:
+            while time.perf_counter() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                try:
+                    results.record(path, await connection.get(path))
+                except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                    results.errors[path] = f'{type(e).__name__}: {e}'
+        finally:
+            await connection.close()
+
+    step = max(1, len(paths) // concurrency)
+    await asyncio.gather(*(worker(n * step) for n in range(concurrency)))
+
+
+async def run(client, concurrency, duration):
+    """Crawl, then load test for duration seconds; returns (crawl results, load results or None)"""
+    crawled = Results()
+    started = time.perf_counter()
+    paths = await crawl(client, concurrency, crawled)
+    crawled.seconds = time.perf_counter() - started
+
+    loaded = None
+    if duration > 0:
+        loaded = Results()
+        loaded.referrers = crawled.referrers
+        started = time.perf_counter()
+        await load(client, paths, concurrency, duration, loaded)
+        loaded.seconds = time.perf_counter() - started
+    return crawled, loaded
+
+
+# --- Reporting ---
+
+def summary(results):
+    seconds = max(results.seconds, 1e-9)
+    return {
+        'requests': results.requests,
+        'errors': len(results.errors),
+        'bytes': results.total_bytes,
+        'seconds': round(results.seconds, 3),
+        'requests_per_second': round(results.requests / seconds, 1),
+        'megabytes_per_second': round(results.total_bytes / seconds / 1e6, 3),
+    }
+
+
+def print_phase(name, results, top):
+    totals = summary(results)
+    print(f"\n{name}: {totals['requests']} requests in {totals['seconds']:.2f}s "
+          f"({totals['requests_per_second']} req/s, {totals['bytes'] / 1024:.1f} KB, "
+          f"{totals['megabytes_per_second']} MB/s)")
+    rows = results.routes()
+    if not rows:
+        return
+    print(f"  {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'reqs':>6} {'KB':>8}  route")
+    for row in rows[:top]:
+        print(f"  {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f} {row['requests']:6d} "
+              f"{row['bytes'] / 1024:8.1f}  {row['path']}")
+    if len(rows) > top:
+        print(f"  ... {len(rows) - top} more routes (--top, --json)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl the site preview for broken links and load test it')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://localhost:5001', help='Running server to crawl (default: %(default)s)')
+    target.add_argument('--in-process', action='store_true', help='Call the Flask app directly instead of a server')
+    parser.add_argument('--concurrency', '-c', type=int, default=8, help='Concurrent workers (default: 8)')
+    parser.add_argument('--duration', '-d', type=float, default=0,
+                        help='Seconds to replay the crawled URLs as a load test after the crawl (default: 0, crawl only)')
+    parser.add_argument('--max-p95', type=float, default=None, help='Fail if any route\'s p95 latency exceeds this many ms')
+    parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN',
+                        help='Path pattern (fnmatch) not to report as broken, e.g. a theme file the preview '
+                             'does not serve; repeatable')
+    parser.add_argument('--top', type=int, default=15, help='Slowest routes to list (default: 15)')
+    parser.add_argument('--json', help='Write the full report to this file')
+    args = parser.parse_args()
+
+    client = InProcessClient(args.concurrency) if args.in_process else HttpClient(args.url)
+    try:
+        crawled, loaded = asyncio.run(run(client, max(1, args.concurrency), args.duration))
+    finally:
+        client.close()
+
+    print(f"Crawled {client.origin if not args.in_process else 'the app in-process'}: "
+          f"{len(crawled.statuses) + len(crawled.errors)} URLs")
+    print_phase('Crawl', crawled, args.top)
+    if loaded is not None:
+        print_phase('Load', loaded, args.top)
+
+    broken = crawled.broken(args.ignore)
+    if loaded is not None:
+        broken.update(loaded.broken(args.ignore))
+    if broken:
+        print(f"\nBroken links: {len(broken)}")
+        for path, (status, referrers) in broken.items():
+            print(f"  {status}  {path}")
+            for referrer in referrers[:5]:
+                print(f"        linked from {referrer}")
+            if len(referrers) > 5:
+                print(f"        ... and {len(referrers) - 5} more pages")
+    else:
+        print("\nBroken links: none")
+
+    measured = loaded or crawled
+    slow = [row for row in measured.routes() if args.max_p95 is not None and row['p95_ms'] > args.max_p95]
+    if slow:
+        print(f"Routes over the {args.max_p95} ms p95 budget: {len(slow)}")
+
+    if args.json:
+        report = {
+            'target': 'in-process' if args.in_process else args.url,
+            'concurrency': args.concurrency,
+            'crawl': {**summary(crawled), 'routes': crawled.routes()},
+            'load': {**summary(loaded), 'routes': loaded.routes()} if loaded is not None else None,
+            'broken': {path: {'status': status, 'linked_from': referrers}
+                       for path, (status, referrers) in broken.items()},
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+    sys.exit(1 if broken or slow else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Feed and sitemap generation - the preview's stand-ins for jekyll-feed and jekyll-sitemap
+Builds the Atom feed from the post index and the sitemap from the page set.
+The serialized XML is cached by the preview server like any rendered page;
+feed entries are cached per post so a change re-renders only that entry
+"""
+
+from datetime import date, datetime, time
+from xml.sax.saxutils import escape, quoteattr
+
+FEED_PATH = '/feed.xml'
+SITEMAP_PATH = '/sitemap.xml'
+FEED_POSTS_LIMIT = 10           # jekyll-feed's default feed.posts_limit
+
+# Static files jekyll-sitemap lists alongside pages
+SITEMAP_STATIC_EXTENSIONS = {'.htm', '.html', '.xhtml', '.pdf'}
+
+
+def to_datetime(value):
+    """Timezone-aware datetime from a post/page date (datetime, date or ISO string), or None"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip())
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.astimezone()
+    if isinstance(value, date):
+        return datetime.combine(value, time()).astimezone()
+    return None
+
+
+def iso_date(value):
+    moment = to_datetime(value)
+    return moment.isoformat() if moment else None
+
+
+def absolute_url(site, url):
+    return site['url'].rstrip('/') + site.get('baseurl', '') + url
+
+
+def feed_meta(site):
+    """The <link> tag {% feed_meta %} puts in the page head"""
+    return (f'<link type="application/atom+xml" rel="alternate" '
+            f'href={quoteattr(absolute_url(site, FEED_PATH))} title={quoteattr(site["title"])} />')
+
+
+def feed_entry(site, post, content):
+    """Atom <entry> for one post; content is the post body rendered to HTML"""
+    url = absolute_url(site, post['url'])
+    published = iso_date(post['date'])
+    updated = iso_date(post.get('last_modified_at')) or published
+    author = post.get('author') or site.get('author')
+
+    parts = [
+        '<entry>',
+        f'<title type="html">{escape(str(post["title"]))}</title>',
+        f'<link href={quoteattr(url)} rel="alternate" type="text/html" title={quoteattr(str(post["title"]))} />',
+    ]
+    if published:
+        parts.append(f'<published>{published}</published>')
+    if updated:
+        parts.append(f'<updated>{updated}</updated>')
+    parts.append(f'<id>{escape(url)}</id>')
+    parts.append(f'<content type="html" xml:base={quoteattr(url)}>{escape(content)}</content>')
+    if author:
+        parts.append(f'<author><name>{escape(str(author))}</name></author>')
+    for tag in post.get('tags') or []:
+        parts.append(f'<category term={quoteattr(str(tag))} />')
+    if post.get('excerpt'):
+        parts.append(f'<summary type="html">{escape(post["excerpt"])}</summary>')
+    parts.append('</entry>')
+    return ''.join(parts)
+
+
+def atom_feed(site, posts, entries):
+    """The whole feed: header plus the already serialized entries of the given posts (newest first)"""
+    updated = max((to_datetime(post.get('last_modified_at') or post['date']) for post in posts
+                   if to_datetime(post.get('last_modified_at') or post['date'])), default=None)
+    if updated is None:
+        updated = to_datetime(site.get('time')) or datetime.now().astimezone()
+    feed_url = absolute_url(site, FEED_PATH)
+    lang = site.get('lang') or 'en-US'
+
+    header = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        f'<feed xmlns="http://www.w3.org/2005/Atom" xml:lang={quoteattr(lang)}>',
+        '<generator uri="https://jekyllrb.com/">Jekyll</generator>',
+        f'<link href={quoteattr(feed_url)} rel="self" type="application/atom+xml" />',
+        f'<link href={quoteattr(absolute_url(site, "/"))} rel="alternate" type="text/html" hreflang={quoteattr(lang)} />',
+        f'<updated>{updated.isoformat()}</updated>',
+        f'<id>{escape(feed_url)}</id>',
+        f'<title type="html">{escape(str(site["title"]))}</title>',
+    ]
+    if site.get('description'):
+        header.append(f'<subtitle>{escape(str(site["description"]))}</subtitle>')
+    if site.get('author'):
+        header.append(f'<author><name>{escape(str(site["author"]))}</name></author>')
+    return '\n'.join(header + entries + ['</feed>']) + '\n'
+
+
+def sitemap(site, urls):
+    """<urlset> for (url, lastmod) pairs; lastmod may be None"""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
+    ]
+    for url, lastmod in urls:
+        lines.append('<url>')
+        lines.append(f'<loc>{escape(absolute_url(site, url))}</loc>')
+        lastmod = iso_date(lastmod)
+        if lastmod:
+            lines.append(f'<lastmod>{lastmod}</lastmod>')
+        lines.append('</url>')
+    lines.append('</urlset>')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,882 @@
+"""
+Liquid template engine for the Jekyll site preview
+Templates are parsed once into a node tree and cached by file mtime;
+rendering is a single walk over the tree with a context dict
+"""
+
+import hashlib
+import json
+import re
+from datetime import datetime, date
+from pathlib import Path
+
+# {{ output }} and {% tag %} markers, with optional whitespace control dashes
+TOKEN_RE = re.compile(r'(\{\{-?.*?-?\}\}|\{%-?.*?-?%\})', re.DOTALL)
+TAG_RE = re.compile(r'^\{%-?\s*(\w+)\s*(.*?)\s*-?%\}$', re.DOTALL)
+OUTPUT_RE = re.compile(r'^\{\{-?\s*(.*?)\s*-?\}\}$', re.DOTALL)
+
+# Expression tokens: quoted strings, ranges, comparison operators and bare words
+EXPR_TOKEN_RE = re.compile(r'''"[^"]*"|'[^']*'|\(\S+?\.\.\S+?\)|==|!=|<>|<=|>=|<|>|[^\s=!<>]+''')
+PATH_PART_RE = re.compile(r'\[([^\]]+)\]|\.?([\w-]+\??)')
+RANGE_RE = re.compile(r'^\((\S+?)\.\.(\S+?)\)$')
+NUMBER_RE = re.compile(r'^-?\d+(\.\d+)?$')
+FOR_RE = re.compile(r'^(\w+)\s+in\s+(\S+)\s*(.*)$', re.DOTALL)
+ASSIGN_RE = re.compile(r'^([\w-]+)\s*=\s*(.*)$', re.DOTALL)
+INCLUDE_PARAM_RE = re.compile(r'''([\w-]+)\s*=\s*("[^"]*"|'[^']*'|\S+)''')
+WORD_RE = re.compile(r'\S+')
+HTML_TAG_RE = re.compile(r'<[^>]*>')
+# Dotted names referenced in tag markup, skipping quoted strings
+REFERENCE_RE = re.compile(r'''"[^"]*"|'[^']*'|([A-Za-z_][\w-]*(?:\.[\w-]+)*)''')
+
+LITERALS = {'true': True, 'false': False, 'nil': None, 'null': None}
+# Root name of a variable path that starts with a [lookup], so can't be known before rendering
+DYNAMIC_ROOT = None
+
+
+class TemplateSyntaxError(Exception):
+    """Raised when a template has unbalanced or malformed tags"""
+
+
+# ---------------------------------------------------------------------------
+# Expressions
+# ---------------------------------------------------------------------------
+
+def split_outside_quotes(text, sep):
+    """Split text on a separator character, ignoring separators inside quotes"""
+    parts = []
+    current = []
+    quote = None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == sep:
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append(''.join(current))
+    return parts
+
+
+def lookup(obj, key):
+    """Resolve one step of a variable path (dict key, list index or size/first/last)"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        if key in obj:
+            return obj[key]
+        if key == 'size':
+            return len(obj)
+        return None
+    if isinstance(obj, (list, tuple, str)):
+        if isinstance(key, int):
+            try:
+                return obj[key]
+            except IndexError:
+                return None
+        if key == 'size':
+            return len(obj)
+        if key == 'first':
+            return obj[0] if obj else None
+        if key == 'last':
+            return obj[-1] if obj else None
+        return None
+    return getattr(obj, key, None) if isinstance(key, str) else None
+
+
+def reads(compiled):
+    """Root variable names a compiled expression or condition reads"""
+    return getattr(compiled, 'reads', frozenset())
+
+
+def _reading(func, names):
+    func.reads = frozenset(names)
+    return func
+
+
+def compile_expression(markup):
+    """Compile a literal or variable path into a callable taking the context"""
+    markup = markup.strip()
+
+    if not markup:
+        return lambda ctx: None
+    if markup[0] in '"\'' and markup[-1] == markup[0] and len(markup) > 1:
+        value = markup[1:-1]
+        return lambda ctx: value
+    if NUMBER_RE.match(markup):
+        value = float(markup) if '.' in markup else int(markup)
+        return lambda ctx: value
+    if markup in LITERALS:
+        value = LITERALS[markup]
+        return lambda ctx: value
+    if markup in ('empty', 'blank'):
+        return lambda ctx: EMPTY
+
+    range_match = RANGE_RE.match(markup)
+    if range_match:
+        start = compile_expression(range_match.group(1))
+        stop = compile_expression(range_match.group(2))
+        return _reading(lambda ctx: list(range(int(start(ctx)), int(stop(ctx)) + 1)), reads(start) | reads(stop))
+
+    # Variable path: name.attr[0].attr["key"]
+    steps = []
+    names = set()
+    for match in PATH_PART_RE.finditer(markup):
+        if match.group(1) is not None:
+            step = compile_expression(match.group(1))
+            names |= reads(step)
+            if not steps:
+                names.add(DYNAMIC_ROOT)
+            steps.append(step)
+        else:
+            name = match.group(2)
+            if not steps:
+                names.add(name)
+            steps.append(lambda ctx, name=name: name)
+
+    if not steps:
+        return lambda ctx: None
+
+    first = steps[0]
+    rest = steps[1:]
+
+    def resolve(ctx):
+        value = ctx.get(first(ctx))
+        for step in rest:
+            value = lookup(value, step(ctx))
+            if value is None:
+                return None
+        return value
+
+    return _reading(resolve, names)
+
+
+class _Empty:
+    """Liquid's `empty` keyword: equal to any empty string, list or dict"""
+
+    def __eq__(self, other):
+        return other is self or (hasattr(other, '__len__') and len(other) == 0)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = object.__hash__
+
+
+EMPTY = _Empty()
+
+
+def compare(left, op, right):
+    """Evaluate a Liquid comparison operator"""
+    try:
+        if op == '==':
+            return left == right
+        if op in ('!=', '<>'):
+            return left != right
+        if op == 'contains':
+            if left is None or right is None:
+                return False
+            if isinstance(left, str):
+                return str(right) in left
+            return right in left
+        if left is None or right is None:
+            return False
+        if op == '<':
+            return left < right
+        if op == '>':
+            return left > right
+        if op == '<=':
+            return left <= right
+        if op == '>=':
+            return left >= right
+    except TypeError:
+        return False
+    raise TemplateSyntaxError(f'Unknown operator: {op}')
+
+
+def is_truthy(value):
+    """Liquid truthiness: only nil and false are falsy"""
+    return value is not None and value is not False
+
+
+def compile_condition(markup):
+    """Compile an if/unless condition; and/or bind right to left as in Liquid"""
+    tokens = EXPR_TOKEN_RE.findall(markup)
+    return _compile_condition_tokens(tokens)
+
+
+def _compile_condition_tokens(tokens):
+    for i, token in enumerate(tokens):
+        if token in ('and', 'or'):
+            left = _compile_comparison(tokens[:i])
+            right = _compile_condition_tokens(tokens[i + 1:])
+            names = reads(left) | reads(right)
+            if token == 'and':
+                return _reading(lambda ctx: left(ctx) and right(ctx), names)
+            return _reading(lambda ctx: left(ctx) or right(ctx), names)
+    return _compile_comparison(tokens)
+
+
+def _compile_comparison(tokens):
+    if len(tokens) == 1:
+        value = compile_expression(tokens[0])
+        return _reading(lambda ctx: is_truthy(value(ctx)), reads(value))
+    if len(tokens) == 3:
+        left = compile_expression(tokens[0])
+        op = tokens[1]
+        right = compile_expression(tokens[2])
+        return _reading(lambda ctx: compare(left(ctx), op, right(ctx)), reads(left) | reads(right))
+    raise TemplateSyntaxError(f'Invalid condition: {" ".join(tokens)}')
+
+
+def compile_filtered(markup):
+    """Compile `expr | filter: arg, arg | filter` into (expression, filters)"""
+    parts = split_outside_quotes(markup, '|')
+    expression = compile_expression(parts[0])
+    filters = []
+    for part in parts[1:]:
+        name, _, args = part.partition(':')
+        arg_exprs = [compile_expression(arg) for arg in split_outside_quotes(args, ',')] if args.strip() else []
+        filters.append((name.strip(), arg_exprs))
+    return expression, filters
+
+
+# ---------------------------------------------------------------------------
+# Filters
+# ---------------------------------------------------------------------------
+
+def _to_number(value):
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value) if '.' in str(value) else int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if value in ('now', 'today'):
+        return datetime.now()
+    if isinstance(value, str):
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+    return None
+
+
+def filter_date(value, fmt=None):
+    """Format a date with a strftime pattern"""
+    dt = _to_datetime(value)
+    if dt is None or not fmt:
+        return value
+    try:
+        return dt.strftime(fmt)
+    except ValueError:
+        return dt.strftime(fmt.replace('%-', '%'))
+
+
+def filter_date_to_xmlschema(value):
+    """Format a date as ISO 8601"""
+    dt = _to_datetime(value)
+    return dt.isoformat() if dt else value
+
+
+def filter_number_of_words(value):
+    """Count words in a string"""
+    return len(WORD_RE.findall(str(value or '')))
+
+
+def filter_divided_by(value, divisor):
+    """Divide; integer division when both operands are integers"""
+    value, divisor = _to_number(value), _to_number(divisor)
+    if not divisor:
+        return 0
+    if isinstance(value, int) and isinstance(divisor, int):
+        return value // divisor
+    return value / divisor
+
+
+def filter_truncate(value, length=50, ellipsis='...'):
+    """Truncate a string to length characters including the ellipsis"""
+    value = str(value or '')
+    length = int(_to_number(length))
+    if len(value) <= length:
+        return value
+    return value[:max(length - len(ellipsis), 0)] + ellipsis
+
+
+def filter_truncatewords(value, count=15, ellipsis='...'):
+    """Truncate a string to a number of words"""
+    words = str(value or '').split()
+    count = int(_to_number(count))
+    if len(words) <= count:
+        return ' '.join(words)
+    return ' '.join(words[:count]) + ellipsis
+
+
+def filter_escape(value):
+    """Escape HTML special characters"""
+    return (str(value if value is not None else '')
+            .replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            .replace('"', '&quot;').replace("'", '&#39;'))
+
+
+def filter_where(value, key, target=None):
+    """Select items from a list whose key equals target"""
+    return [item for item in (value or []) if lookup(item, key) == target]
+
+
+FILTERS = {
+    'default': lambda v, d=None: v if v not in (None, False, '') and v != [] else d,
+    'append': lambda v, s='': f'{"" if v is None else v}{"" if s is None else s}',
+    'prepend': lambda v, s='': f'{"" if s is None else s}{"" if v is None else v}',
+    'relative_url': lambda v: '' if v is None else str(v),
+    'absolute_url': lambda v: '' if v is None else str(v),
+    'date': filter_date,
+    'date_to_xmlschema': filter_date_to_xmlschema,
+    'date_to_string': lambda v: filter_date(v, '%d %b %Y'),
+    'date_to_long_string': lambda v: filter_date(v, '%d %B %Y'),
+    'number_of_words': filter_number_of_words,
+    'divided_by': filter_divided_by,
+    'times': lambda v, n: _to_number(v) * _to_number(n),
+    'plus': lambda v, n: _to_number(v) + _to_number(n),
+    'minus': lambda v, n: _to_number(v) - _to_number(n),
+    'modulo': lambda v, n: _to_number(v) % _to_number(n) if _to_number(n) else 0,
+    'at_least': lambda v, n: max(_to_number(v), _to_number(n)),
+    'at_most': lambda v, n: min(_to_number(v), _to_number(n)),
+    'size': lambda v: len(v) if hasattr(v, '__len__') else 0,
+    'first': lambda v: v[0] if v else None,
+    'last': lambda v: v[-1] if v else None,
+    'join': lambda v, sep=' ': sep.join(str(x) for x in v) if isinstance(v, (list, tuple)) else v,
+    'split': lambda v, sep: str(v or '').split(sep),
+    'reverse': lambda v: list(reversed(v)) if v else [],
+    'sort': lambda v, key=None: sorted(v, key=(lambda x: lookup(x, key)) if key else None) if v else [],
+    'where': filter_where,
+    'upcase': lambda v: str(v or '').upper(),
+    'downcase': lambda v: str(v or '').lower(),
+    'capitalize': lambda v: str(v or '').capitalize(),
+    'strip': lambda v: str(v or '').strip(),
+    'strip_html': lambda v: HTML_TAG_RE.sub('', str(v or '')),
+    'strip_newlines': lambda v: str(v or '').replace('\r', '').replace('\n', ''),
+    'replace': lambda v, a, b='': str(v or '').replace(str(a), str(b)),
+    'remove': lambda v, a: str(v or '').replace(str(a), ''),
+    'truncate': filter_truncate,
+    'truncatewords': filter_truncatewords,
+    'escape': filter_escape,
+    'xml_escape': filter_escape,
+    'slugify': lambda v: re.sub(r'[^a-z0-9]+', '-', str(v or '').lower()).strip('-'),
+    'jsonify': lambda v: json.dumps(v, default=str),
+}
+
+
+# ---------------------------------------------------------------------------
+# Nodes
+# ---------------------------------------------------------------------------
+
+def to_output(value):
+    """Convert a rendered value to its string form"""
+    if value is None or value is EMPTY:
+        return ''
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, (list, tuple)):
+        return ''.join(to_output(v) for v in value)
+    return str(value)
+
+
+class Text:
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def render(self, ctx, out):
+        out.append(self.text)
+
+
+class Variable:
+    __slots__ = ('expression', 'filters')
+
+    def __init__(self, markup):
+        self.expression, self.filters = compile_filtered(markup)
+
+    @property
+    def reads(self):
+        """Root names of the expression and the filters' arguments (never the filter names)"""
+        names = set(reads(self.expression))
+        for _, args in self.filters:
+            for arg in args:
+                names |= reads(arg)
+        return names
+
+    def evaluate(self, ctx):
+        value = self.expression(ctx)
+        for name, args in self.filters:
+            func = ctx.env.filters.get(name)
+            if func is None:
+                continue
+            value = func(value, *[arg(ctx) for arg in args])
+        return value
+
+    def render(self, ctx, out):
+        out.append(to_output(self.evaluate(ctx)))
+
+
+class If:
+    __slots__ = ('branches', 'else_body')
+
+    def __init__(self, branches, else_body):
+        self.branches = branches
+        self.else_body = else_body
+
+    def render(self, ctx, out):
+        for condition, body in self.branches:
+            if condition(ctx):
+                render_nodes(body, ctx, out)
+                return
+        if self.else_body:
+            render_nodes(self.else_body, ctx, out)
+
+
+class For:
+    __slots__ = ('name', 'iterable', 'limit', 'offset', 'reversed', 'body', 'else_body',
+                 'key', 'item_only')
+
+    def __init__(self, markup, body, else_body, key=None):
+        match = FOR_RE.match(markup)
+        if not match:
+            raise TemplateSyntaxError(f'Invalid for tag: {markup}')
+        self.name = match.group(1)
+        self.iterable = compile_expression(match.group(2))
+        options = match.group(3)
+        self.reversed = 'reversed' in options.split()
+        self.limit = self._option(options, 'limit')
+        self.offset = self._option(options, 'offset')
+        self.body = body
+        self.else_body = else_body
+        self.key = key                  # Hash of the loop's source, stable across processes
+        self.item_only = key is not None and self._reads_only_item()
+
+    @staticmethod
+    def _option(options, name):
+        match = re.search(name + r'\s*:\s*(\S+)', options)
+        return compile_expression(match.group(1)) if match else None
+
+    def _reads_only_item(self):
+        """True if the body's output depends on nothing but the loop variable
+
+        Decided from the nodes: outputs and conditions may only read the loop
+        variable (or a nested loop's); forloop, other variables, includes and
+        custom tags rule a loop out, and so do assign and capture, whose
+        changes to the context would be skipped when a cached item is reused.
+        """
+        local = {self.name}
+        names = set()
+        for node in walk_nodes(self.body):
+            if isinstance(node, (Include, Tag, Assign, Capture)):
+                return False
+            if isinstance(node, Variable):
+                names |= node.reads
+            elif isinstance(node, If):
+                for condition, _ in node.branches:
+                    names |= reads(condition)
+            elif isinstance(node, For):
+                local.add(node.name)
+                for expression in (node.iterable, node.limit, node.offset):
+                    names |= reads(expression)
+        return names <= local
+
+    def render(self, ctx, out):
+        items = self.iterable(ctx)
+        if isinstance(items, dict):
+            items = list(items.items())
+        items = list(items or [])
+        if self.offset:
+            items = items[int(_to_number(self.offset(ctx))):]
+        if self.limit:
+            items = items[:int(_to_number(self.limit(ctx)))]
+        if self.reversed:
+            items.reverse()
+
+        if not items:
+            if self.else_body:
+                render_nodes(self.else_body, ctx, out)
+            return
+
+        fragment = ctx.env.fragment if self.item_only else None
+
+        length = len(items)
+        forloop = {'length': length}
+        scope = {'forloop': forloop}
+        ctx.push(scope)
+        try:
+            for index, item in enumerate(items):
+                forloop['index0'] = index
+                forloop['index'] = index + 1
+                forloop['rindex'] = length - index
+                forloop['rindex0'] = length - index - 1
+                forloop['first'] = index == 0
+                forloop['last'] = index == length - 1
+                scope[self.name] = item
+                if fragment is not None:
+                    html = fragment(self, item, lambda: self._render_body(ctx))
+                    if html is not None:
+                        out.append(html)
+                        continue
+                render_nodes(self.body, ctx, out)
+        finally:
+            ctx.pop()
+
+    def _render_body(self, ctx):
+        body = []
+        render_nodes(self.body, ctx, body)
+        return ''.join(body)
+
+
+class Assign:
+    __slots__ = ('name', 'value')
+
+    def __init__(self, markup):
+        match = ASSIGN_RE.match(markup)
+        if not match:
+            raise TemplateSyntaxError(f'Invalid assign tag: {markup}')
+        self.name = match.group(1)
+        self.value = Variable(match.group(2))
+
+    def render(self, ctx, out):
+        ctx.assign(self.name, self.value.evaluate(ctx))
+
+
+class Capture:
+    __slots__ = ('name', 'body')
+
+    def __init__(self, name, body):
+        self.name = name
+        self.body = body
+
+    def render(self, ctx, out):
+        captured = []
+        render_nodes(self.body, ctx, captured)
+        ctx.assign(self.name, ''.join(captured))
+
+
+class Include:
+    __slots__ = ('name', 'params')
+
+    def __init__(self, markup):
+        parts = markup.split(None, 1)
+        if not parts:
+            raise TemplateSyntaxError('Include tag requires a file name')
+        self.name = parts[0]
+        self.params = [(key, compile_expression(value))
+                       for key, value in INCLUDE_PARAM_RE.findall(parts[1] if len(parts) > 1 else '')]
+
+    def render(self, ctx, out):
+        template = ctx.env.get_include(self.name)
+        if template is None:
+            return
+        ctx.push({'include': {key: value(ctx) for key, value in self.params}})
+        try:
+            render_nodes(template.nodes, ctx, out)
+        finally:
+            ctx.pop()
+
+
+class Tag:
+    """Simple custom tag ({% seo %}, {% feed_meta %}) rendered by an environment callback"""
+    __slots__ = ('name', 'markup')
+
+    def __init__(self, name, markup):
+        self.name = name
+        self.markup = markup
+
+    def render(self, ctx, out):
+        handler = ctx.env.tags.get(self.name)
+        if handler is not None:
+            out.append(to_output(handler(ctx, self.markup)))
+
+
+def render_nodes(nodes, ctx, out):
+    for node in nodes:
+        node.render(ctx, out)
+
+
+def walk_nodes(nodes):
+    """Every node in a tree, depth first"""
+    for node in nodes:
+        yield node
+        if isinstance(node, If):
+            for _, body in node.branches:
+                yield from walk_nodes(body)
+            yield from walk_nodes(node.else_body)
+        elif isinstance(node, For):
+            yield from walk_nodes(node.body)
+            yield from walk_nodes(node.else_body)
+        elif isinstance(node, Capture):
+            yield from walk_nodes(node.body)
+
+
+# ---------------------------------------------------------------------------
+# Parser
+# ---------------------------------------------------------------------------
+
+def tokenize(source):
+    """Split source into text and tag tokens, applying whitespace control"""
+    tokens = [t for t in TOKEN_RE.split(source) if t]
+    for i, token in enumerate(tokens):
+        if token.startswith(('{{-', '{%-')) and i > 0 and not _is_tag(tokens[i - 1]):
+            tokens[i - 1] = tokens[i - 1].rstrip()
+        if token.endswith(('-}}', '-%}')) and i + 1 < len(tokens) and not _is_tag(tokens[i + 1]):
+            tokens[i + 1] = tokens[i + 1].lstrip()
+    return tokens
+
+
+def _is_tag(token):
+    return token.startswith(('{{', '{%'))
+
+
+class Parser:
+    def __init__(self, source):
+        self.tokens = tokenize(source)
+        self.pos = 0
+        self.references = set()
+
+    def collect_references(self, markup):
+        for match in REFERENCE_RE.finditer(markup):
+            if match.group(1):
+                self.references.add(match.group(1))
+
+    def parse(self):
+        nodes, end = self.parse_block(())
+        return nodes
+
+    def parse_block(self, terminators):
+        """Parse nodes until one of the terminator tags; returns (nodes, (tag, markup))"""
+        nodes = []
+        while self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            self.pos += 1
+
+            if token.startswith('{{'):
+                match = OUTPUT_RE.match(token)
+                if match and match.group(1):
+                    self.collect_references(match.group(1))
+                    nodes.append(Variable(match.group(1)))
+                continue
+
+            if not token.startswith('{%'):
+                nodes.append(Text(token))
+                continue
+
+            match = TAG_RE.match(token)
+            if not match:
+                continue
+            name, markup = match.group(1), match.group(2)
+            self.collect_references(markup)
+
+            if name in terminators:
+                return nodes, (name, markup)
+
+            if name == 'if':
+                nodes.append(self.parse_if(markup, negate=False))
+            elif name == 'unless':
+                nodes.append(self.parse_if(markup, negate=True))
+            elif name == 'for':
+                start = self.pos
+                body, (end, _) = self.expect(('else', 'endfor'), 'for')
+                else_body = self.expect(('endfor',), 'for')[0] if end == 'else' else []
+                key = hashlib.sha1((markup + ''.join(self.tokens[start:self.pos])).encode('utf-8')).hexdigest()[:16]
+                nodes.append(For(markup, body, else_body, key))
+            elif name == 'assign':
+                nodes.append(Assign(markup))
+            elif name == 'capture':
+                body, _ = self.expect(('endcapture',), 'capture')
+                nodes.append(Capture(markup.strip(), body))
+            elif name == 'include':
+                nodes.append(Include(markup))
+            elif name == 'comment':
+                self.skip_raw('endcomment')
+            elif name == 'raw':
+                nodes.append(Text(self.skip_raw('endraw')))
+            else:
+                nodes.append(Tag(name, markup))
+
+        if terminators:
+            raise TemplateSyntaxError(f'Missing {{% {terminators[-1]} %}}')
+        return nodes, None
+
+    def expect(self, terminators, opener):
+        nodes, end = self.parse_block(terminators)
+        if end is None:
+            raise TemplateSyntaxError(f'Unclosed {{% {opener} %}}')
+        return nodes, end
+
+    def parse_if(self, markup, negate):
+        closer = 'endunless' if negate else 'endif'
+        condition = compile_condition(markup)
+        if negate:
+            condition = (lambda c: _reading(lambda ctx: not c(ctx), reads(c)))(condition)
+
+        branches = []
+        else_body = []
+        while True:
+            body, (end, next_markup) = self.expect(('elsif', 'else', closer), 'unless' if negate else 'if')
+            branches.append((condition, body))
+            if end == 'elsif':
+                condition = compile_condition(next_markup)
+            elif end == 'else':
+                else_body = self.expect((closer,), 'else')[0]
+                break
+            else:
+                break
+        return If(branches, else_body)
+
+    def skip_raw(self, closer):
+        """Consume tokens verbatim up to the closing tag"""
+        text = []
+        while self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            self.pos += 1
+            match = TAG_RE.match(token) if token.startswith('{%') else None
+            if match and match.group(1) == closer:
+                return ''.join(text)
+            text.append(token)
+        raise TemplateSyntaxError(f'Missing {{% {closer} %}}')
+
+
+# ---------------------------------------------------------------------------
+# Templates and environment
+# ---------------------------------------------------------------------------
+
+class Template:
+    """A compiled template with its front matter"""
+
+    def __init__(self, source, front_matter=None, path=None):
+        self.has_front_matter = front_matter is not None
+        self.front_matter = front_matter or {}
+        self.path = path
+        parser = Parser(source)
+        self.nodes = parser.parse()
+        self.references = parser.references
+
+    def uses(self, name):
+        """True if the template references the variable `name` or anything below it"""
+        prefix = name + '.'
+        return any(ref == name or ref.startswith(prefix) for ref in self.references)
+
+    def render(self, ctx):
+        out = []
+        render_nodes(self.nodes, ctx, out)
+        return ''.join(out)
+
+
+class Context:
+    """Variable scopes for a single render"""
+
+    def __init__(self, env, variables):
+        self.env = env
+        self.scopes = [dict(variables)]
+
+    def get(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def assign(self, name, value):
+        self.scopes[0][name] = value
+
+    def push(self, scope):
+        self.scopes.append(scope)
+
+    def pop(self):
+        self.scopes.pop()
+
+
+class Environment:
+    """Template cache keyed by path and mtime, plus filters, tags and include lookup
+
+    An optional store (a warm cache section) keeps each file's front matter
+    and template body across restarts, so a new process only re-runs the
+    Liquid parser, not the YAML front matter parser.
+
+    An optional fragment(loop, item, render) callback can serve a for loop's
+    body for one item from a cache: it is only asked for loops whose body
+    reads nothing but the loop variable, and returns the body's HTML (calling
+    render() on a miss) or None to have the body rendered as usual.
+    """
+
+    def __init__(self, include_loader=None, filters=None, tags=None, store=None, fragment=None):
+        self.include_loader = include_loader
+        self.fragment = fragment
+        self.filters = dict(FILTERS)
+        self.filters.update(filters or {})
+        self.tags = dict(tags or {})
+        self.store = store   # path -> (mtime_ns, content hash, front matter or None, body)
+        self._cache = {}
+
+    def get_template(self, path):
+        """Load and compile a template file, reusing the cached tree while its mtime is unchanged"""
+        path = Path(path)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            self._cache.pop(path, None)
+            return None
+
+        cached = self._cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        front_matter, body = self._read(path, mtime)
+        template = Template(body, front_matter, path)
+        self._cache[path] = (mtime, template)
+        return template
+
+    def _read(self, path, mtime):
+        """(front matter or None, body) of a template file, from the store when the file is unchanged"""
+        stored = self.store.get(str(path)) if self.store is not None else None
+        if stored is not None and stored[0] == mtime:
+            return stored[2], stored[3]
+
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+        if stored is not None and stored[1] == digest:
+            front_matter, body = stored[2], stored[3]
+        elif source.startswith('---'):
+            # Imported on first use: warm starts take front matter from the store
+            import frontmatter
+            post = frontmatter.loads(source)
+            front_matter, body = dict(post.metadata), post.content
+        else:
+            front_matter, body = None, source
+
+        if self.store is not None:
+            self.store.put(str(path), (mtime, digest, front_matter, body))
+        return front_matter, body
+
+    def get_include(self, name):
+        if self.include_loader is None:
+            return None
+        return self.include_loader(name)
+
+    def from_string(self, source):
+        return Template(source)
+
+    def render(self, template, variables):
+        if isinstance(template, str):
+            template = self.from_string(template)
+        return template.render(Context(self, variables))
@@ -0,0 +1,95 @@
+"""
+Live reload over Server-Sent Events
+Pages get a small script that listens on /__livereload; the server pushes
+`reload` after content changes and `css` (with the stylesheet path) after
+stylesheet-only changes, which the script hot-swaps without a page reload
+"""
+
+import queue
+import threading
+
+ENDPOINT = '/__livereload'
+
+CLIENT_SCRIPT = '''<script>
+(function() {
+  if (!window.EventSource) return;
+  var source = new EventSource('%s');
+  source.addEventListener('reload', function() { location.reload(); });
+  source.addEventListener('css', function(e) {
+    var swapped = false;
+    document.querySelectorAll('link[rel="stylesheet"]').forEach(function(link) {
+      var url = new URL(link.href, location.href);
+      if (url.pathname === e.data) {
+        url.searchParams.set('livereload', Date.now());
+        link.href = url.toString();
+        swapped = true;
+      }
+    });
+    if (!swapped) location.reload();
+  });
+})();
+</script>
+''' % ENDPOINT
+
+
+def inject_script(html):
+    """Insert the live reload client before </body> (or at the end)"""
+    index = html.rfind('</body>')
+    if index == -1:
+        return html + CLIENT_SCRIPT
+    return html[:index] + CLIENT_SCRIPT + html[index:]
+
+
+RETRY_MESSAGE = 'retry: 1000\n\n'
+KEEPALIVE_MESSAGE = ': keepalive\n\n'
+
+
+def event_message(event, data=''):
+    return f'event: {event}\ndata: {data}\n\n'
+
+
+class LiveReload:
+    """Fan-out of reload events to every connected browser
+
+    A client is anything with put((event, data)): a queue.Queue for the
+    blocking stream() below, or a bridge onto an event loop (asgi.py).
+    """
+
+    def __init__(self, keepalive=15):
+        self.keepalive = keepalive
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event, data=''):
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.put((event, data))
+
+    def subscribe(self, client):
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def stream(self):
+        """Generator of SSE messages for one client"""
+        client = self.subscribe(queue.Queue())
+        try:
+            yield RETRY_MESSAGE
+            while True:
+                try:
+                    event, data = client.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield KEEPALIVE_MESSAGE
+                    continue
+                yield event_message(event, data)
+        finally:
+            self.unsubscribe(client)
+
+    @property
+    def client_count(self):
+        return len(self._clients)
@@ -0,0 +1,77 @@
+"""
+Pagination - the preview's stand-in for jekyll-paginate
+With `paginate: N` in _config.yml, the index.html nearest above paginate_path
+lists N posts per page through the `paginator` variable; page 1 is that page
+itself and later pages are served at paginate_path with :num filled in, e.g.
+/blog/page/2/. A page only slices its own posts out of the post list, so
+rendering it costs the same however large the archive gets
+"""
+
+import math
+import posixpath
+import re
+
+DEFAULT_PAGINATE_PATH = '/page:num/'   # jekyll-paginate's default
+
+
+def settings(config):
+    """(posts per page, paginate_path) when the config turns pagination on, else None"""
+    try:
+        per_page = int(config.get('paginate') or 0)
+    except (TypeError, ValueError):
+        return None
+    if per_page < 1:
+        return None
+    return per_page, '/' + str(config.get('paginate_path') or DEFAULT_PAGINATE_PATH).lstrip('/')
+
+
+def template_folders(paginate_path):
+    """Folders (no leading/trailing slashes) whose index.html may be paginated, deepest first
+
+    As in jekyll-paginate: the folder paginate_path lives in, then each of its parents.
+    """
+    folder = posixpath.dirname(paginate_path.rstrip('/')).strip('/')
+    folders = []
+    while folder:
+        folders.append(folder)
+        folder = posixpath.dirname(folder)
+    folders.append('')
+    return folders
+
+
+def page_path(paginate_path, num, first_url):
+    """URL of page num: the paginated page's own URL for page 1, paginate_path with :num after that"""
+    if num <= 1:
+        return first_url
+    return paginate_path.replace(':num', str(num))
+
+
+def page_number(paginate_path, path):
+    """Page number (2 and up) a request path asks for under paginate_path, or None"""
+    pattern = re.escape(paginate_path.strip('/')).replace(re.escape(':num'), r'(\d+)')
+    match = re.fullmatch(pattern, path.strip('/'))
+    if not match:
+        return None
+    num = int(match.group(1))
+    return num if num > 1 else None
+
+
+def paginator(posts, per_page, num, paginate_path, first_url):
+    """The `paginator` variable for page num of posts, or None past the last page"""
+    total_pages = math.ceil(len(posts) / per_page)
+    if num < 1 or (num > 1 and num > total_pages):
+        return None
+    start = (num - 1) * per_page
+    previous_page = num - 1 if num > 1 else None
+    next_page = num + 1 if num < total_pages else None
+    return {
+        'page': num,
+        'per_page': per_page,
+        'posts': posts[start:start + per_page],
+        'total_posts': len(posts),
+        'total_pages': total_pages,
+        'previous_page': previous_page,
+        'previous_page_path': page_path(paginate_path, previous_page, first_url) if previous_page else None,
+        'next_page': next_page,
+        'next_page_path': page_path(paginate_path, next_page, first_url) if next_page else None,
+    }
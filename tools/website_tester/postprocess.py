@@ -0,0 +1,404 @@
+"""
+HTML output stage - minification, critical CSS and image dimensions for rendered pages
+Optional (website_tester --optimize, build.py --optimize): the rules of the
+site stylesheet that style the top of a page are inlined (when they fit a small
+budget) and the full file is loaded without blocking rendering, <img> tags get width/height from an image
+metadata index (plus loading="lazy" below the first content image), and
+inter-tag whitespace and comments are dropped
+"""
+
+import os
+import re
+import struct
+import threading
+
+# Elements whose contents are left exactly as they are
+PRESERVE_RE = re.compile(r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.DOTALL | re.IGNORECASE)
+COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+TAG_SPLIT_RE = re.compile(r'(<[^>]+>)')
+TAG_NAME_RE = re.compile(r'^</?([a-zA-Z][\w-]*)')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Whitespace next to these tags never renders, so it can go entirely
+BLOCK_TAGS = {
+    'html', 'head', 'body', 'meta', 'link', 'title', 'script', 'style', 'noscript', 'base',
+    'div', 'section', 'article', 'aside', 'nav', 'header', 'footer', 'main', 'figure', 'figcaption',
+    'p', 'ul', 'ol', 'li', 'dl', 'dt', 'dd', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'br', 'blockquote', 'pre', 'form', 'fieldset', 'details',
+    'summary', '!doctype',
+}
+
+# Page tokens a stylesheet selector can depend on
+CLASS_ATTR_RE = re.compile(r'\sclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.IGNORECASE)
+ID_ATTR_RE = re.compile(r'\sid\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.IGNORECASE)
+PAGE_TAG_RE = re.compile(r'<([a-zA-Z][\w-]*)')
+
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+PSEUDO_RE = re.compile(r'::?[\w-]+(?:\([^)]*\))?')
+ATTRIBUTE_RE = re.compile(r'\[[^\]]*\]')
+SELECTOR_CLASS_RE = re.compile(r'\.([\w-]+)')
+SELECTOR_ID_RE = re.compile(r'#([\w-]+)')
+SELECTOR_TAG_RE = re.compile(r'(?:^|[\s>+~])([a-zA-Z][\w-]*)')
+# Grouping at-rules whose inner rules are filtered; other at-rules are kept whole
+NESTED_AT_RULES = ('@media', '@supports', '@layer')
+# Selectors left to the full stylesheet: interaction states and attribute variants
+# ([data-theme="dark"] and the like), which the first paint doesn't need
+DEFERRED_SELECTOR_RE = re.compile(r'\[|:(?:hover|focus|focus-visible|focus-within|active|visited)\b')
+DEFERRED_MEDIA = ('print', 'prefers-color-scheme')
+BODY_TAG_RE = re.compile(r'<body\b[^>]*>', re.IGNORECASE)
+
+# Critical CSS covers the elements in the first FOLD_CHARS of the body (comments and
+# extra whitespace removed), and is only inlined while it stays under the budget
+# (and smaller than the whole sheet)
+FOLD_CHARS = 3000
+CRITICAL_CSS_LIMIT = 12 * 1024
+
+IMG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+ATTR_RE = re.compile(r'([\w-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+MAIN_CONTENT_RE = re.compile(r'<(?:main|section)\b[^>]*\bid\s*=\s*["\']main-content["\']', re.IGNORECASE)
+SVG_LENGTH_RE = re.compile(r'^\s*([\d.]+)\s*(px)?\s*$')
+
+
+# --- Minification ---
+
+def minify_html(html):
+    """Drop comments and whitespace that doesn't render; <pre>, <textarea>, <script> and <style> are kept as-is"""
+    preserved = []
+
+    def keep(match):
+        preserved.append(match.group(0))
+        return f'\x00{len(preserved) - 1}\x00'
+
+    html = PRESERVE_RE.sub(keep, html)
+    html = COMMENT_RE.sub('', html)
+
+    parts = TAG_SPLIT_RE.split(html)
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            out.append(part)
+            continue
+        if not part:
+            continue
+        if part.isspace():
+            before = _tag_name(parts[i - 1]) if i > 0 else None
+            after = _tag_name(parts[i + 1]) if i + 1 < len(parts) else None
+            if before in BLOCK_TAGS or after in BLOCK_TAGS or before is None or after is None:
+                continue
+        out.append(WHITESPACE_RE.sub(' ', part))
+
+    html = ''.join(out)
+    return re.sub('\x00(\\d+)\x00', lambda m: preserved[int(m.group(1))], html)
+
+
+def _tag_name(tag):
+    match = TAG_NAME_RE.match(tag)
+    if match:
+        return match.group(1).lower()
+    return '!doctype' if tag[:2] == '<!' else None
+
+
+# --- Critical CSS ---
+
+def parse_css(css):
+    """Split a stylesheet into rules: (selector, body) or (at-rule prelude, [nested rules]) or (at-rule, None)"""
+    css = CSS_COMMENT_RE.sub('', css)
+    rules, _ = _parse_block(css, 0)
+    return rules
+
+
+def _parse_block(css, i):
+    rules = []
+    length = len(css)
+    while i < length:
+        brace = css.find('{', i)
+        close = css.find('}', i)
+        semicolon = css.find(';', i)
+        if close != -1 and (brace == -1 or close < brace):
+            # End of the enclosing block
+            return rules, close + 1
+        if brace == -1:
+            break
+        prelude = css[i:brace].strip()
+        if prelude.startswith('@') and semicolon != -1 and semicolon < brace:
+            # Statement at-rule (@import, @charset)
+            rules.append((css[i:semicolon + 1].strip(), None))
+            i = semicolon + 1
+            continue
+        if prelude.lower().startswith(NESTED_AT_RULES):
+            nested, i = _parse_block(css, brace + 1)
+            rules.append((prelude, nested))
+            continue
+        end = _matching_brace(css, brace)
+        rules.append((prelude, css[brace + 1:end].strip()))
+        i = end + 1
+    return rules, length
+
+
+def _matching_brace(css, start):
+    depth = 0
+    for j in range(start, len(css)):
+        if css[j] == '{':
+            depth += 1
+        elif css[j] == '}':
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(css)
+
+
+def selector_requirements(selector):
+    """(classes, ids, tags) an element must have somewhere on the page for the selector to match
+
+    Pseudo-classes, pseudo-elements and attribute selectors are ignored, so a
+    selector counts whenever it could match (:first-child, ::before...).
+    """
+    simple = ATTRIBUTE_RE.sub('', PSEUDO_RE.sub('', selector))
+    return (frozenset(SELECTOR_CLASS_RE.findall(simple)), frozenset(SELECTOR_ID_RE.findall(simple)),
+            frozenset(tag.lower() for tag in SELECTOR_TAG_RE.findall(simple)))
+
+
+def page_tokens(html):
+    """(classes, ids, tags) used in a page"""
+    classes = set()
+    for match in CLASS_ATTR_RE.finditer(html):
+        classes.update((match.group(1) or match.group(2) or '').split())
+    ids = {match.group(1) or match.group(2) for match in ID_ATTR_RE.finditer(html)}
+    tags = {tag.lower() for tag in PAGE_TAG_RE.findall(html)}
+    return classes, ids, tags
+
+
+def minify_css(text):
+    text = WHITESPACE_RE.sub(' ', text)
+    # Spaces before ':' are left alone: in a selector they mean a descendant
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return re.sub(r':\s+', ':', text).replace(';}', '}')
+
+
+def above_the_fold(html):
+    """The part of a page seen before scrolling: the <body> tag and the first FOLD_CHARS of its markup"""
+    match = BODY_TAG_RE.search(html)
+    body = html[match.start():] if match else html
+    return WHITESPACE_RE.sub(' ', COMMENT_RE.sub('', body))[:FOLD_CHARS]
+
+
+class Stylesheet:
+    """A parsed stylesheet that can pick out the rules the top of a page uses"""
+
+    def __init__(self, css):
+        self.rules = self._prepare(parse_css(css))
+        self.size = len(minify_css(CSS_COMMENT_RE.sub('', css)))
+
+    def _prepare(self, rules):
+        prepared = []
+        for prelude, body in rules:
+            if isinstance(body, list):
+                lower = prelude.lower()
+                if not (lower.startswith('@media') and any(media in lower for media in DEFERRED_MEDIA)):
+                    prepared.append((prelude, self._prepare(body)))
+            elif body is None or prelude.startswith('@'):
+                prepared.append((prelude, body, None))
+            else:
+                selectors = [s.strip() for s in prelude.split(',') if s.strip()]
+                prepared.append((prelude, body, [selector_requirements(s) for s in selectors
+                                                 if not DEFERRED_SELECTOR_RE.search(s)]))
+        return prepared
+
+    def critical(self, html):
+        """Minified CSS of the rules that can match something above the fold, or None if over budget"""
+        classes, ids, tags = page_tokens(above_the_fold(html))
+        tags |= {'html', 'body'}
+
+        def used(requirements):
+            return any(c <= classes and i <= ids and t <= tags for c, i, t in requirements)
+
+        def select(rules):
+            out = []
+            for rule in rules:
+                if len(rule) == 2:
+                    inner = select(rule[1])
+                    if inner:
+                        out.append(f'{rule[0]}{{{"".join(inner)}}}')
+                    continue
+                prelude, body, requirements = rule
+                if body is None:
+                    out.append(prelude)
+                elif requirements is None or used(requirements):
+                    out.append(f'{prelude}{{{body}}}')
+            return out
+
+        css = minify_css(''.join(select(self.rules)))
+        return css if len(css) <= min(CRITICAL_CSS_LIMIT, self.size) else None
+
+
+def defer_stylesheet(html, href_path, critical_css):
+    """Replace the blocking <link> to href_path with the inlined critical rules plus a non-blocking load
+
+    Without critical rules (None: over budget) the page keeps its plain link.
+    """
+    if not critical_css:
+        return html
+    link_re = re.compile(
+        r'<link\b[^>]*\bhref\s*=\s*["\']' + re.escape(href_path) + r'(?:\?[^"\']*)?["\'][^>]*>', re.IGNORECASE)
+    match = link_re.search(html)
+    if match is None or 'stylesheet' not in match.group(0).lower():
+        return html
+    href = ATTR_RE.findall(match.group(0))
+    url = next((a[1] or a[2] or a[3] for a in href if a[0].lower() == 'href'), href_path)
+    replacement = (
+        f'<style>{critical_css}</style>'
+        f'<link rel="preload" href="{url}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">'
+        f'<noscript><link rel="stylesheet" href="{url}"></noscript>'
+    )
+    return html[:match.start()] + replacement + html[match.end():]
+
+
+def has_deferred_stylesheet(html):
+    """True if defer_stylesheet inlined critical rules into the page"""
+    return '<style>' in html and 'as="style" onload=' in html
+
+
+# --- Image dimensions ---
+
+def image_size(path):
+    """(width, height) as displayed, read from the image header (PNG, GIF, JPEG, WebP, SVG), or None"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(64 * 1024)
+    except OSError:
+        return None
+    try:
+        if head.startswith(b'\x89PNG\r\n\x1a\n'):
+            return struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', head[6:10])
+        if head.startswith(b'\xff\xd8'):
+            return _jpeg_size(head)
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return _webp_size(head)
+        if path.lower().endswith('.svg'):
+            return _svg_size(head.decode('utf-8', errors='ignore'))
+    except (struct.error, ValueError, IndexError):
+        pass
+    return None
+
+
+def _jpeg_size(data):
+    i = 2
+    orientation = 1
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker == 0xE1 and data[i + 4:i + 10] == b'Exif\x00\x00':
+            orientation = _exif_orientation(data[i + 10:i + 2 + length])
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            # EXIF orientations 5-8 are displayed rotated by 90 degrees
+            return (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+        i += 2 + length
+    return None
+
+
+def _exif_orientation(tiff):
+    endian = '<' if tiff[:2] == b'II' else '>'
+    offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+    count = struct.unpack(endian + 'H', tiff[offset:offset + 2])[0]
+    for n in range(count):
+        entry = offset + 2 + n * 12
+        if struct.unpack(endian + 'H', tiff[entry:entry + 2])[0] == 0x0112:
+            return struct.unpack(endian + 'H', tiff[entry + 8:entry + 10])[0]
+    return 1
+
+
+def _webp_size(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        bits = struct.unpack('<I', data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    return None
+
+
+def _svg_size(text):
+    match = re.search(r'<svg\b[^>]*>', text, re.IGNORECASE)
+    if match is None:
+        return None
+    attrs = {a[0].lower(): a[1] or a[2] or a[3] for a in ATTR_RE.findall(match.group(0))}
+    width = SVG_LENGTH_RE.match(attrs.get('width', ''))
+    height = SVG_LENGTH_RE.match(attrs.get('height', ''))
+    if width and height:
+        return round(float(width.group(1))), round(float(height.group(1)))
+    view_box = attrs.get('viewbox', '').replace(',', ' ').split()
+    if len(view_box) == 4:
+        return round(float(view_box[2])), round(float(view_box[3]))
+    return None
+
+
+class ImageIndex:
+    """Image path -> (width, height), re-read only when the file's signature changes
+
+    Backed by an optional store (a warm cache section) so dimensions survive restarts.
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        key = str(path)
+        cached = self.store.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        size = image_size(key)
+        with self._lock:
+            if isinstance(self.store, dict):
+                self.store[key] = (signature, size)
+            else:
+                self.store.put(key, (signature, size))
+        return size
+
+
+def size_images(html, dimensions):
+    """Add width/height to <img> tags that lack them, and loading="lazy" after the first content image
+
+    dimensions(src) returns (width, height) or None.
+    """
+    main = MAIN_CONTENT_RE.search(html)
+    content_start = main.start() if main else 0
+    content_images = 0
+
+    def fix(match):
+        nonlocal content_images
+        tag = match.group(0)
+        attrs = {a[0].lower(): a[1] or a[2] or a[3] for a in ATTR_RE.findall(tag[4:])}
+        additions = []
+        if 'width' not in attrs and 'height' not in attrs and attrs.get('src'):
+            size = dimensions(attrs['src'])
+            if size:
+                additions.append(f'width="{size[0]}" height="{size[1]}"')
+        if match.start() >= content_start:
+            content_images += 1
+            # The first image may well be the largest paint; later ones wait until they're near the viewport
+            if content_images > 1 and 'loading' not in attrs:
+                additions.append('loading="lazy"')
+        if not additions:
+            return tag
+        end = -2 if tag.endswith('/>') else -1
+        return f'{tag[:end].rstrip()} {" ".join(additions)}{tag[end:]}'
+
+    return IMG_RE.sub(fix, html)
@@ -0,0 +1,161 @@
+"""
+Post index - keeps parsed posts in memory and re-reads only files that changed
+Change detection compares each file's mtime and size against the last scan;
+with a warm cache attached, parsed posts also survive restarts
+"""
+
+import hashlib
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+
+POST_FILENAME_RE = re.compile(r'(\d{4}-\d{2}-\d{2})-(.+)')
+HEADER_PREFIX_RE = re.compile(r'^#+\s*')
+
+
+def parse_post(post_file, text=None):
+    """Parse a post file (or its already read text) into the dict exposed to templates as a `site.posts` entry"""
+    # Imported on first use: warm starts take parsed posts from the cache
+    import frontmatter
+    if text is None:
+        with open(post_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    post = frontmatter.loads(text)
+
+    # Parse date from filename (YYYY-MM-DD-title.md)
+    filename = post_file.stem
+    date_match = POST_FILENAME_RE.match(filename)
+
+    if date_match:
+        slug = date_match.group(2)
+        post_date = datetime.strptime(date_match.group(1), '%Y-%m-%d')
+    else:
+        post_date = datetime.now()
+        slug = filename
+
+    # Get excerpt (first paragraph)
+    content_lines = post.content.strip().split('\n\n')
+    excerpt = content_lines[0] if content_lines else ''
+    # Remove markdown headers from excerpt
+    excerpt = HEADER_PREFIX_RE.sub('', excerpt)
+
+    return {
+        'title': post.metadata.get('title', slug.replace('-', ' ').title()),
+        'date': post.metadata.get('date', post_date),
+        'url': f'/blog/{filename}',
+        'slug': slug,
+        'excerpt': excerpt,
+        'tags': post.metadata.get('tags', []),
+        'layout': post.metadata.get('layout'),
+        'content': post.content,
+        'file_path': post_file
+    }
+
+
+class PostIndex:
+    """In-memory index of _posts with O(1) lookup by URL, filename stem or slug"""
+
+    def __init__(self, posts_dir, store=None):
+        self.posts_dir = Path(posts_dir)
+        self.store = store   # Warm cache section: path -> ((mtime_ns, size), content hash, post)
+        self._lock = threading.Lock()
+        self._entries = {}   # path -> ((mtime_ns, size), post)
+        self._posts = []
+        self._lookup = {}
+        self.version = 0
+        # With a file watcher feeding mark_changed(), refresh() only scans after a change
+        self.watched = False
+        self._changed = True
+
+    def mark_changed(self):
+        self._changed = True
+
+    def refresh(self):
+        """Re-scan the directory, re-parsing only new or modified files. Returns True if anything changed"""
+        if self.watched and not self._changed:
+            return False
+        with self._lock:
+            self._changed = False
+            seen = {}
+            try:
+                with os.scandir(self.posts_dir) as it:
+                    for entry in it:
+                        if entry.is_file() and entry.name.endswith('.md'):
+                            stat = entry.stat()
+                            seen[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                pass
+
+            changed = seen.keys() != self._entries.keys()
+            entries = {}
+            for path, signature in seen.items():
+                cached = self._entries.get(path)
+                if cached and cached[0] == signature:
+                    entries[path] = cached
+                    continue
+                changed = True
+                entries[path] = (signature, self._load(path, signature))
+
+            if changed:
+                self._entries = entries
+                self._rebuild()
+                if self.store is not None:
+                    for key in self.store.keys():
+                        if Path(key) not in entries:
+                            self.store.pop(key)
+            return changed
+
+    def _load(self, path, signature):
+        """Parse a new or modified post, taking it from the warm cache if its signature or content hash matches"""
+        stored = self.store.get(str(path)) if self.store is not None else None
+        if stored is not None and stored[0] == signature:
+            return stored[2]
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha1(data).hexdigest()
+            if stored is not None and stored[1] == digest:
+                post = stored[2]
+            else:
+                post = parse_post(path, data.decode('utf-8'))
+        except Exception as e:
+            # Remember the failure so the file is only retried once it changes
+            print(f"Error loading post {path}: {e}")
+            return None
+        if self.store is not None:
+            self.store.put(str(path), (signature, digest, post))
+        return post
+
+    def _rebuild(self):
+        """Rebuild the sorted post list and lookup table after a change"""
+        # Newest first, matching the filename order Jekyll uses
+        posts = [post for _, post in self._entries.values() if post is not None]
+        self._posts = sorted(posts, key=lambda post: post['file_path'].name, reverse=True)
+        lookup = {}
+        # Older posts first so a newer post wins when two share a bare slug
+        for post in reversed(self._posts):
+            lookup[post['slug']] = post
+        for post in self._posts:
+            lookup[post['file_path'].stem] = post
+            lookup[post['url']] = post
+        self._lookup = lookup
+        # Derived from the files rather than counted, so processes sharing a render cache agree on it
+        self.version = hashlib.sha1(repr(sorted(
+            (str(path), signature) for path, (signature, _) in self._entries.items())).encode()).hexdigest()[:16]
+
+    def entries(self):
+        """(path, (mtime_ns, size), post) for every file; post is None if it failed to parse"""
+        self.refresh()
+        return [(path, signature, post) for path, (signature, post) in self._entries.items()]
+
+    def posts(self):
+        """All posts, newest first"""
+        self.refresh()
+        return self._posts
+
+    def get(self, key):
+        """Find a post by URL (/blog/<stem>), filename stem or bare slug"""
+        self.refresh()
+        return self._lookup.get(key) or self._lookup.get(key.strip('/'))
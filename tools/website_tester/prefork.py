@@ -0,0 +1,191 @@
+"""
+Pre-fork serving mode for the site preview
+The parent loads the site (config, posts, routes), opens the listening
+socket and forks N workers, each running the threaded WSGI server on the
+inherited socket. Rendered pages, feed entries and post metadata live in a
+shared cache (shared_cache.py), so a page rendered by one worker is served
+from cache by the others and memory stays roughly flat as workers are added.
+One file watcher, in the parent, invalidates the shared entries once for
+every worker and logs the change; workers replay the log into their own
+routes, post indexes and live reload streams. Crashed workers are replaced.
+Needs os.fork (Linux, macOS)
+
+Usage: python prefork.py [--host HOST] [--port PORT] [--workers N] [--optimize]
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+from werkzeug.serving import make_server
+
+import app as site
+from shared_cache import SharedCache, default_directory
+from watcher import FileWatcher
+
+REPLAY_INTERVAL = 0.2   # Seconds between idle workers' checks for new change events
+
+
+class ChangeReplay:
+    """Applies the parent's change events to this worker, in order"""
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.seq = 0
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def sync(self):
+        """Catch up with the event log; a single shared-memory read when nothing is new"""
+        generation = self.shared.generation
+        if generation == self.generation:
+            return
+        with self._lock:
+            for seq, kind, paths in self.shared.events_since(self.seq):
+                if kind == 'watching':
+                    site.follow_notifications()
+                else:
+                    # The parent has already invalidated the shared store; only local state is updated here
+                    site.apply_site_change([Path(path) for path in paths])
+                self.seq = seq
+            self.generation = generation
+
+    def run(self):
+        """Keep idle workers current, so their live reload clients hear about changes too"""
+        while True:
+            time.sleep(REPLAY_INTERVAL)
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Worker {os.getpid()}: could not apply site changes: {e}")
+
+
+def share_caches(shared):
+    """Point the render caches and post indexes at the shared store, seeded from the warm cache"""
+    site.render_cache.store = shared.pages()
+    site.feed_entries.store = shared.pages('feed')
+    site.post_fragments.store = shared.pages('fragments')
+    for index, name in ((site.post_index, 'posts'), (site.drafts_index, 'drafts')):
+        section = shared.section(name)
+        if index.store is not None:
+            section.seed((key, index.store.get(key)) for key in index.store.keys())
+        index.store = section
+
+
+def serve_worker(listener, replay):
+    """Run one worker on the inherited socket until told to stop"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # Ctrl+C reaches the parent, which stops the workers
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    site.app.before_request(replay.sync)
+    threading.Thread(target=replay.run, daemon=True).start()
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, site.app, threaded=True, fd=listener.fileno())
+    try:
+        server.serve_forever()
+    except SystemExit:
+        pass
+    finally:
+        site.warm_cache.save()
+
+
+def spawn(listener, replay):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            serve_worker(listener, replay)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the site preview from several pre-forked worker processes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Worker processes (default: cores)')
+    parser.add_argument('--optimize', action='store_true', help='Minify pages, inline critical CSS and size images')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        sys.exit("Pre-fork mode needs os.fork (Linux or macOS); use app.py or asgi.py here")
+
+    shared = SharedCache(os.path.join(default_directory(str(site.CACHE_DIR)),
+                                      f'website-tester-{site.SITE_KEY}-{os.getpid()}.db'))
+    share_caches(shared)
+    site.app.config['LIVE_RELOAD'] = True
+    site.app.config['OPTIMIZE_HTML'] = args.optimize
+
+    # Everything parsed now is shared copy-on-write with the workers; frozen
+    # objects are left out of collections, so the GC doesn't copy their pages
+    site.post_index.refresh()
+    site.drafts_index.refresh()
+    posts = site.load_posts()
+    if posts:
+        # Loads the Markdown and front matter libraries and compiles the layouts once, for every worker
+        site.render_post(posts[0])
+    site.warm_cache.save()
+    gc.freeze()
+
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    listener.set_inheritable(True)
+    replay = ChangeReplay(shared)
+    workers = {spawn(listener, replay) for _ in range(max(1, args.workers))}
+
+    # Started after the fork so no worker inherits the watcher's threads
+    def on_change(paths):
+        site.invalidate_renders(paths)
+        shared.publish('change', paths)
+
+    watcher = FileWatcher(site.SITE_ROOT, on_change, ignore=['tools']).start()
+    shared.publish('watching')
+
+    print("\n" + "=" * 50)
+    print("Website Tester - Pre-fork Preview Server")
+    print("=" * 50)
+    print(f"\nSite: {site.SITE['title']}")
+    print(f"Open your browser to: http://{args.host}:{args.port}")
+    print(f"Workers: {len(workers)}, sharing {shared.path}")
+    print(f"Live reload: watching site files ({watcher.mode})")
+    print("\nPress Ctrl+C to stop")
+    print("=" * 50 + "\n")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            workers.discard(pid)
+            if not stopping:
+                print(f"Worker {pid} exited ({os.waitstatus_to_exitcode(status)}); starting a replacement")
+                workers.add(spawn(listener, replay))
+    finally:
+        watcher.stop()
+        listener.close()
+        shared.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Route table - maps every URL under the site root to the file that serves it
+Built once by walking the site and then kept up to date from file change
+notifications, so resolving a request (or rejecting it as a 404) is a dict
+lookup instead of probing the filesystem for candidate files
+"""
+
+import os
+import threading
+from pathlib import Path
+
+PAGE_SUFFIXES = ('.md', '.html')
+
+# Lower wins when several files claim the same URL: an explicit permalink,
+# then blog/index.md, blog/index.html, blog.md, blog.html
+PERMALINK_RANK = -1
+PAGE_RANKS = {('index', '.md'): 0, ('index', '.html'): 1, '.md': 2, '.html': 3}
+
+
+def skipped(name, excluded):
+    """True for names the site leaves out: _folders, dotfiles and the config's exclude list"""
+    return name.startswith(('_', '.')) or name in excluded
+
+
+class Route:
+    __slots__ = ('kind', 'source', 'content_type', 'rank')
+
+    def __init__(self, kind, source, content_type=None, rank=0):
+        self.kind = kind                  # 'page' (rendered) or 'file' (sent as-is)
+        self.source = source
+        self.content_type = content_type
+        self.rank = rank
+
+
+class RouteTable:
+    """URL (without leading/trailing slashes) -> Route
+
+    Outside a watched server the table re-checks its folders' mtimes on each
+    lookup (adding, removing or renaming a file changes its folder's mtime)
+    and rebuilds itself when one changed. Once `watched` is set it trusts
+    update() to be called with every changed path instead.
+    """
+
+    def __init__(self, root, file_types, permalink=None):
+        self.root = Path(root)
+        self.file_types = file_types      # suffix -> content type of files served directly
+        self.permalink = permalink        # permalink(path) -> a page's permalink front matter, or None
+        self.excluded = set()
+        self.watched = False
+        self._lock = threading.Lock()
+        self._candidates = {}   # key -> {source: Route}
+        self._keys = {}         # source -> keys it claims
+        self._routes = {}       # key -> winning Route
+        self._dirs = {}         # folder -> mtime_ns when it was walked
+
+    def __len__(self):
+        return len(self._routes)
+
+    def rebuild(self, excluded=()):
+        """Walk the whole site again"""
+        with self._lock:
+            self.excluded = set(excluded)
+            self._candidates = {}
+            self._keys = {}
+            self._dirs = {}
+            self._walk(self.root)
+            self._routes = {key: self._winner(key) for key in self._candidates}
+
+    def update(self, paths):
+        """Apply a batch of added, modified, removed or renamed files and folders"""
+        with self._lock:
+            touched = set()
+            for path in paths:
+                path = Path(path)
+                if not self._included(path):
+                    continue
+                # A removed or renamed folder takes every route below it along
+                for source in [s for s in self._keys if s == path or path in s.parents]:
+                    touched.update(self._remove(source))
+                if path.is_dir():
+                    touched.update(self._walk(path))
+                elif path.is_file():
+                    touched.update(self._add(path))
+
+            for key in touched:
+                winner = self._winner(key)
+                if winner is None:
+                    self._routes.pop(key, None)
+                else:
+                    self._routes[key] = winner
+
+    def resolve(self, path):
+        """Route for a request path, or None"""
+        if not self.watched and self._stale():
+            self.rebuild(self.excluded)
+        return self._routes.get(path.strip('/'))
+
+    # --- Internals ---
+
+    def _stale(self):
+        for folder, mtime in self._dirs.items():
+            try:
+                if os.stat(folder).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _included(self, path):
+        try:
+            relative = path.relative_to(self.root)
+        except ValueError:
+            return False
+        return not any(skipped(part, self.excluded) for part in relative.parts)
+
+    def _walk(self, folder):
+        touched = set()
+        for root, dirs, files in os.walk(folder):
+            root = Path(root)
+            try:
+                self._dirs[root] = os.stat(root).st_mtime_ns
+            except OSError:
+                continue
+            dirs[:] = [d for d in dirs if not skipped(d, self.excluded)]
+            for name in files:
+                if not skipped(name, self.excluded):
+                    touched.update(self._add(root / name))
+        return touched
+
+    def _routes_for(self, path):
+        """(key, Route) pairs a file answers for"""
+        relative = path.relative_to(self.root)
+        suffix = path.suffix.lower()
+        if suffix in PAGE_SUFFIXES:
+            stem = relative.with_suffix('').as_posix()
+            if path.stem == 'index':
+                parent = relative.parent.as_posix()
+                yield ('' if parent == '.' else parent), Route('page', path, rank=PAGE_RANKS[('index', suffix)])
+            else:
+                rank = PAGE_RANKS[suffix]
+                yield stem, Route('page', path, rank=rank)
+                yield stem + '.html', Route('page', path, rank=rank)
+            permalink = self.permalink(path) if self.permalink else None
+            if permalink:
+                yield str(permalink).strip('/'), Route('page', path, rank=PERMALINK_RANK)
+        elif suffix in self.file_types:
+            yield relative.as_posix(), Route('file', path, self.file_types[suffix])
+
+    def _add(self, path):
+        keys = set()
+        for key, route in self._routes_for(path):
+            self._candidates.setdefault(key, {})[path] = route
+            keys.add(key)
+        if keys:
+            self._keys[path] = keys
+        return keys
+
+    def _remove(self, source):
+        keys = self._keys.pop(source, set())
+        for key in keys:
+            candidates = self._candidates.get(key)
+            if candidates is not None:
+                candidates.pop(source, None)
+                if not candidates:
+                    del self._candidates[key]
+        return keys
+
+    def _winner(self, key):
+        candidates = self._candidates.get(key)
+        if not candidates:
+            return None
+        return min(candidates.values(), key=lambda route: (route.rank, str(route.source)))
@@ -0,0 +1,203 @@
+"""
+Shared cache for pre-fork workers - rendered pages and post metadata held once for every process
+A SQLite database in shared memory (/dev/shm where there is one, otherwise
+tools/.cache) read through mmap, so a page rendered by one worker is a cache
+hit for all of them and memory doesn't grow with the worker count. The
+parent's file watcher drops stale entries here and appends the changed paths
+to an event log; a counter in an anonymous shared mapping tells workers there
+is something new to replay into their routes, post indexes and live reload
+"""
+
+import json
+import mmap
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+from contextlib import contextmanager
+
+MMAP_SIZE = 256 * 1024 * 1024   # Bytes of the database mapped into each process
+BUSY_TIMEOUT_MS = 5000
+SOURCE_PREFIX = 'source:'       # Marks named-source dependencies among the file paths
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (ns TEXT, key TEXT, entry BLOB, PRIMARY KEY (ns, key));
+CREATE TABLE IF NOT EXISTS page_deps (ns TEXT, key TEXT, dep TEXT);
+CREATE INDEX IF NOT EXISTS page_deps_dep ON page_deps (dep);
+CREATE INDEX IF NOT EXISTS page_deps_key ON page_deps (ns, key);
+CREATE TABLE IF NOT EXISTS items (section TEXT, key TEXT, value BLOB, PRIMARY KEY (section, key));
+CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, paths TEXT);
+'''
+
+
+def default_directory(fallback):
+    """/dev/shm (memory-backed) where available, otherwise fallback"""
+    return '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else fallback
+
+
+class SharedCache:
+    """One database shared by the processes forked after it is created"""
+
+    def __init__(self, path):
+        self.path = path
+        self.owner = os.getpid()
+        self._pid = None
+        self._pool = []
+        # Event counter in memory shared with forked children; 8 bytes, read without locking
+        self._counter = mmap.mmap(-1, 8)
+        self._publish_lock = threading.Lock()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+        with self._db() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        """A connection from this process's pool (request threads come and go; connections are kept)"""
+        if self._pid != os.getpid():
+            # Connections are never carried across a fork
+            self._pool = []
+            self._pid = os.getpid()
+        try:
+            db = self._pool.pop()
+        except IndexError:
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+            db.execute('PRAGMA synchronous=OFF')
+        try:
+            yield db
+        finally:
+            self._pool.append(db)
+
+    def pages(self, namespace='pages'):
+        """Store for a RenderCache"""
+        return SharedPages(self, namespace)
+
+    def section(self, name):
+        """Store with the warm cache section interface (get/put/pop/keys), e.g. for a PostIndex"""
+        return SharedSection(self, name)
+
+    # --- Change events ---
+
+    @property
+    def generation(self):
+        return struct.unpack('q', self._counter[:8])[0]
+
+    def publish(self, kind, paths=()):
+        """Record an event for the workers to replay: 'change' with the changed paths, or 'watching'"""
+        with self._publish_lock, self._db() as db:
+            db.execute('INSERT INTO events (kind, paths) VALUES (?, ?)', (kind, json.dumps([str(p) for p in paths])))
+            self._counter[:8] = struct.pack('q', self.generation + 1)
+
+    def events_since(self, seq):
+        """[(seq, kind, [paths])] published after seq"""
+        with self._db() as db:
+            rows = db.execute('SELECT seq, kind, paths FROM events WHERE seq > ? ORDER BY seq', (seq,)).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def remove(self):
+        """Delete the database (by the process that created it, on shutdown)"""
+        if os.getpid() != self.owner:
+            return
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
+
+
+class SharedPages:
+    """RenderCache entries by key, with their dependencies indexed for invalidation"""
+
+    def __init__(self, cache, namespace):
+        self.cache = cache
+        self.namespace = namespace
+
+    def __len__(self):
+        with self.cache._db() as db:
+            return db.execute('SELECT COUNT(*) FROM pages WHERE ns = ?', (self.namespace,)).fetchone()[0]
+
+    def get(self, key):
+        with self.cache._db() as db:
+            row = db.execute('SELECT entry FROM pages WHERE ns = ? AND key = ?', (self.namespace, key)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, key, entry):
+        deps = list(entry.files) + [SOURCE_PREFIX + name for name in entry.sources]
+        blob = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.cache._db() as db, db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('DELETE FROM page_deps WHERE ns = ? AND key = ?', (self.namespace, key))
+            db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)', (self.namespace, key, blob))
+            db.executemany('INSERT INTO page_deps VALUES (?, ?, ?)', [(self.namespace, key, dep) for dep in deps])
+
+    def _drop_by_deps(self, deps):
+        deps = list(deps)
+        with self.cache._db() as db, db:
+            db.execute('BEGIN IMMEDIATE')
+            keys = set()
+            for i in range(0, len(deps), 500):
+                chunk = deps[i:i + 500]
+                keys.update(row[0] for row in db.execute(
+                    f'SELECT DISTINCT key FROM page_deps WHERE ns = ? AND dep IN ({",".join("?" * len(chunk))})',
+                    [self.namespace] + chunk))
+            for key in keys:
+                db.execute('DELETE FROM pages WHERE ns = ? AND key = ?', (self.namespace, key))
+                db.execute('DELETE FROM page_deps WHERE ns = ? AND key = ?', (self.namespace, key))
+        return len(keys)
+
+    def invalidate_files(self, paths):
+        return self._drop_by_deps(paths)
+
+    def invalidate_source(self, name):
+        return self._drop_by_deps([SOURCE_PREFIX + name])
+
+    def invalidate(self, key=None):
+        with self.cache._db() as db, db:
+            db.execute('BEGIN IMMEDIATE')
+            if key is None:
+                db.execute('DELETE FROM pages WHERE ns = ?', (self.namespace,))
+                db.execute('DELETE FROM page_deps WHERE ns = ?', (self.namespace,))
+            else:
+                db.execute('DELETE FROM pages WHERE ns = ? AND key = ?', (self.namespace, key))
+                db.execute('DELETE FROM page_deps WHERE ns = ? AND key = ?', (self.namespace, key))
+
+
+class SharedSection:
+    """Pickled values by key in one named section"""
+
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.name = name
+
+    def get(self, key, default=None):
+        with self.cache._db() as db:
+            row = db.execute('SELECT value FROM items WHERE section = ? AND key = ?', (self.name, key)).fetchone()
+        return pickle.loads(row[0]) if row else default
+
+    def put(self, key, value):
+        with self.cache._db() as db:
+            db.execute('INSERT OR REPLACE INTO items VALUES (?, ?, ?)',
+                       (self.name, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def pop(self, key):
+        with self.cache._db() as db:
+            db.execute('DELETE FROM items WHERE section = ? AND key = ?', (self.name, key))
+
+    def keys(self):
+        with self.cache._db() as db:
+            return [row[0] for row in db.execute('SELECT key FROM items WHERE section = ?', (self.name,))]
+
+    def seed(self, items):
+        """Bulk-load (key, value) pairs, e.g. from the warm cache"""
+        with self.cache._db() as db, db:
+            db.execute('BEGIN IMMEDIATE')
+            db.executemany('INSERT OR REPLACE INTO items VALUES (?, ?, ?)',
+                           [(self.name, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+                            for key, value in items if value is not None])
@@ -0,0 +1,148 @@
+"""
+Static file delivery for the site preview
+Compressible files (CSS, SVG, XML, ...) get gzip and Brotli variants, built
+once per file version and rebuilt when the file's mtime or size changes.
+Every file carries an ETag, Last-Modified and Cache-Control, so repeat loads
+are answered with 304 Not Modified; uncompressed files also serve byte ranges
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from email.utils import formatdate
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/css', 'text/plain', 'text/xml', 'text/javascript', 'application/javascript',
+    'application/json', 'application/xml', 'application/atom+xml', 'application/rss+xml', 'image/svg+xml',
+}
+MIN_COMPRESS_SIZE = 256           # Smaller files aren't worth the extra header
+MAX_COMPRESS_SIZE = 8 * 1024 * 1024
+
+# Preview files change all the time: browsers may keep a copy but must revalidate it,
+# which costs a 304 with no body while the file is unchanged
+CACHE_CONTROL = 'no-cache'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def accepted_encodings(header):
+    """Content codings a client accepts (q > 0) from its Accept-Encoding header"""
+    accepted = set()
+    rejected = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                pass
+        (accepted if q > 0 else rejected).add(coding)
+    if '*' in accepted:
+        accepted |= {'br', 'gzip'} - rejected
+    return accepted
+
+
+def byte_range(header, size):
+    """Parse a single-range Range header into (start, end) inclusive
+
+    Returns None when the header is absent or not a single byte range
+    (the whole file is sent), and False when the range can't be satisfied.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class StaticFile:
+    """One version of a file on disk, with lazily built compressed variants"""
+
+    def __init__(self, path, stat, content_type):
+        self.path = path
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.etag = hashlib.sha1(f'{path}-{stat.st_mtime_ns}-{stat.st_size}'.encode()).hexdigest()[:20]
+        self.content_type = content_type
+        self.compressible = (content_type in COMPRESSIBLE_TYPES
+                             and MIN_COMPRESS_SIZE <= stat.st_size <= MAX_COMPRESS_SIZE)
+        self.variants = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding):
+        """Compressed body for 'br' or 'gzip' (built on first use), or None if it wouldn't be smaller"""
+        if encoding in self.variants:
+            return self.variants[encoding]
+        with self._lock:
+            if encoding not in self.variants:
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+                if encoding == 'br':
+                    body = brotli.compress(data, mode=brotli.MODE_TEXT)
+                else:
+                    body = gzip.compress(data, compresslevel=9, mtime=0)
+                self.variants[encoding] = body if len(body) < len(data) else None
+        return self.variants[encoding]
+
+
+class StaticFiles:
+    """Path -> StaticFile, re-created whenever the file's signature changes"""
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, content_type=None):
+        """Current StaticFile for path, or None if it isn't a regular file"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        static = self._files.get(path)
+        if static is None or static.signature != (stat.st_mtime_ns, stat.st_size):
+            content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            static = StaticFile(path, stat, content_type)
+            with self._lock:
+                self._files[path] = static
+        return static
+
+    def negotiate(self, static, accept_encoding):
+        """Pick the representation to send: (encoding, body), or (None, None) for the file itself"""
+        if not static.compressible:
+            return None, None
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and (encoding != 'br' or brotli is not None):
+                body = static.variant(encoding)
+                if body is not None:
+                    return encoding, body
+        return None, None
@@ -0,0 +1,211 @@
+"""
+Request and pipeline-stage timing for the site preview
+Stage timers accumulate per request (reported in a Server-Timing header) and
+feed rolling latency histograms, alongside per-route request counts. Recording
+is a couple of perf_counter() calls and a bucket increment, so it stays on
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is open-ended)
+BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+class RollingHistogram:
+    """Latency histogram over the last `window` seconds, kept as `slots` time slices
+
+    Each slice is reset when its turn comes round again, so old samples age
+    out without storing them individually.
+    """
+
+    def __init__(self, window=300, slots=10):
+        self.window = window
+        self.slots = slots
+        self.slot_seconds = window / slots
+        self._lock = threading.Lock()
+        self._slices = [self._empty(-1) for _ in range(slots)]
+
+    @staticmethod
+    def _empty(epoch):
+        return {'epoch': epoch, 'counts': [0] * (len(BUCKETS_MS) + 1), 'count': 0, 'sum': 0.0, 'max': 0.0}
+
+    def record(self, ms, now=None):
+        epoch = int((time.monotonic() if now is None else now) // self.slot_seconds)
+        bucket = bisect.bisect_left(BUCKETS_MS, ms)
+        with self._lock:
+            slice_ = self._slices[epoch % self.slots]
+            if slice_['epoch'] != epoch:
+                slice_ = self._slices[epoch % self.slots] = self._empty(epoch)
+            slice_['counts'][bucket] += 1
+            slice_['count'] += 1
+            slice_['sum'] += ms
+            if ms > slice_['max']:
+                slice_['max'] = ms
+
+    def snapshot(self, now=None):
+        """Merged view of the live slices: count, mean, percentiles (bucket upper bounds), max, buckets"""
+        oldest = int((time.monotonic() if now is None else now) // self.slot_seconds) - self.slots + 1
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        count = 0
+        total = 0.0
+        maximum = 0.0
+        with self._lock:
+            for slice_ in self._slices:
+                if slice_['epoch'] < oldest:
+                    continue
+                for i, n in enumerate(slice_['counts']):
+                    counts[i] += n
+                count += slice_['count']
+                total += slice_['sum']
+                maximum = max(maximum, slice_['max'])
+
+        def percentile(p):
+            if not count:
+                return None
+            target = p * count
+            seen = 0
+            for i, n in enumerate(counts):
+                seen += n
+                if seen >= target:
+                    return BUCKETS_MS[i] if i < len(BUCKETS_MS) else round(maximum, 3)
+
+        labels = [f'<={bound}' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}']
+        return {
+            'count': count,
+            'mean_ms': round(total / count, 3) if count else None,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(maximum, 3),
+            'buckets': [[label, n] for label, n in zip(labels, counts) if n],
+        }
+
+
+class Stats:
+    """Stage timers, per-route counters and rolling histograms for one app"""
+
+    def __init__(self, window=300):
+        self.window = window
+        self.started = time.time()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._routes = {}
+
+    def _histogram(self, table, name):
+        histogram = table.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(name, RollingHistogram(self.window))
+        return histogram
+
+    # --- Per request ---
+
+    def begin_request(self):
+        self._local.timings = {}
+        self._local.active = set()
+        self._local.started = time.perf_counter()
+
+    def end_request(self, route, status):
+        """Record the finished request; returns its (total ms, {stage: [ms, calls]})"""
+        started = getattr(self._local, 'started', None)
+        if started is None:
+            return None, {}
+        total = (time.perf_counter() - started) * 1000
+        timings = self._local.timings
+        self._local.started = None
+
+        with self._lock:
+            route_stats = self._routes.get(route)
+            if route_stats is None:
+                route_stats = self._routes[route] = {'count': 0, 'statuses': {}, 'latency': RollingHistogram(self.window)}
+            route_stats['count'] += 1
+            status = str(status)
+            route_stats['statuses'][status] = route_stats['statuses'].get(status, 0) + 1
+        route_stats['latency'].record(total)
+        return total, timings
+
+    def _record(self, name, ms):
+        self._histogram(self._stages, name).record(ms)
+        timings = getattr(self._local, 'timings', None)
+        if timings is not None and getattr(self._local, 'started', None) is not None:
+            entry = timings.get(name)
+            if entry is None:
+                timings[name] = [ms, 1]
+            else:
+                entry[0] += ms
+                entry[1] += 1
+
+    def _active(self):
+        active = getattr(self._local, 'active', None)
+        if active is None:
+            active = self._local.active = set()
+        return active
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage; re-entrant calls of the same stage are counted once"""
+        active = self._active()
+        if name in active:
+            yield
+            return
+        active.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            active.discard(name)
+            self._record(name, (time.perf_counter() - started) * 1000)
+
+    def timed(self, name):
+        """Decorator form of stage() (without the context manager overhead on hot functions)"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                active = self._active()
+                if name in active:
+                    return fn(*args, **kwargs)
+                active.add(name)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    active.discard(name)
+                    self._record(name, (time.perf_counter() - started) * 1000)
+            return wrapper
+        return decorator
+
+    # --- Reporting ---
+
+    def snapshot(self):
+        with self._lock:
+            routes = dict(self._routes)
+            stages = dict(self._stages)
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'window_seconds': self.window,
+            'routes': {
+                route: {'count': data['count'], 'statuses': dict(data['statuses']), 'latency': data['latency'].snapshot()}
+                for route, data in sorted(routes.items())
+            },
+            'stages': {name: histogram.snapshot() for name, histogram in sorted(stages.items())},
+        }
+
+
+def server_timing(total, timings):
+    """Format a Server-Timing header value: one metric per stage plus the request total"""
+    metrics = [
+        f'{name};dur={ms:.2f};desc="{calls} call{"s" if calls != 1 else ""}"'
+        for name, (ms, calls) in timings.items()
+    ]
+    metrics.append(f'total;dur={total:.2f}')
+    return ', '.join(metrics)
+
+
+def hit_rate(hits, misses):
+    lookups = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / lookups, 3) if lookups else None}
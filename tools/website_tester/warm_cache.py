@@ -0,0 +1,158 @@
+"""
+Warm start cache - parsed config, post front matter, template sources and rendered Markdown on disk
+Each section is a pickled dict in tools/.cache, loaded the first time it is
+used and tagged with a version (the cache format plus the code that produced
+it), so a new process picks up where the last one stopped instead of
+re-parsing the site. Entries are validated by their users against source
+mtimes and content hashes; changed sections are written back in the
+background shortly after they change, and on exit
+"""
+
+import atexit
+import os
+import pickle
+import threading
+
+CACHE_VERSION = 1
+SAVE_DELAY = 2.0   # Seconds after the last change before dirty sections are written
+
+
+def code_version(*modules):
+    """Version tag for data produced by these modules: changes whenever one of their files does"""
+    parts = []
+    for module in modules:
+        try:
+            stat = os.stat(module.__file__)
+            parts.append((os.path.basename(module.__file__), stat.st_mtime_ns, stat.st_size))
+        except (AttributeError, OSError):
+            parts.append((getattr(module, '__name__', str(module)), None, None))
+    return repr(parts)
+
+
+class CacheSection:
+    """A dict persisted as one file, loaded on first access"""
+
+    def __init__(self, cache, name, version, limit=None):
+        self.cache = cache
+        self.name = name
+        self.version = version
+        self.limit = limit             # Oldest entries are dropped beyond this many
+        self.path = os.path.join(cache.directory, f'{name}.pickle')
+        self._data = None
+        self._lock = threading.Lock()
+        self.dirty = False
+
+    def _load(self):
+        data = {}
+        try:
+            with open(self.path, 'rb') as f:
+                stored = pickle.load(f)
+            if stored.get('version') == (CACHE_VERSION, self.version):
+                data = stored['data']
+        except Exception:
+            # Missing, truncated or written by incompatible code: start empty
+            pass
+        return data
+
+    @property
+    def data(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._load()
+        return self._data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def put(self, key, value):
+        data = self.data
+        with self._lock:
+            data[key] = value
+            if self.limit is not None and len(data) > self.limit:
+                for old in list(data)[:len(data) - self.limit]:
+                    data.pop(old, None)
+            self.dirty = True
+        self.cache.save_soon()
+
+    def pop(self, key):
+        data = self.data
+        with self._lock:
+            if data.pop(key, None) is None:
+                return
+            self.dirty = True
+        self.cache.save_soon()
+
+    def keys(self):
+        data = self.data
+        with self._lock:
+            return list(data)
+
+    def save(self):
+        # The copy is taken under the lock, so writers can't change the dict while it's made
+        with self._lock:
+            if not self.dirty or self._data is None:
+                return
+            snapshot = dict(self._data)
+            self.dirty = False
+        try:
+            payload = pickle.dumps({'version': (CACHE_VERSION, self.version), 'data': snapshot},
+                                   protocol=pickle.HIGHEST_PROTOCOL)
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            self.dirty = True   # Still unsaved: the next save tries again
+            raise
+
+
+class WarmCache:
+    """Named sections in one directory, saved together"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._sections = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.save)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """A forked worker gets no copy of the parent's save timer thread; start its own when needed"""
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._timer = None
+        for section in self._sections.values():
+            section._lock = threading.Lock()
+
+    def section(self, name, version='', limit=None):
+        section = self._sections.get(name)
+        if section is None:
+            section = self._sections[name] = CacheSection(self, name, version, limit)
+        return section
+
+    def save_soon(self):
+        """Write dirty sections from a background thread after SAVE_DELAY"""
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(SAVE_DELAY, self._save_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _save_from_timer(self):
+        with self._lock:
+            self._timer = None
+        self.save()
+
+    def save(self):
+        with self._save_lock:
+            for section in list(self._sections.values()):
+                try:
+                    section.save()
+                except Exception as e:
+                    # Logged rather than raised, so the saver thread lives on for the next change
+                    print(f"Could not write the {section.name} cache: {e}")
@@ -0,0 +1,128 @@
+"""
+Site file watcher - reports batches of changed paths under the site root
+Uses watchdog when it is installed and falls back to polling file signatures,
+every second or so and less often while nothing changes
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Never watched, wherever they appear; nor is anything whose name starts with a dot
+# (.git, .partial uploads, editor and cache folders)
+IGNORED_DIRS = {'__pycache__', 'node_modules', 'venv', '_site'}
+
+# Polling mode: seconds between scans, growing while nothing changes
+POLL_INTERVAL = 1.0
+POLL_MAX_INTERVAL = 3.0
+POLL_BACKOFF = 1.5
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory and event.event_type == 'modified':
+            return
+        self.watcher.add(event.src_path)
+        dest = getattr(event, 'dest_path', None)
+        if dest:
+            self.watcher.add(dest)
+
+
+class FileWatcher:
+    """Watch a directory tree and call on_change(set_of_paths) from a background thread
+
+    Changes are batched: the callback runs once per `interval` with every
+    path that changed since the last call. Without watchdog the tree is
+    scanned every POLL_INTERVAL seconds, backing off to POLL_MAX_INTERVAL.
+    """
+
+    def __init__(self, root, on_change, ignore=(), interval=0.2):
+        self.root = Path(root).resolve()
+        self.on_change = on_change
+        self.ignore = {(self.root / p).resolve() for p in ignore}
+        self.interval = interval
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._signatures = {}
+        self.mode = 'watchdog' if Observer is not None else 'polling'
+
+    def is_ignored(self, path):
+        path = Path(path)
+        try:
+            parts = path.relative_to(self.root).parts
+        except ValueError:
+            parts = path.parts
+        if any(part in IGNORED_DIRS or part.startswith('.') for part in parts):
+            return True
+        return any(path == ignored or ignored in path.parents for ignored in self.ignore)
+
+    def add(self, path):
+        if not self.is_ignored(path):
+            with self._lock:
+                self._pending.add(Path(path))
+
+    def start(self):
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), str(self.root), recursive=True)
+            self._observer.start()
+        else:
+            self._signatures = self._scan()
+        thread = threading.Thread(target=self._run, name='site-watcher', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    def _scan(self):
+        """Signature of every watched file (polling mode)"""
+        signatures = {}
+        for root, dirs, files in os.walk(self.root):
+            root = Path(root)
+            dirs[:] = [d for d in dirs if not self.is_ignored(root / d)]
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                path = root / name
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                signatures[path] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def _run(self):
+        delay = self.interval if self._observer is not None else POLL_INTERVAL
+        while not self._stop.wait(delay):
+            if self._observer is None:
+                current = self._scan()
+                changed = {p for p in current.keys() | self._signatures.keys()
+                           if current.get(p) != self._signatures.get(p)}
+                self._signatures = current
+                with self._lock:
+                    self._pending |= changed
+                delay = POLL_INTERVAL if changed else min(delay * POLL_BACKOFF, POLL_MAX_INTERVAL)
+
+            with self._lock:
+                batch, self._pending = self._pending, set()
+            if batch:
+                try:
+                    self.on_change(batch)
+                except Exception as e:
+                    print(f"Watcher callback failed: {e}")